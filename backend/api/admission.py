@@ -0,0 +1,177 @@
+"""Admission control for upload requests.
+
+At most ADMISSION_MAX_UPLOADS uploads are handled at once per server
+process, and together they may not exceed ADMISSION_MAX_BYTES of
+Content-Length, which stands in for the memory they need (a single upload
+bigger than the budget is still admitted once nothing else is running).
+Uploads that do not fit wait, first come first served, in a queue of
+ADMISSION_QUEUE_SIZE for up to ADMISSION_QUEUE_SECONDS; when the queue
+is full or the wait runs out the request is refused with 429 and a
+Retry-After estimated from how long recent uploads held their slot.
+
+Time spent waiting is the "admission" stage; active, waiting and
+reserved bytes are gauges in instrument's REGISTRY (/api/metrics/).
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.exceptions import Throttled
+
+from . import instrument
+
+
+class Rejected(Throttled):
+    default_detail = "The server is busy with other uploads."
+    default_code = "busy"
+
+
+class AdmissionController:
+    def __init__(self, max_active, max_bytes, queue_size, queue_seconds):
+        self.max_active = max_active
+        self.max_bytes = max_bytes
+        self.queue_size = queue_size
+        self.queue_seconds = queue_seconds
+        self.active = 0
+        self.reserved = 0
+        self._waiters = deque()
+        self._cond = threading.Condition()
+        # moving average of how long an admitted upload runs
+        self._hold_seconds = 1.0
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def _fits(self, cost):
+        if self.active >= self.max_active:
+            return False
+        return self.active == 0 or self.reserved + cost <= self.max_bytes
+
+    def retry_after(self):
+        """Seconds until a refused client could reasonably try again."""
+        rounds = (self.waiting + self.active) / max(self.max_active, 1)
+        return min(300, max(1, math.ceil(self._hold_seconds * rounds)))
+
+    def acquire(self, cost):
+        """Reserve a slot for an upload of `cost` bytes, waiting if needed;
+        raises Rejected. Returns the reserved cost for release()."""
+        cost = min(cost, self.max_bytes)
+        started = time.monotonic()
+        with self._cond:
+            if self._waiters or not self._fits(cost):
+                if self.waiting >= self.queue_size:
+                    self._reject("queue_full")
+                me = object()
+                self._waiters.append(me)
+                try:
+                    admitted = self._cond.wait_for(
+                        lambda: self._waiters[0] is me and self._fits(cost), timeout=self.queue_seconds
+                    )
+                finally:
+                    self._waiters.remove(me)
+                    # the next in line may fit now
+                    self._cond.notify_all()
+                if not admitted:
+                    self._reject("timeout")
+            self.active += 1
+            self.reserved += cost
+        instrument.record("admission", time.monotonic() - started)
+        return cost
+
+    def release(self, cost, held):
+        with self._cond:
+            self.active -= 1
+            self.reserved -= cost
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held
+            self._cond.notify_all()
+
+    def _reject(self, reason):
+        instrument.REGISTRY.inc("admission_rejected_total", {"reason": reason})
+        raise Rejected(wait=self.retry_after())
+
+    @contextmanager
+    def admit(self, cost):
+        cost = self.acquire(cost)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(cost, time.monotonic() - started)
+
+    @asynccontextmanager
+    async def aadmit(self, cost):
+        # waiting blocks, so it happens on a thread instead of the event loop
+        waiter = asyncio.ensure_future(asyncio.to_thread(self.acquire, cost))
+        try:
+            cost = await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # the client went away; give back the slot if it comes through
+            waiter.add_done_callback(lambda w: w.cancelled() or w.exception() or self.release(w.result(), 0))
+            raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(cost, time.monotonic() - started)
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+@receiver(setting_changed)
+def _settings_changed(setting, **kwargs):
+    global _controller
+    if setting.startswith("ADMISSION_"):
+        _controller = None
+
+
+def controller():
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController(
+                settings.ADMISSION_MAX_UPLOADS,
+                settings.ADMISSION_MAX_BYTES,
+                settings.ADMISSION_QUEUE_SIZE,
+                settings.ADMISSION_QUEUE_SECONDS,
+            )
+    return _controller
+
+
+def request_cost(request):
+    try:
+        return max(0, int(request.headers.get("Content-Length") or 0))
+    except ValueError:
+        return 0
+
+
+def admit(request):
+    """Context manager holding an upload slot for `request`."""
+    return controller().admit(request_cost(request))
+
+
+def aadmit(request):
+    return controller().aadmit(request_cost(request))
+
+
+def _gauge(attribute):
+    def read():
+        return getattr(_controller, attribute) if _controller else 0
+    return read
+
+
+instrument.REGISTRY.describe("admission_active", "Uploads being handled.")
+instrument.REGISTRY.describe("admission_waiting", "Uploads waiting for a slot.")
+instrument.REGISTRY.describe("admission_reserved_bytes", "Content-Length of the uploads being handled.")
+instrument.REGISTRY.describe("admission_rejected_total", "Uploads refused with 429.")
+instrument.REGISTRY.gauge("admission_active", _gauge("active"))
+instrument.REGISTRY.gauge("admission_waiting", _gauge("waiting"))
+instrument.REGISTRY.gauge("admission_reserved_bytes", _gauge("reserved"))
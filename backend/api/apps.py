@@ -1,5 +1,31 @@
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def start_background_tasks():
+    """Run the ingest workers and the retention scheduler in this process.
+
+    Called by the WSGI and ASGI entrypoints, so only processes that serve
+    requests run them; management commands, scripts and benchmarks that
+    merely set Django up do not. BACKGROUND_TASKS=0 turns it off, leaving
+    queued jobs and retention to `manage.py ingest_worker`.
+    """
+    from . import jobs, retention
+
+    if not settings.BACKGROUND_TASKS:
+        return
+    # queued jobs left by a previous run are picked up without waiting
+    # for the next upload
+    if settings.INGEST_WORKERS:
+        jobs.start_workers(settings.INGEST_WORKERS)
+    # every insert path (queued, deduplicated, batch) is covered, with or
+    # without in-process workers
+    retention.start_scheduler()
 
 
 class ApiConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import caching, db, storage  # noqa: F401  (connects signal receivers)
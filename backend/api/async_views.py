@@ -0,0 +1,170 @@
+"""Native async versions of the upload, history and report endpoints.
+
+With ASYNC_VIEWS on, api/urls.py routes those paths here. Run the
+app under an ASGI server (`uvicorn backend.asgi:application`) to benefit:
+the request body is received by the event loop, database access uses the
+async ORM, and multipart parsing, spooling, header checks and ReportLab
+rendering run on a bounded thread pool (ASYNC_CPU_WORKERS), so a slow
+upload no longer holds a worker while dashboards poll /api/history/.
+Ingestion itself (pandas) still happens in the job queue, as with the
+sync views.
+
+Responses match the DRF views in api/views.py.
+"""
+import asyncio
+import contextvars
+import functools
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import (
+    APIException,
+    MethodNotAllowed,
+    NotAuthenticated,
+    NotFound,
+    ValidationError,
+)
+
+from . import admission, caching, dedup, instrument, jobs, reports, schema, views
+from .http import authenticate
+from .models import UploadHistory
+from .serializers import HistoryQuerySerializer, UploadCSVSerializer
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.ASYNC_CPU_WORKERS, thread_name_prefix="async-cpu")
+    return _executor
+
+
+async def run_blocking(fn, *args):
+    """Run fn(*args) on the bounded executor in a copy of the caller's
+    context, so its spans belong to the request. fn must not use the ORM."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor(), context.run, fn, *args)
+
+
+def _error(exc):
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {"detail": exc.detail}
+    resp = JsonResponse(data, status=exc.status_code, safe=False)
+    if isinstance(exc, NotAuthenticated) or exc.status_code == 401:
+        resp["WWW-Authenticate"] = 'Bearer realm="api"'
+    if getattr(exc, "wait", None):
+        resp["Retry-After"] = str(math.ceil(exc.wait))
+    return resp
+
+
+def async_api_view(methods):
+    """The async counterpart of @api_view + IsAuthenticated: method check,
+    JWT authentication and DRF-style JSON errors."""
+
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise MethodNotAllowed(request.method)
+                user = await sync_to_async(authenticate)(request)
+                if user is None:
+                    raise NotAuthenticated()
+                request.user = user
+                try:
+                    return await view(request, *args, **kwargs)
+                except Http404:
+                    raise NotFound()
+            except APIException as e:
+                return _error(e)
+
+        return wrapper
+
+    return decorator
+
+
+def _validated(serializer_class, data):
+    s = serializer_class(data=data)
+    s.is_valid(raise_exception=True)
+    return s.validated_data
+
+
+@async_api_view(["POST"])
+async def upload_csv(request):
+    async with admission.aadmit(request):
+        with instrument.span("multipart", bytes=int(request.headers.get("Content-Length") or 0)):
+            # reading request.FILES parses the (already received) body
+            f = (await run_blocking(_validated, UploadCSVSerializer, request.FILES))["file"]
+        path, content_hash = await run_blocking(jobs.spool_upload, f)
+        return await _accept_spooled(path, f.name, content_hash)
+
+
+async def _accept_spooled(path, filename, content_hash):
+    with instrument.span("dedup"):
+        upload = await dedup.areuse(content_hash, filename)
+    if upload is not None:
+        os.remove(path)
+        return JsonResponse({"message": "uploaded", "upload_id": upload.id, "duplicate": True}, status=201)
+
+    try:
+        with instrument.span("schema"):
+            await run_blocking(_check_header, path)
+    except schema.SchemaError as e:
+        os.remove(path)
+        raise ValidationError({"file": e.errors})
+
+    with instrument.span("enqueue"):
+        job = await jobs.aenqueue(filename, path, content_hash)
+    return JsonResponse({"message": "queued", "job_id": job.id, "status": job.status}, status=202)
+
+
+def _check_header(path):
+    schema.EQUIPMENT.check(schema.read_header(path))
+
+
+@async_api_view(["GET"])
+async def history_api(request):
+    params = _validated(HistoryQuerySerializer, request.GET)
+    key = views.history_cache_key(await caching.ahistory_token(), params)
+    entry = await cache.aget(key)
+    if entry is None:
+        with instrument.span("query"):
+            rows = [row async for row in views.history_query(params)]
+        entry = views.history_entry(params, rows)
+        await cache.aset(key, entry, settings.HISTORY_CACHE_SECONDS)
+    return views.history_response(request, entry)
+
+
+@async_api_view(["GET"])
+async def report_pdf(request):
+    with instrument.span("query"):
+        last = await UploadHistory.objects.order_by("-uploaded_at", "-id").afirst()
+    return views.serve_report(request, last, await _report(last))
+
+
+@async_api_view(["GET"])
+async def upload_report(request, upload_id):
+    with instrument.span("query"):
+        upload = await UploadHistory.objects.filter(id=upload_id).afirst()
+    if upload is None:
+        raise Http404
+    return views.serve_report(request, upload, await _report(upload))
+
+
+async def _report(upload):
+    path = reports.cached_path(upload)
+    if path is None:
+        # the trend query uses the async ORM; ReportLab runs on the pool
+        trend = await reports.atrend_series(upload) if upload else None
+        path = await run_blocking(reports.render_cached, upload, trend)
+    return path
@@ -0,0 +1,177 @@
+"""Synchronous ingestion of many CSVs sent in one request.
+
+Files (and the members of zip archives) are spooled, checked against the
+schema, summarized side by side on the process pool and recorded with a
+single bulk_create in one transaction.
+"""
+import os
+import shutil
+import zipfile
+
+from django.conf import settings
+from django.db import transaction
+
+from . import caching, dedup, ingest, instrument, jobs, schema, storage
+from .models import UploadHistory
+
+
+class BatchError(Exception):
+    pass
+
+
+def _members(archive):
+    """CSV members of a zip, skipping directories and macOS metadata."""
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+            continue
+        yield name, info
+
+
+class _Limited:
+    """Reads a zip member, failing once more than `limit` bytes come out;
+    the size in the zip header is the sender's claim, not a guarantee."""
+
+    def __init__(self, f, limit, name):
+        self.f = f
+        self.limit = limit
+        self.name = name
+        self.count = 0
+
+    def read(self, n=-1):
+        block = self.f.read(n)
+        self.count += len(block)
+        if self.count > self.limit:
+            raise BatchError(f"{self.name} is larger than it claims or than the uncompressed limit.")
+        return block
+
+
+def spool_files(files):
+    """Spool uploaded files, unpacking zips; returns [(filename, path, sha256)].
+
+    Zip members are held to UPLOAD_BATCH_MAX_MEMBER_BYTES each and
+    UPLOAD_BATCH_MAX_UNZIPPED_BYTES together, since admission control
+    only sees the compressed size.
+    """
+    items = []
+    unzipped = 0
+
+    def add(name, f):
+        if len(items) >= settings.UPLOAD_BATCH_MAX_FILES:
+            raise BatchError(f"A batch may contain at most {settings.UPLOAD_BATCH_MAX_FILES} files.")
+        items.append((name, *jobs.spool_upload(f)))
+
+    try:
+        for f in files:
+            if zipfile.is_zipfile(f):
+                f.seek(0)
+                with zipfile.ZipFile(f) as archive:
+                    for name, info in _members(archive):
+                        if info.file_size > settings.UPLOAD_BATCH_MAX_MEMBER_BYTES:
+                            raise BatchError(f"{name} is larger than {settings.UPLOAD_BATCH_MAX_MEMBER_BYTES} "
+                                             "bytes uncompressed.")
+                        if unzipped + info.file_size > settings.UPLOAD_BATCH_MAX_UNZIPPED_BYTES:
+                            raise BatchError(f"The zip archives hold more than "
+                                             f"{settings.UPLOAD_BATCH_MAX_UNZIPPED_BYTES} bytes uncompressed.")
+                        with archive.open(info) as member:
+                            limited = _Limited(member, info.file_size, name)
+                            add(name, limited)
+                        unzipped += limited.count
+            else:
+                f.seek(0)
+                add(f.name, f)
+    except zipfile.BadZipFile as e:
+        discard(items)
+        raise BatchError(f"Bad zip archive: {e}")
+    except BaseException:
+        discard(items)
+        raise
+    return items
+
+
+def discard(items):
+    for _, path, _ in items:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _failure(e):
+    if isinstance(e, schema.SchemaError):
+        return e.errors
+    return [{"code": "failed", "column": None, "message": f"{type(e).__name__}: {e}"}]
+
+
+def ingest_batch(items, workers=None, remove_files=True):
+    """Ingest spooled `items` and return one result dict per item.
+
+    Each result has "filename" and either "upload_id" (plus "duplicate")
+    or "errors". The files are removed unless `remove_files` is False.
+    """
+    results = [{"filename": name} for name, _, _ in items]
+    rows = [None] * len(items)
+    pending = {}  # sha256 -> indices of items with that content
+
+    try:
+        for i, (name, path, sha256) in enumerate(items):
+            if sha256 in pending:
+                pending[sha256].append(i)
+                continue
+            rows[i] = dedup.lookup(sha256, name)
+            if rows[i] is not None:
+                continue
+            try:
+                schema.EQUIPMENT.check(schema.read_header(path))
+            except schema.SchemaError as e:
+                results[i]["errors"] = e.errors
+                continue
+            pending[sha256] = [i]
+
+        firsts = [indices[0] for indices in pending.values()]
+        tmp_dirs = [
+            storage.new_columns_dir(items[i][2]) if settings.COLUMN_STORE_ENABLED else None
+            for i in firsts
+        ]
+        with instrument.span("parse_parallel", bytes=sum(os.path.getsize(items[i][1]) for i in firsts)):
+            summaries = ingest.summarize_many(
+                [items[i][1] for i in firsts],
+                tmp_dirs,
+                workers=workers or settings.CSV_PARALLEL_WORKERS,
+                chunksize=settings.CSV_CHUNK_ROWS,
+                engine=settings.CSV_ENGINE,
+            )
+
+        parsed = {}
+        for i, tmp, summary in zip(firsts, tmp_dirs, summaries):
+            sha256 = items[i][2]
+            if isinstance(summary, Exception):
+                if tmp:
+                    shutil.rmtree(tmp, ignore_errors=True)
+                for j in pending[sha256]:
+                    results[j]["errors"] = _failure(summary)
+                continue
+            columns_path = storage.publish_columns(tmp, sha256) if tmp else ""
+            summary, state = parsed[sha256] = ingest.split_state(summary)
+            for j in pending[sha256]:
+                rows[j] = UploadHistory(
+                    filename=items[j][0], summary=summary, state=state, content_hash=sha256,
+                    columns_path=columns_path,
+                )
+
+        created = [row for row in rows if row is not None]
+        with instrument.span("insert"), transaction.atomic():
+            UploadHistory.objects.bulk_create(created)
+            for sha256, (summary, state) in parsed.items():
+                dedup.remember(sha256, summary, state)
+        if created:
+            # bulk_create sends no post_save
+            caching.invalidate_history()
+    finally:
+        if remove_files:
+            discard(items)
+
+    parsed_first = set(firsts)
+    for i, row in enumerate(rows):
+        if row is not None:
+            results[i]["upload_id"] = row.id
+            results[i]["duplicate"] = i not in parsed_first
+    return results
@@ -0,0 +1,92 @@
+"""Cached, conditionally-served responses.
+
+Cached history bodies are keyed on a generation token that is replaced
+whenever UploadHistory rows are written or deleted (once per transaction,
+after it commits), so stale entries are never read again and simply
+expire.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import reports
+from .models import UploadHistory
+
+HISTORY_TOKEN_KEY = "history:token"
+
+
+def history_token():
+    token = cache.get(HISTORY_TOKEN_KEY)
+    if token is None:
+        token = uuid.uuid4().hex
+        if not cache.add(HISTORY_TOKEN_KEY, token, None):
+            token = cache.get(HISTORY_TOKEN_KEY, token)
+    return token
+
+
+async def ahistory_token():
+    token = await cache.aget(HISTORY_TOKEN_KEY)
+    if token is None:
+        token = uuid.uuid4().hex
+        if not await cache.aadd(HISTORY_TOKEN_KEY, token, None):
+            token = await cache.aget(HISTORY_TOKEN_KEY, token)
+    return token
+
+
+def _bump_history_token(_calls):
+    cache.set(HISTORY_TOKEN_KEY, uuid.uuid4().hex, None)
+
+
+def _drop_reports(ids):
+    reports.report_cache().discard(tuple(f"report-{i}-" for i in ids))
+
+
+def _on_commit_once(func, value=None):
+    """Run func(values) once the current transaction commits, where values
+    are the `value`s of every call for `func` in that transaction; at once
+    outside a transaction.
+
+    A bulk delete then costs one cache write and one directory scan rather
+    than one per row, and nothing is invalidated before the change is
+    visible to other connections.
+    """
+    conn = transaction.get_connection()
+    if not conn.in_atomic_block:
+        func([value])
+        return
+    # run_on_commit holds this transaction's pending (savepoint ids, callback, robust)
+    for _, callback, _ in conn.run_on_commit:
+        if isinstance(callback, _Collected) and callback.func is func and not callback.ran:
+            callback.values.append(value)
+            return
+    transaction.on_commit(_Collected(func, value))
+
+
+class _Collected:
+    def __init__(self, func, value):
+        self.func = func
+        self.values = [value]
+        self.ran = False
+
+    def __call__(self):
+        self.ran = True
+        self.func(self.values)
+
+
+def invalidate_history():
+    """Replace the history token, once the current transaction commits."""
+    _on_commit_once(_bump_history_token)
+
+
+@receiver(post_save, sender=UploadHistory)
+@receiver(post_delete, sender=UploadHistory)
+def _history_changed(sender, **kwargs):
+    invalidate_history()
+
+
+@receiver(post_delete, sender=UploadHistory)
+def _drop_report(sender, instance, **kwargs):
+    _on_commit_once(_drop_reports, instance.id)
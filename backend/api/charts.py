@@ -0,0 +1,119 @@
+"""Report charts, drawn as ReportLab vector graphics.
+
+A Drawing is a platypus flowable, so charts go into the PDF as vectors
+and need no raster backend. What is expensive is the data behind a
+histogram, a scan of a whole column; its bins are cached on disk
+(CHART_CACHE_DIR) under the name of the column store they came from.
+Stores are content-addressed, so the bins are computed once for every
+upload, and every report, with the same rows.
+"""
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+from django.conf import settings
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.charts.lineplots import LinePlot
+from reportlab.graphics.shapes import Drawing, String
+from reportlab.lib import colors
+
+from . import instrument
+from .diskcache import DiskLRUCache
+
+# Bump when the cached chart data changes shape so it is not reused.
+CHART_VERSION = 1
+
+# drawing size in points
+WIDTH, HEIGHT = 480, 170
+HISTOGRAM_BINS = 30
+BAR_COLOR = colors.HexColor("#4C78A8")
+LINE_COLOR = colors.HexColor("#F58518")
+
+
+def chart_cache():
+    return DiskLRUCache(settings.CHART_CACHE_DIR, settings.CHART_CACHE_MAX_BYTES)
+
+
+def cached_data(key, compute):
+    """JSON-able chart data for `key`, calling compute() on a miss."""
+    cache = chart_cache()
+    key = f"{key}-c{CHART_VERSION}.json"
+    path = cache.get(key)
+    if path is not None:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass  # evicted or half-written; compute it again
+    with instrument.span("chart"):
+        data = compute()
+    cache.put(key, json.dumps(data).encode())
+    return data
+
+
+def histogram_bins(store_name, store, column):
+    """{"counts": [...], "edges": [...]} of a stored column, cached by store."""
+
+    def compute():
+        values = np.asarray(store.column(column), dtype="float64")
+        counts, edges = np.histogram(values[~np.isnan(values)], bins=HISTOGRAM_BINS)
+        return {"counts": counts.tolist(), "edges": edges.tolist()}
+
+    return cached_data(f"hist-{store_name}-{column}", compute)
+
+
+def _frame(title):
+    d = Drawing(WIDTH, HEIGHT)
+    d.add(String(0, HEIGHT - 12, title, fontName="Helvetica-Bold", fontSize=10))
+    return d
+
+
+def histogram(store_name, store, column, unit=None):
+    """Histogram Drawing of a stored column, or None when it has no values."""
+    if store is None or not store.rows:
+        return None
+    bins = histogram_bins(store_name, store, column)
+    if not any(bins["counts"]):
+        return None
+
+    d = _frame(f"{column} distribution" + (f" ({unit})" if unit else ""))
+    chart = VerticalBarChart()
+    chart.x, chart.y = 40, 25
+    chart.width, chart.height = WIDTH - 50, HEIGHT - 50
+    chart.data = [bins["counts"]]
+    chart.bars[0].fillColor = BAR_COLOR
+    chart.bars[0].strokeColor = None
+    chart.barSpacing = 0
+    chart.groupSpacing = 1
+    step = HISTOGRAM_BINS // 6
+    chart.categoryAxis.categoryNames = [
+        f"{edge:.4g}" if i % step == 0 else "" for i, edge in enumerate(bins["edges"][:-1])
+    ]
+    chart.categoryAxis.labels.fontSize = 7
+    chart.valueAxis.labels.fontSize = 7
+    chart.valueAxis.valueMin = 0
+    d.add(chart)
+    return d
+
+
+def _date(t):
+    return datetime.fromtimestamp(t, timezone.utc).strftime("%d %b %y")
+
+
+def trend(column, x, y, unit=None):
+    """Line Drawing of per-upload averages (x = epoch seconds), or None
+    when there are fewer than two points."""
+    if len(x) < 2:
+        return None
+    d = _frame(f"Average {column.lower()} per upload" + (f" ({unit})" if unit else ""))
+    plot = LinePlot()
+    plot.x, plot.y = 40, 25
+    plot.width, plot.height = WIDTH - 50, HEIGHT - 50
+    plot.data = [list(zip(np.asarray(x).tolist(), np.asarray(y).tolist()))]
+    plot.lines[0].strokeColor = LINE_COLOR
+    plot.lines[0].strokeWidth = 1.2
+    plot.xValueAxis.labelTextFormat = _date
+    plot.xValueAxis.labels.fontSize = 7
+    plot.yValueAxis.labels.fontSize = 7
+    d.add(plot)
+    return d
@@ -0,0 +1,323 @@
+"""Columnar on-disk copy of an upload's rows.
+
+A column store is a directory holding one raw little-endian file per
+column plus meta.json:
+
+    meta.json     {"rows": N, "columns": {...}, "zones": {...}}
+    c0.bin ...    float64 values ("float"), int32 codes ("dict", -1 =
+                  missing) or int64 end offsets into c0.data ("str")
+    c0.data       the UTF-8 bytes of a "str" column, back to back
+    c0.dict.bin   end offsets and bytes of a "dict" column's values,
+    c0.dict.data  laid out like a "str" column
+
+Text columns start out dictionary-encoded and switch to "str" once they
+pass DICT_MAX_CODES distinct values, so a unique-per-row column (names,
+ids) costs no more memory to write than a numeric one. A missing or
+empty "str" value reads back as None.
+
+Files are opened with np.memmap, so readers only touch the pages of the
+columns they scan, and only decode the strings they return. "zones"
+holds per-block zone maps (min/max of float columns, codes present for
+low-cardinality dict columns) so queries can skip blocks that cannot
+match.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+FLOAT = "float"
+DICT = "dict"
+STR = "str"
+DTYPES = {FLOAT: np.dtype("<f8"), DICT: np.dtype("<i4"), STR: np.dtype("<i8")}
+
+# dict columns with more distinct values than this are rewritten as "str"
+DICT_MAX_CODES = 65536
+
+# rows per zone-map block
+ZONE_ROWS = 65536
+# dict columns with more distinct values than this get no zone map
+ZONE_MAX_CODES = 1024
+
+
+class ColumnWriter:
+    """Append DataFrame chunks to a new column store in `directory`.
+
+    Columns listed in `numeric` are stored as float64, everything else as
+    dictionary-encoded strings until that passes DICT_MAX_CODES values.
+    """
+
+    def __init__(self, directory, numeric=()):
+        self.directory = str(directory)
+        self.numeric = set(numeric)
+        self.rows = 0
+        self.columns = None
+        self._files = {}
+        self._dicts = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _open(self, names):
+        self.columns = {}
+        for i, name in enumerate(names):
+            kind = FLOAT if name in self.numeric else DICT
+            self.columns[name] = {"file": f"c{i}.bin", "kind": kind}
+            self._files[name] = open(self._path(name), "wb")
+            if kind == DICT:
+                self._dicts[name] = {}
+
+    def _path(self, name, ext=".bin"):
+        return os.path.join(self.directory, self.columns[name]["file"].replace(".bin", ext))
+
+    def append(self, df):
+        if self.columns is None:
+            self._open(list(df.columns))
+        for name, col in self.columns.items():
+            if col["kind"] == FLOAT:
+                data = df[name].to_numpy(dtype="float64", na_value=np.nan)
+                self._files[name].write(data.astype(DTYPES[FLOAT], copy=False).tobytes())
+            elif col["kind"] == DICT:
+                data = self._encode(name, df[name])
+                if data is None:
+                    self._to_strings(name)
+                    self._files[name].write(df[name])
+                else:
+                    self._files[name].write(data.tobytes())
+            else:
+                self._files[name].write(df[name])
+        self.rows += len(df)
+
+    def _encode(self, name, series):
+        """int32 codes for `series`, or None once the column has too many values."""
+        codes, uniques = pd.factorize(series)
+        mapping = self._dicts[name]
+        remap = np.fromiter(
+            (mapping.setdefault(str(v), len(mapping)) for v in uniques),
+            dtype="int32",
+            count=len(uniques),
+        )
+        if len(mapping) > DICT_MAX_CODES:
+            return None
+        out = np.full(len(codes), -1, dtype="int32")
+        present = codes >= 0
+        out[present] = remap[codes[present]]
+        return out
+
+    def _to_strings(self, name):
+        """Rewrite the codes written so far as a "str" column and drop the dictionary."""
+        self._files[name].close()
+        values = np.array(list(self._dicts.pop(name)) + [None], dtype=object)
+        codes_path = self._path(name, ".codes")
+        os.replace(self._path(name), codes_path)
+        writer = StringWriter(self._path(name), self._path(name, ".data"))
+        if self.rows:
+            codes = np.memmap(codes_path, dtype=DTYPES[DICT], mode="r", shape=(self.rows,))
+            for start in range(0, self.rows, 1 << 20):
+                # -1 (missing) indexes the trailing None
+                writer.write(values[codes[start:start + (1 << 20)]])
+            del codes
+        os.remove(codes_path)
+        self._files[name] = writer
+        self.columns[name]["kind"] = STR
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        for name, mapping in self._dicts.items():
+            _write_strings(self._path(name, ".dict.bin"), self._path(name, ".dict.data"), mapping)
+        _write_meta(self.directory, self.rows, self.columns or {})
+        return self.directory
+
+
+class StringWriter:
+    """Appends values to a "str" column: int64 end offsets plus UTF-8 bytes."""
+
+    def __init__(self, offsets_path, data_path):
+        self._offsets = open(offsets_path, "wb")
+        self._data = open(data_path, "wb")
+        self._end = 0
+
+    def write(self, values):
+        values = np.asarray(values, dtype=object)
+        encoded = [b"" if na else str(v).encode() for v, na in zip(values.tolist(), pd.isna(values).tolist())]
+        ends = self._end + np.cumsum(np.fromiter(map(len, encoded), dtype="int64", count=len(encoded)))
+        self._offsets.write(ends.astype(DTYPES[STR], copy=False).tobytes())
+        self._data.write(b"".join(encoded))
+        if len(ends):
+            self._end = int(ends[-1])
+
+    def close(self):
+        self._offsets.close()
+        self._data.close()
+
+
+def _write_strings(offsets_path, data_path, values):
+    writer = StringWriter(offsets_path, data_path)
+    writer.write(list(values))
+    writer.close()
+
+
+def _read_strings(offsets, data, positions):
+    """Decode the values at `positions` (None where empty)."""
+    positions = np.asarray(positions, dtype="int64")
+    ends = offsets[positions]
+    starts = np.where(positions > 0, offsets[np.maximum(positions - 1, 0)], 0)
+    return [
+        bytes(data[s:e]).decode() if e > s else None
+        for s, e in zip(starts.tolist(), ends.tolist())
+    ]
+
+
+def concat(parts, directory):
+    """Concatenate the column stores in `parts` (in order) into `directory`.
+
+    Dictionaries are merged and codes rewritten; float and "str" columns
+    are copied byte for byte (offsets shifted). A text column that is "str"
+    in any part, or whose merged dictionary passes DICT_MAX_CODES, comes
+    out as "str". The part directories are removed afterwards.
+    """
+    stores = [ColumnStore(p) for p in parts]
+    stores = [s for s in stores if s.columns]
+    os.makedirs(directory, exist_ok=True)
+    columns = {name: dict(col) for name, col in stores[0].meta["columns"].items()} if stores else {}
+
+    for name, col in columns.items():
+        dest = os.path.join(directory, col["file"])
+        if col["kind"] == FLOAT:
+            with open(dest, "wb") as out:
+                for s in stores:
+                    with open(s.path(name), "rb") as src:
+                        shutil.copyfileobj(src, out, 1 << 20)
+            continue
+
+        mapping = {}
+        if all(s.kind(name) == DICT for s in stores):
+            for s in stores:
+                for v in s.dictionary(name):
+                    mapping.setdefault(v, len(mapping))
+        else:
+            mapping = None
+        if mapping is not None and len(mapping) <= DICT_MAX_CODES:
+            with open(dest, "wb") as out:
+                for s in stores:
+                    remap = np.array([mapping[v] for v in s.dictionary(name)] + [-1], dtype="int32")
+                    codes = s.column(name)
+                    for start in range(0, len(codes), 1 << 20):
+                        # -1 (missing) indexes the trailing -1 in remap
+                        out.write(remap[codes[start:start + (1 << 20)]].tobytes())
+            base = dest.replace(".bin", "")
+            _write_strings(base + ".dict.bin", base + ".dict.data", mapping)
+        else:
+            col["kind"] = STR
+            writer = StringWriter(dest, dest.replace(".bin", ".data"))
+            for s in stores:
+                for start in range(0, s.rows, 1 << 20):
+                    writer.write(s.strings(name, np.arange(start, min(start + (1 << 20), s.rows))))
+            writer.close()
+
+    _write_meta(directory, sum(s.rows for s in stores), columns)
+    for p in parts:
+        shutil.rmtree(p, ignore_errors=True)
+    return directory
+
+
+class ColumnStore:
+    """Read-only, memory-mapped view of a column store."""
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        with open(os.path.join(self.directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self.columns = list(self.meta["columns"])
+        self._dicts = {}
+
+    def path(self, name):
+        return os.path.join(self.directory, self.meta["columns"][name]["file"])
+
+    @property
+    def blocks(self):
+        return -(-self.rows // self.meta["zones"]["block_rows"])
+
+    def zones(self, name):
+        return self.meta["zones"]["columns"].get(name)
+
+    def kind(self, name):
+        return self.meta["columns"][name]["kind"]
+
+    def column(self, name):
+        """float64 values, int32 dictionary codes or int64 string end
+        offsets, memory-mapped."""
+        dtype = DTYPES[self.kind(name)]
+        if not self.rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.path(name), dtype=dtype, mode="r", shape=(self.rows,))
+
+    def _strings(self, offsets_path, count):
+        """(offsets, bytes) memory maps of a string file pair."""
+        data_path = offsets_path.replace(".bin", ".data")
+        if not count or not os.path.getsize(data_path):
+            return np.zeros(count, dtype=DTYPES[STR]), b""
+        offsets = np.memmap(offsets_path, dtype=DTYPES[STR], mode="r", shape=(count,))
+        return offsets, np.memmap(data_path, dtype="u1", mode="r")
+
+    def dictionary_size(self, name):
+        return os.path.getsize(self.path(name).replace(".bin", ".dict.bin")) // DTYPES[STR].itemsize
+
+    def dictionary(self, name):
+        """Every value of a dict column, in code order."""
+        if name not in self._dicts:
+            size = self.dictionary_size(name)
+            self._dicts[name] = _read_strings(*self._strings(self.path(name).replace(".bin", ".dict.bin"), size),
+                                              np.arange(size))
+        return self._dicts[name]
+
+    def decode(self, name, codes):
+        """The values behind dict `codes`; only those entries are read."""
+        codes = np.asarray(codes)
+        offsets, data = self._strings(self.path(name).replace(".bin", ".dict.bin"), self.dictionary_size(name))
+        present = codes >= 0
+        values = iter(_read_strings(offsets, data, codes[present]))
+        return [next(values) if ok else None for ok in present.tolist()]
+
+    def strings(self, name, positions):
+        """Values of a text column (dict or "str") at row `positions`."""
+        if self.kind(name) == DICT:
+            return self.decode(name, self.column(name)[positions])
+        return _read_strings(*self._strings(self.path(name), self.rows), positions)
+
+
+def zone_maps(store):
+    starts = np.arange(0, store.rows, ZONE_ROWS)
+    zones = {}
+    for name in store.columns:
+        data = store.column(name)
+        if not store.rows:
+            continue
+        if store.kind(name) == FLOAT:
+            # fmin/fmax skip NaN; an all-NaN block stays NaN -> None
+            lo = np.fmin.reduceat(data, starts)
+            hi = np.fmax.reduceat(data, starts)
+            zones[name] = {
+                "min": [None if np.isnan(v) else float(v) for v in lo],
+                "max": [None if np.isnan(v) else float(v) for v in hi],
+            }
+        elif store.kind(name) == DICT and store.dictionary_size(name) <= ZONE_MAX_CODES:
+            zones[name] = {
+                "codes": [np.unique(data[i:i + ZONE_ROWS]).tolist() for i in starts],
+            }
+    return {"block_rows": ZONE_ROWS, "columns": zones}
+
+
+def _write_meta(directory, rows, columns):
+    meta = {"rows": rows, "columns": columns, "zones": {"block_rows": ZONE_ROWS, "columns": {}}}
+    meta_path = os.path.join(directory, "meta.json")
+    _write_json(meta_path, meta)
+    meta["zones"] = zone_maps(ColumnStore(directory))
+    _write_json(meta_path, meta)
+
+
+def _write_json(path, obj):
+    with open(path, "w") as f:
+        json.dump(obj, f)
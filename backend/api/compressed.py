@@ -0,0 +1,59 @@
+"""Compressed uploads, recognised by their magic bytes.
+
+gzip, bz2 and xz are always available; zstd needs the optional
+`zstandard` package. Streams are decompressed on the fly, so the
+expanded CSV never touches the disk.
+"""
+import bz2
+import gzip
+import io
+import lzma
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+)
+
+# raised by the decompressors on corrupt or truncated input
+ERRORS = (OSError, EOFError, lzma.LZMAError) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+class UnsupportedCompression(Exception):
+    pass
+
+
+def detect(path):
+    """"gzip", "bz2", "xz", "zstd", or None for an uncompressed file."""
+    with open(path, "rb") as f:
+        head = f.read(8)
+    for magic, kind in MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def available(kind):
+    return kind != "zstd" or zstandard is not None
+
+
+def open_stream(path, kind=None):
+    """A binary file object yielding the decompressed bytes of `path`."""
+    kind = kind or detect(path)
+    if kind is None:
+        return open(path, "rb")
+    if kind == "gzip":
+        return gzip.open(path, "rb")
+    if kind == "bz2":
+        return bz2.open(path, "rb")
+    if kind == "xz":
+        return lzma.open(path, "rb")
+    if kind == "zstd" and zstandard is not None:
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    raise UnsupportedCompression(f"{kind} is not supported on this server")
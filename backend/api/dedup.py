@@ -0,0 +1,77 @@
+"""Content-addressed reuse of upload summaries."""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from . import storage
+from .ingest import SUMMARY_SCHEMA_VERSION
+from .models import ContentDigest, UploadHistory
+
+
+def lookup(sha256, filename):
+    """An unsaved UploadHistory built from a cached summary (counted as a
+    hit), or None."""
+    digest = ContentDigest.objects.defer(None).filter(sha256=sha256).first()
+    if not _usable(digest):
+        return None
+    ContentDigest.objects.filter(id=digest.id).update(hits=F("hits") + 1)
+    return _history_row(digest, filename)
+
+
+async def alookup(sha256, filename):
+    digest = await ContentDigest.objects.defer(None).filter(sha256=sha256).afirst()
+    if not _usable(digest):
+        return None
+    await ContentDigest.objects.filter(id=digest.id).aupdate(hits=F("hits") + 1)
+    return _history_row(digest, filename)
+
+
+def _usable(digest):
+    return digest is not None and digest.summary.get("schema_version") == SUMMARY_SCHEMA_VERSION
+
+
+def _history_row(digest, filename):
+    return UploadHistory(
+        filename=filename,
+        summary=digest.summary,
+        state=digest.state,
+        content_hash=digest.sha256,
+        columns_path=digest.sha256 if storage.has_columns(digest.sha256) else "",
+    )
+
+
+def reuse(sha256, filename):
+    """Create an UploadHistory row from a cached summary, or return None."""
+    upload = lookup(sha256, filename)
+    if upload is not None:
+        upload.save()
+    return upload
+
+
+async def areuse(sha256, filename):
+    upload = await alookup(sha256, filename)
+    if upload is not None:
+        await upload.asave()
+    return upload
+
+
+def remember(sha256, summary, state=None):
+    """Record a parsed summary and its state (a cache miss) under its content hash."""
+    updated = ContentDigest.objects.filter(sha256=sha256).update(
+        summary=summary, state=state, misses=F("misses") + 1
+    )
+    if not updated:
+        try:
+            with transaction.atomic():
+                ContentDigest.objects.create(sha256=sha256, summary=summary, state=state, misses=1)
+        except IntegrityError:
+            # a concurrent job stored it first
+            ContentDigest.objects.filter(sha256=sha256).update(misses=F("misses") + 1)
+
+
+def stats():
+    totals = ContentDigest.objects.aggregate(hits=Sum("hits"), misses=Sum("misses"))
+    return {
+        "hits": totals["hits"] or 0,
+        "misses": totals["misses"] or 0,
+        "entries": ContentDigest.objects.count(),
+    }
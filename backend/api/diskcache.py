@@ -0,0 +1,85 @@
+import os
+import tempfile
+
+
+class DiskLRUCache:
+    """Files on local disk, evicted least-recently-used beyond `max_bytes`.
+
+    Recency is the file mtime, bumped on every hit, so the cache needs no
+    index and can be shared by several processes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, data):
+        return self.write(key, lambda f: f.write(data))
+
+    def write(self, key, fill):
+        """Like put(), but fill(f) writes the value into the open file, so
+        large values need not be held in memory."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                fill(f)
+        except BaseException:
+            _unlink(tmp)
+            raise
+        path = self.path(key)
+        os.replace(tmp, path)
+        self.evict(keep=path)
+        return path
+
+    def keys(self):
+        return [e.name for e in self._entries()]
+
+    def discard(self, prefix):
+        """Remove every key starting with `prefix` (a string or a tuple of them)."""
+        for entry in self._entries():
+            if entry.name.startswith(prefix):
+                _unlink(entry.path)
+
+    def evict(self, keep=None):
+        entries = []
+        for entry in self._entries():
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue  # another process removed it after the scan
+            entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= size
+            _unlink(path)
+
+    def _entries(self):
+        try:
+            with os.scandir(self.directory) as it:
+                return [e for e in it if e.is_file() and not e.name.startswith(".tmp-")]
+        except FileNotFoundError:
+            return []
+
+
+def _unlink(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,69 @@
+"""Reduce a series to a pixel budget for charting."""
+import numpy as np
+
+
+def lttb(x, y, n):
+    """Indices of `n` points chosen by Largest-Triangle-Three-Buckets.
+
+    Bucket averages are computed in one vectorised pass; only the choice of
+    each bucket's point (which depends on the previous choice) loops, once
+    per bucket.
+    """
+    size = len(y)
+    if n >= size or size <= 2:
+        return np.arange(size)
+    if n < 3:
+        return np.array([0, size - 1])
+
+    # n - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    counts = np.diff(np.r_[edges, size])
+    avg_x = np.add.reduceat(x, edges) / counts
+    avg_y = np.add.reduceat(y, edges) / counts
+
+    out = np.empty(n, dtype=np.int64)
+    out[0], out[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[i + 1]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y[i + 1] - ay))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def minmax(y, n):
+    """Indices of the min and max of each of n // 2 equal buckets, in order."""
+    size = len(y)
+    buckets = max(n // 2, 1)
+    if n >= size:
+        return np.arange(size)
+
+    width = -(-size // buckets)
+    buckets = -(-size // width)
+    # pad with the last value; a pick in the padding is clipped back onto it
+    padded = np.empty(buckets * width)
+    padded[:size] = y
+    padded[size:] = y[-1]
+    grid = padded.reshape(buckets, width)
+    base = np.arange(buckets) * width
+    picks = np.concatenate([base + grid.argmin(axis=1), base + grid.argmax(axis=1)])
+    return np.unique(np.minimum(picks, size - 1))
+
+
+METHODS = {
+    "lttb": lambda x, y, n: lttb(x, y, n),
+    "minmax": lambda x, y, n: minmax(y, n),
+}
+
+
+def downsample(x, y, n, method="lttb"):
+    """Drop missing values and return (x, y) reduced to about `n` points."""
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    keep = ~np.isnan(y)
+    if not keep.all():
+        x, y = x[keep], y[keep]
+    idx = METHODS[method](x, y, n)
+    return x[idx], y[idx]
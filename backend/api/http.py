@@ -0,0 +1,94 @@
+import os
+import re
+
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework.settings import api_settings
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def authenticate(request):
+    """The user DRF's authenticators find on a plain Django request, or
+    None; raises AuthenticationFailed for bad credentials."""
+    for auth_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = auth_class().authenticate(request)
+        if result is not None:
+            return result[0]
+    return None
+
+
+def etag_matches(request, etag):
+    """True if the request's If-None-Match covers `etag`."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or etag in etags
+
+
+def parse_range(header, size):
+    """Parse a single-range `Range` header.
+
+    Returns (start, end) inclusive, None when the header should be ignored
+    (missing, malformed or multi-range) and raises ValueError when the range
+    cannot be satisfied.
+    """
+    m = _RANGE_RE.match(header.strip()) if header else None
+    if not m or m.groups() == ("", ""):
+        return None
+    first, last = m.groups()
+    if first == "":
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def serve_file(request, path, content_type, etag, last_modified=None, disposition=None):
+    """Serve `path` with ETag/Last-Modified validation and byte ranges."""
+    size = os.path.getsize(path)
+    modified = int(last_modified.timestamp()) if last_modified else None
+
+    if etag_matches(request, etag):
+        resp = HttpResponseNotModified()
+    elif (
+        "If-None-Match" not in request.headers
+        and modified is not None
+        and (parse_http_date_safe(request.headers.get("If-Modified-Since", "")) or -1) >= modified
+    ):
+        resp = HttpResponseNotModified()
+    else:
+        if_range = request.headers.get("If-Range")
+        byte_range = None
+        if if_range is None or if_range == etag:
+            try:
+                byte_range = parse_range(request.headers.get("Range"), size)
+            except ValueError:
+                resp = HttpResponse(status=416)
+                resp["Content-Range"] = f"bytes */{size}"
+                return resp
+
+        if byte_range is None:
+            resp = FileResponse(open(path, "rb"), content_type=content_type)
+        else:
+            start, end = byte_range
+            with open(path, "rb") as f:
+                f.seek(start)
+                data = f.read(end - start + 1)
+            resp = HttpResponse(data, status=206, content_type=content_type)
+            resp["Content-Range"] = f"bytes {start}-{end}/{size}"
+        resp["Accept-Ranges"] = "bytes"
+        if disposition:
+            resp["Content-Disposition"] = disposition
+
+    resp["ETag"] = etag
+    if modified is not None:
+        resp["Last-Modified"] = http_date(modified)
+    resp["Cache-Control"] = "private, no-cache"
+    return resp
@@ -0,0 +1,337 @@
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from . import columns, instrument
+from .schema import EQUIPMENT, read_chunks, read_header
+from .stats import ColumnStats
+
+# Bump when the layout of the summary dict changes.
+# 1: totals, averages and type_distribution
+# 2: adds "stats" with overall and per-Type ColumnStats results
+# 3: adds "state", the mergeable SummaryAccumulator state
+# 4: "state" is stored in its own field; see split_state()
+SUMMARY_SCHEMA_VERSION = 4
+
+# CSV column -> summary key
+NUMERIC_COLUMNS = {
+    "Flowrate": "avg_flowrate",
+    "Pressure": "avg_pressure",
+    "Temperature": "avg_temperature",
+}
+TYPE_COLUMN = "Type"
+
+
+class SummaryAccumulator:
+    """Running aggregates for the upload summary.
+
+    Per-column ColumnStats (overall and per Type) plus Type counts; memory
+    does not depend on how many rows have been fed in.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.overall = {col: ColumnStats() for col in NUMERIC_COLUMNS}
+        self.by_type = {}
+        self.types = {}
+
+    def _type_stats(self, name):
+        if name not in self.by_type:
+            self.by_type[name] = {col: ColumnStats() for col in NUMERIC_COLUMNS}
+        return self.by_type[name]
+
+    def update(self, df):
+        self.rows += len(df)
+
+        # factorize numbers Types in first-seen order (also for categoricals,
+        # whose value_counts would follow category order), which survives
+        # across chunks; missing Types get -1 and are not counted
+        codes, names = pd.factorize(df[TYPE_COLUMN])
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=len(names))
+        bounds = np.r_[0, np.cumsum(counts)] + (len(codes) - counts.sum())
+        groups = {}
+        for i, name in enumerate(names):
+            self.types[name] = self.types.get(name, 0) + int(counts[i])
+            groups[name] = order[bounds[i]:bounds[i + 1]]
+
+        for col in NUMERIC_COLUMNS:
+            values = df[col].to_numpy(dtype="float64", na_value=np.nan)
+            self.overall[col].update(values)
+            for name, idx in groups.items():
+                self._type_stats(name)[col].update(values[idx])
+
+    def merge(self, other):
+        self.rows += other.rows
+        for col in NUMERIC_COLUMNS:
+            self.overall[col].merge(other.overall[col])
+        for name, n in other.types.items():
+            self.types[name] = self.types.get(name, 0) + n
+        for name, cols in other.by_type.items():
+            mine = self._type_stats(name)
+            for col, st in cols.items():
+                mine[col].merge(st)
+        return self
+
+    def state(self):
+        return {
+            "rows": self.rows,
+            "types": {str(name): n for name, n in self.types.items()},
+            "overall": {col: st.to_state() for col, st in self.overall.items()},
+            "by_type": {
+                str(name): {col: st.to_state() for col, st in cols.items()}
+                for name, cols in self.by_type.items()
+            },
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls()
+        acc.rows = state["rows"]
+        acc.types = dict(state["types"])
+        acc.overall = {col: ColumnStats.from_state(st) for col, st in state["overall"].items()}
+        acc.by_type = {
+            name: {col: ColumnStats.from_state(st) for col, st in cols.items()}
+            for name, cols in state["by_type"].items()
+        }
+        return acc
+
+    def summary(self, include_state=True):
+        summary = {"schema_version": SUMMARY_SCHEMA_VERSION, "total_equipment": self.rows}
+        for col, key in NUMERIC_COLUMNS.items():
+            st = self.overall[col]
+            # None rather than NaN: strict JSON renderers reject NaN
+            summary[key] = st.mean if st.count else None
+
+        # same ordering as value_counts(): by count, descending
+        ordered = sorted(self.types.items(), key=lambda kv: kv[1], reverse=True)
+        summary["type_distribution"] = dict(ordered)
+
+        summary["stats"] = {
+            "overall": {col: st.result() for col, st in self.overall.items()},
+            "by_type": {
+                str(name): {col: st.result() for col, st in self.by_type[name].items()}
+                for name, _ in ordered
+                if name in self.by_type
+            },
+        }
+        if include_state:
+            summary["state"] = self.state()
+        return summary
+
+
+def split_state(summary):
+    """(summary, state): the summary as stored, without the "state" that
+    summary() includes for the caller to keep separately."""
+    summary = dict(summary)
+    return summary, summary.pop("state", None)
+
+
+def merge_states(states):
+    """Combine stored summary states into one SummaryAccumulator."""
+    acc = SummaryAccumulator()
+    for state in states:
+        acc.merge(SummaryAccumulator.from_state(state))
+    return acc
+
+
+def _consume(reader, columns_dir):
+    acc = SummaryAccumulator()
+    writer = columns.ColumnWriter(columns_dir, NUMERIC_COLUMNS) if columns_dir else None
+    # per-chunk times are summed and recorded once per stage
+    timings = {"read_csv": 0.0, "aggregate": 0.0, "columns": 0.0}
+    rows = 0
+    with reader:
+        chunks = iter(reader)
+        while True:
+            t0 = time.perf_counter()
+            chunk = next(chunks, None)
+            t1 = time.perf_counter()
+            timings["read_csv"] += t1 - t0
+            if chunk is None:
+                break
+            rows += len(chunk)
+            acc.update(chunk)
+            t2 = time.perf_counter()
+            timings["aggregate"] += t2 - t1
+            if writer:
+                writer.append(chunk)
+                timings["columns"] += time.perf_counter() - t2
+    if writer:
+        t0 = time.perf_counter()
+        writer.close()
+        timings["columns"] += time.perf_counter() - t0
+    instrument.record("read_csv", timings["read_csv"], rows=rows)
+    instrument.record("aggregate", timings["aggregate"])
+    if writer:
+        instrument.record("columns", timings["columns"])
+    return acc
+
+
+def summarize_csv(f, chunksize=100_000, columns_dir=None, schema=EQUIPMENT, engine="auto"):
+    """Build the upload summary by reading `f` in chunks of `chunksize` rows.
+
+    Only the columns declared in `schema` are parsed; see schema.read_chunks.
+    With `columns_dir` the rows are also written there as a column store.
+    """
+    return _consume(read_chunks(f, schema, chunksize, engine=engine), columns_dir).summary()
+
+
+class _RangeReader(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file."""
+
+    def __init__(self, path, start, end):
+        self._f = open(path, "rb")
+        self._f.seek(start)
+        self._left = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._f.readinto(memoryview(b)[: min(len(b), self._left)])
+        self._left -= n
+        return n
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+def split_ranges(path, parts):
+    """Split the body of a CSV into at most `parts` byte ranges.
+
+    Every boundary is moved forward to the next newline so no row is cut in
+    half. Returns (header_bytes, [(start, end), ...]). Quoted fields that
+    contain newlines are not supported.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        body_start = f.tell()
+        bounds = [body_start]
+        for i in range(1, parts):
+            target = body_start + (size - body_start) * i // parts
+            if target <= bounds[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline()
+            if f.tell() >= size:
+                break
+            if f.tell() > bounds[-1]:
+                bounds.append(f.tell())
+        bounds.append(size)
+    ranges = [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+    return header, ranges
+
+
+def _summarize_range(path, start, end, names, chunksize, columns_dir, schema, engine):
+    with io.BufferedReader(_RangeReader(path, start, end)) as raw:
+        reader = read_chunks(raw, schema, chunksize, names=names, engine=engine)
+        return _consume(reader, columns_dir)
+
+
+# one pool per worker count, shared by every thread in the process; only
+# replaced once broken (a worker died), so no working pool is shut down
+# under a caller
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # spawn: forking a threaded server process is not safe
+            pool = _pools[workers] = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        return pool
+
+
+def _drop_pool(workers, pool):
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_all(workers, calls):
+    """Run each of `calls` (no-argument callables) on the shared pool.
+
+    Returns a list in the order of `calls` holding each result, or the
+    exception it raised. A worker that dies (say, OOM-killed) breaks the
+    whole pool; it is then replaced and the calls it lost run once more.
+    """
+    results = [None] * len(calls)
+    todo = range(len(calls))
+    for _ in range(2):
+        pool = _get_pool(workers)
+        futures = {}
+        for i in todo:
+            try:
+                futures[i] = pool.submit(calls[i])
+            except BrokenProcessPool as e:
+                results[i] = e
+        for i, fut in futures.items():
+            try:
+                results[i] = fut.result()
+            except Exception as e:
+                results[i] = e
+        todo = [i for i in todo if isinstance(results[i], BrokenProcessPool)]
+        if not todo:
+            break
+        _drop_pool(workers, pool)
+    return results
+
+
+def summarize_csv_parallel(path, workers=None, chunksize=100_000, columns_dir=None, schema=EQUIPMENT, engine="auto"):
+    """Build the upload summary for the CSV at `path` on a process pool.
+
+    The file is split into newline-aligned byte ranges, each worker returns
+    a partial SummaryAccumulator and the partials are merged in file order
+    so Type ordering matches summarize_csv(). With `columns_dir` each worker
+    writes its rows to a part store and the parts are concatenated.
+    """
+    workers = workers or os.cpu_count() or 1
+    names = read_header(path)
+    schema.check(names)  # fail before starting any workers
+    _, ranges = split_ranges(path, workers)
+
+    parts = [os.path.join(columns_dir, f"part-{i}") for i in range(len(ranges))] if columns_dir else []
+
+    acc = SummaryAccumulator()
+    if ranges:
+        results = _run_all(workers, [
+            partial(_summarize_range, path, start, end, names, chunksize, parts[i] if parts else None, schema, engine)
+            for i, (start, end) in enumerate(ranges)
+        ])
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+            acc.merge(result)
+    if columns_dir:
+        columns.concat(parts, columns_dir)
+    return acc.summary()
+
+
+def summarize_many(paths, columns_dirs=None, workers=None, chunksize=100_000, engine="auto"):
+    """Summarize several CSVs side by side on the process pool, one file per
+    task (each read serially, compressed or not).
+
+    Returns a list in the order of `paths` holding each summary, or the
+    exception its worker raised.
+    """
+    if not paths:
+        return []
+    columns_dirs = columns_dirs or [None] * len(paths)
+    return _run_all(workers or os.cpu_count() or 1, [
+        partial(summarize_csv, path, chunksize=chunksize, columns_dir=cols, engine=engine)
+        for path, cols in zip(paths, columns_dirs)
+    ])
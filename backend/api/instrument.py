@@ -0,0 +1,248 @@
+"""Request instrumentation: stage spans, Server-Timing and Prometheus metrics.
+
+Code wraps interesting stages in span():
+
+    with instrument.span("spool") as s:
+        ...
+        s.count(bytes=size)
+
+Each finished span is added to the current request's trace (reported in
+its Server-Timing header by InstrumentationMiddleware) and to the
+process-wide REGISTRY as a latency histogram labelled by endpoint and
+stage, plus byte/row counters. /api/metrics/ renders REGISTRY in the
+Prometheus text format. Work outside a request (ingest jobs, retention)
+is labelled with the name given to trace().
+
+The current trace lives in a context variable, so it follows a request
+into async views and into executor threads started with a copied
+context (asgiref's sync_to_async does that).
+
+Metrics are per process; pool workers and `manage.py` commands keep
+their own.
+"""
+import bisect
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_trace = contextvars.ContextVar("instrument_trace", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Thread-safe histograms, counters and callback gauges."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, fn):
+        """Report fn() -> {labels tuple: value} (or a number) at render time."""
+        self._gauges[name] = fn
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self):
+        with self._lock:
+            histograms = {k: (list(h.counts), h.sum, h.count, h.buckets) for k, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for name, fn in sorted(self._gauges.items()):
+            header(name, "gauge")
+            values = fn()
+            if not isinstance(values, dict):
+                values = {(): values}
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+REGISTRY = Registry()
+REGISTRY.describe("http_request_duration_seconds", "Time spent handling a request.")
+REGISTRY.describe("stage_duration_seconds", "Time spent in one stage of a request or job.")
+REGISTRY.describe("stage_bytes_total", "Bytes handled by a stage.")
+REGISTRY.describe("stage_rows_total", "CSV rows handled by a stage.")
+
+
+class Span:
+    def __init__(self, stage):
+        self.stage = stage
+        self.counts = {}
+
+    def count(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+
+class Trace:
+    """Stages recorded for one request or job.
+
+    A request's spans are labelled with its matched URL route, which is
+    only known once URL resolution has run, so it is looked up lazily.
+    """
+
+    def __init__(self, name, request=None):
+        self.name = name
+        self.request = request
+        self.stages = []
+
+    @property
+    def endpoint(self):
+        match = getattr(self.request, "resolver_match", None)
+        return match.route if match else self.name
+
+
+def record(stage, seconds, **counts):
+    """Record a finished stage that was timed elsewhere."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.stages.append((stage, seconds))
+    labels = {"endpoint": trace.endpoint if trace else "background", "stage": stage}
+    REGISTRY.observe("stage_duration_seconds", labels, seconds)
+    for key in ("bytes", "rows"):
+        if counts.get(key):
+            REGISTRY.inc(f"stage_{key}_total", labels, counts[key])
+
+
+@contextmanager
+def span(stage, **counts):
+    s = Span(stage)
+    s.count(**counts)
+    start = time.perf_counter()
+    try:
+        yield s
+    finally:
+        record(stage, time.perf_counter() - start, **s.counts)
+
+
+@contextmanager
+def trace(name, request=None):
+    """Collect spans recorded inside into a Trace labelled `name` (or the
+    route `request` resolves to); yields the Trace."""
+    current = Trace(name, request)
+    token = _trace.set(current)
+    try:
+        yield current
+    finally:
+        _trace.reset(token)
+
+
+_token_re = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+
+
+def server_timing(stages, total):
+    """Server-Timing header value; repeated stages are summed, in ms."""
+    merged = {}
+    for stage, seconds in stages:
+        name = _token_re.sub("_", stage)
+        merged[name] = merged.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in merged.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class InstrumentationMiddleware:
+    """Times every request, labels its spans with the matched URL route
+    and adds a Server-Timing header."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with trace("unmatched", request) as current:
+            response = self.get_response(request)
+        return self.finish(request, response, current, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with trace("unmatched", request) as current:
+            response = await self.get_response(request)
+        return self.finish(request, response, current, time.perf_counter() - start)
+
+    def finish(self, request, response, current, total):
+        REGISTRY.observe(
+            "http_request_duration_seconds",
+            {"endpoint": current.endpoint, "method": request.method, "status": f"{response.status_code // 100}xx"},
+            total,
+        )
+        response["Server-Timing"] = server_timing(current.stages, total)
+        return response
@@ -0,0 +1,249 @@
+"""DB-backed ingestion queue.
+
+Uploads are spooled to disk and recorded as IngestJob rows. Jobs are
+claimed with a conditional UPDATE, so any number of in-process worker
+threads and `manage.py ingest_worker` processes can share the queue without
+an external broker.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import compressed, dedup, instrument, storage
+from .ingest import split_state, summarize_csv, summarize_csv_parallel
+from .models import IngestJob, UploadHistory
+
+log = logging.getLogger(__name__)
+
+
+def spool_upload(f):
+    """Copy an uploaded file (or any binary file object) into the spool
+    directory.
+
+    The SHA-256 of the content is computed on the same pass; returns
+    (path, hexdigest).
+    """
+    os.makedirs(settings.INGEST_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(settings.INGEST_SPOOL_DIR, f"{uuid.uuid4().hex}.csv")
+    h = hashlib.sha256()
+    chunks = f.chunks() if hasattr(f, "chunks") else iter(lambda: f.read(1 << 20), b"")
+    try:
+        with instrument.span("spool") as span, open(path, "wb") as out:
+            for chunk in chunks:
+                h.update(chunk)
+                out.write(chunk)
+                span.count(bytes=len(chunk))
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, h.hexdigest()
+
+
+def enqueue(filename, path, content_hash=""):
+    job = IngestJob.objects.create(filename=filename, path=path, content_hash=content_hash)
+    _notify_workers()
+    return job
+
+
+async def aenqueue(filename, path, content_hash=""):
+    job = await IngestJob.objects.acreate(filename=filename, path=path, content_hash=content_hash)
+    _notify_workers()
+    return job
+
+
+def _notify_workers():
+    # wakes this process's workers, if it runs any
+    _wakeup.set()
+
+
+def summarize_file(path, columns_dir=None):
+    # a compressed stream cannot be split into byte ranges, so it is
+    # always decompressed and parsed serially
+    size = os.path.getsize(path)
+    if size >= settings.CSV_PARALLEL_THRESHOLD_BYTES and compressed.detect(path) is None:
+        # the pool workers' own stage timings stay in their processes
+        with instrument.span("parse_parallel", bytes=size):
+            return summarize_csv_parallel(
+                path,
+                workers=settings.CSV_PARALLEL_WORKERS,
+                chunksize=settings.CSV_CHUNK_ROWS,
+                columns_dir=columns_dir,
+                engine=settings.CSV_ENGINE,
+            )
+    return summarize_csv(
+        path, chunksize=settings.CSV_CHUNK_ROWS, columns_dir=columns_dir, engine=settings.CSV_ENGINE
+    )
+
+
+def ingest_file(path, filename, content_hash=""):
+    columns_path = ""
+    if settings.COLUMN_STORE_ENABLED:
+        tmp = storage.new_columns_dir(content_hash)
+        try:
+            summary = summarize_file(path, columns_dir=tmp)
+            with instrument.span("publish_columns"):
+                columns_path = storage.publish_columns(tmp, content_hash)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+    else:
+        summary = summarize_file(path)
+
+    summary, state = split_state(summary)
+    with instrument.span("insert"):
+        upload = UploadHistory.objects.create(
+            filename=filename, summary=summary, state=state, content_hash=content_hash, columns_path=columns_path
+        )
+        if content_hash:
+            dedup.remember(content_hash, summary, state)
+    return upload
+
+
+def queue_depth():
+    counts = dict(
+        IngestJob.objects.filter(status__in=[IngestJob.QUEUED, IngestJob.RUNNING])
+        .values_list("status").annotate(n=Count("id"))
+    )
+    return {(("status", status),): counts.get(status, 0) for status in (IngestJob.QUEUED, IngestJob.RUNNING)}
+
+
+instrument.REGISTRY.describe("ingest_jobs", "Ingest jobs waiting or running.")
+instrument.REGISTRY.gauge("ingest_jobs", queue_depth)
+
+
+def claim_next():
+    """Mark the oldest queued job as running and return it, or None."""
+    while True:
+        job_id = (
+            IngestJob.objects.filter(status=IngestJob.QUEUED)
+            .order_by("id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        now = timezone.now()
+        claimed = IngestJob.objects.filter(id=job_id, status=IngestJob.QUEUED).update(
+            status=IngestJob.RUNNING, started_at=now, heartbeat_at=now
+        )
+        if claimed:
+            return IngestJob.objects.get(id=job_id)
+        # another worker got it first; try the next one
+
+
+def requeue_stale():
+    """Put back running jobs whose heartbeat stopped more than
+    INGEST_JOB_TIMEOUT_SECONDS ago; the process that claimed them is taken
+    to have died. Returns how many were requeued."""
+    if not settings.INGEST_JOB_TIMEOUT_SECONDS:
+        return 0
+    cutoff = timezone.now() - timedelta(seconds=settings.INGEST_JOB_TIMEOUT_SECONDS)
+    stale = IngestJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=IngestJob.RUNNING,
+    )
+    # check first, so an idle poll does not take a write lock
+    if not stale.exists():
+        return 0
+    n = stale.update(status=IngestJob.QUEUED, started_at=None, heartbeat_at=None)
+    if n:
+        log.warning("requeued %d stale ingest job(s)", n)
+    return n
+
+
+@contextmanager
+def _heartbeat(job):
+    """Touch the job's heartbeat_at every INGEST_HEARTBEAT_SECONDS until
+    the block exits."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.INGEST_HEARTBEAT_SECONDS):
+                try:
+                    IngestJob.objects.filter(id=job.id, status=IngestJob.RUNNING).update(
+                        heartbeat_at=timezone.now()
+                    )
+                except Exception:
+                    log.exception("heartbeat for ingest job %s failed", job.id)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    try:
+        with _heartbeat(job), instrument.trace("ingest_job"):
+            upload = ingest_file(job.path, job.filename, job.content_hash)
+    except Exception as e:
+        log.exception("ingest job %s failed", job.id)
+        job.status = IngestJob.FAILED
+        job.error = f"{type(e).__name__}: {e}"
+    else:
+        job.status = IngestJob.DONE
+        job.upload = upload
+    job.finished_at = timezone.now()
+    # unless the job was requeued (its heartbeat stalled) and claimed again,
+    # in which case that run finishes it and owns the spool file
+    finished = IngestJob.objects.filter(
+        Q(status=IngestJob.QUEUED) | Q(status=IngestJob.RUNNING, started_at=job.started_at), id=job.id
+    ).update(status=job.status, error=job.error, upload=job.upload, finished_at=job.finished_at)
+    if finished and os.path.exists(job.path):
+        os.remove(job.path)
+    return job
+
+
+def run_pending(limit=None):
+    """Process queued jobs until the queue is empty; return how many ran."""
+    requeue_stale()
+    done = 0
+    while limit is None or done < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run_job(job)
+        done += 1
+    return done
+
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def _worker_loop():
+    while True:
+        _wakeup.wait(settings.INGEST_POLL_SECONDS)
+        _wakeup.clear()
+        try:
+            run_pending()
+        except Exception:
+            log.exception("ingest worker crashed")
+        finally:
+            close_old_connections()
+
+
+def start_workers(n):
+    """Start `n` daemon worker threads in this process (idempotent)."""
+    with _workers_lock:
+        while len(_workers) < n:
+            t = threading.Thread(target=_worker_loop, name=f"ingest-{len(_workers)}", daemon=True)
+            t.start()
+            _workers.append(t)
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api import batch, retention
+from api.models import UploadHistory
+
+SUFFIXES = (".csv", ".csv.gz", ".csv.bz2", ".csv.xz", ".csv.zst")
+
+
+def find_csvs(root):
+    """Relative paths of every (possibly compressed) CSV under `root`, sorted."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(SUFFIXES):
+                found.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return found
+
+
+def file_time(path):
+    return datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.get_current_timezone())
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        "Import every CSV under a directory (compressed ones included) into "
+        "upload history. Progress is recorded in a state file, so an "
+        "interrupted import picks up where it stopped when run again. "
+        "Each upload is dated by its file's modification time (or --uploaded-at), "
+        "so archives land in history where they belong. With --prune, history "
+        "retention is applied at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument("--batch-size", type=int, default=50,
+                            help="Files per transaction.")
+        parser.add_argument("--workers", type=int, default=settings.CSV_PARALLEL_WORKERS,
+                            help="Parser processes.")
+        parser.add_argument("--state", default=None,
+                            help="Progress file (default: <directory>/.import_csvs.state).")
+        parser.add_argument("--restart", action="store_true",
+                            help="Ignore the progress file and start over.")
+        parser.add_argument("--uploaded-at", default=None,
+                            help="ISO date/time to record for every file (default: its modification time).")
+        parser.add_argument("--prune", action="store_true",
+                            help="Apply history retention once the import is done.")
+
+    def handle(self, *args, **opts):
+        root = opts["directory"]
+        if not os.path.isdir(root):
+            raise CommandError(f"{root} is not a directory")
+        uploaded_at = None
+        if opts["uploaded_at"]:
+            uploaded_at = parse_datetime(opts["uploaded_at"])
+            if uploaded_at is None:
+                raise CommandError(f"--uploaded-at: {opts['uploaded_at']!r} is not an ISO date/time")
+            if timezone.is_naive(uploaded_at):
+                uploaded_at = timezone.make_aware(uploaded_at)
+        state_path = opts["state"] or os.path.join(root, ".import_csvs.state")
+        if opts["restart"] and os.path.exists(state_path):
+            os.remove(state_path)
+
+        done = self.load_state(state_path)
+        todo = [p for p in find_csvs(root) if p not in done]
+        self.stdout.write(f"{len(todo)} file(s) to import, {len(done)} already done")
+
+        with open(state_path, "a") as state:
+            self.run(root, todo, opts["batch_size"], opts["workers"], state, uploaded_at)
+        if opts["prune"]:
+            self.stdout.write(f"retention: {retention.prune()}")
+
+    @staticmethod
+    def load_state(path):
+        done = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        done.add(json.loads(line)["path"])
+                    except (ValueError, KeyError):
+                        continue  # a torn last line from an interrupted run
+        return done
+
+    def run(self, root, todo, batch_size, workers, state, uploaded_at=None):
+        started = time.monotonic()
+        files = nbytes = failed = 0
+        for start in range(0, len(todo), batch_size):
+            rel_paths = todo[start:start + batch_size]
+            items = []
+            for rel in rel_paths:
+                path = os.path.join(root, rel)
+                items.append((rel[-255:], path, sha256_file(path)))
+                nbytes += os.path.getsize(path)
+
+            # rows committed by a run that died before writing its state
+            existing = set(
+                UploadHistory.objects.filter(content_hash__in=[i[2] for i in items])
+                .values_list("filename", "content_hash")
+            )
+            fresh = [i for i in items if (i[0], i[2]) not in existing]
+            with transaction.atomic():
+                results = {r["filename"]: r for r in batch.ingest_batch(fresh, workers=workers, remove_files=False)}
+                # rows are dated by their file, not by when they were imported
+                UploadHistory.objects.bulk_update([
+                    UploadHistory(id=results[name]["upload_id"], uploaded_at=uploaded_at or file_time(path))
+                    for name, path, _ in fresh if "upload_id" in results.get(name, {})
+                ], ["uploaded_at"])
+
+            for rel, (name, _, _) in zip(rel_paths, items):
+                result = results.get(name, {"skipped": True})
+                if "errors" in result:
+                    failed += 1
+                    self.stderr.write(f"{rel}: {result['errors'][0]['message']}")
+                    continue
+                state.write(json.dumps({"path": rel}) + "\n")
+            state.flush()
+
+            files += len(rel_paths)
+            elapsed = max(time.monotonic() - started, 1e-9)
+            self.stdout.write(
+                f"[{files}/{len(todo)}] {files / elapsed:.1f} files/s, "
+                f"{nbytes / elapsed / 1e6:.1f} MB/s, {failed} failed"
+            )
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"imported {files - failed} file(s), {nbytes / 1e6:.1f} MB in {elapsed:.1f}s")
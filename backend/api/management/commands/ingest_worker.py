@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import jobs, retention
+
+
+class Command(BaseCommand):
+    help = "Process queued CSV ingestion jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit.")
+        parser.add_argument("--poll", type=float, default=settings.INGEST_POLL_SECONDS,
+                            help="Seconds to sleep when the queue is empty.")
+
+    def handle(self, *args, **opts):
+        next_prune = time.monotonic()
+        while True:
+            n = jobs.run_pending()
+            if n:
+                self.stdout.write(f"processed {n} job(s)")
+            if settings.RETENTION_INTERVAL_SECONDS and time.monotonic() >= next_prune:
+                result = retention.prune()
+                if result.rows or result.orphans or result.sessions:
+                    self.stdout.write(str(result))
+                next_prune = time.monotonic() + settings.RETENTION_INTERVAL_SECONDS
+            close_old_connections()
+            if opts["once"]:
+                break
+            time.sleep(opts["poll"])
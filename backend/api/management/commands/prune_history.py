@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import retention
+
+
+class Command(BaseCommand):
+    help = "Delete upload history past the retention limits, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.RETENTION_BATCH_SIZE,
+                            help="Rows deleted per transaction.")
+        parser.add_argument("--max-batches", type=int, default=None,
+                            help="Stop after this many batches.")
+        parser.add_argument("--no-sweep", action="store_true",
+                            help="Skip removing orphaned column stores.")
+
+    def handle(self, *args, **opts):
+        result = retention.prune(
+            batch_size=opts["batch_size"],
+            max_batches=opts["max_batches"],
+            sweep=not opts["no_sweep"],
+        )
+        self.stdout.write(str(result))
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadhistory',
+            name='columns_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_columns_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='uploadhistory',
+            index=models.Index(fields=['-uploaded_at', '-id'], name='uploadhistory_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+def move_state(apps, schema_editor):
+    # summaries up to schema version 3 carry their state inline
+    for name in ("UploadHistory", "ContentDigest"):
+        model = apps.get_model("api", name)
+        batch = []
+        for row in model.objects.filter(summary__has_key="state").iterator(chunk_size=500):
+            row.state = row.summary.pop("state")
+            row.summary["schema_version"] = 4
+            batch.append(row)
+            if len(batch) == 500:
+                model.objects.bulk_update(batch, ["summary", "state"])
+                batch = []
+        model.objects.bulk_update(batch, ["summary", "state"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contentdigest',
+            name='state',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadhistory',
+            name='state',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(move_state, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,104 @@
+import uuid
+
 from django.db import models
 
+
+class SummaryStateManager(models.Manager):
+    """Leaves the mergeable summary state unloaded; only /api/aggregate/
+    and dedup read it, and it can be far larger than the summary."""
+
+    def get_queryset(self):
+        return super().get_queryset().defer("state")
+
+
 class UploadHistory(models.Model):
     filename = models.CharField(max_length=255)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     summary = models.JSONField()
+    # SummaryAccumulator.state(), for merging uploads without their rows
+    state = models.JSONField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # name of the upload's column store under COLUMN_STORE_DIR
+    columns_path = models.CharField(max_length=255, blank=True)
+
+    objects = SummaryStateManager()
+
+    class Meta:
+        indexes = [
+            # keyset pagination and retention walk (uploaded_at, id) newest first
+            models.Index(fields=["-uploaded_at", "-id"], name="uploadhistory_recent_idx"),
+        ]
+
+
+class ContentDigest(models.Model):
+    # summary of a CSV keyed by the SHA-256 of its bytes
+    sha256 = models.CharField(max_length=64, unique=True)
+    summary = models.JSONField()
+    state = models.JSONField(null=True, blank=True)
+    hits = models.PositiveIntegerField(default=0)
+    misses = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = SummaryStateManager()
+
+
+class IngestJob(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    filename = models.CharField(max_length=255)
+    path = models.CharField(max_length=1024)
+    content_hash = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    error = models.TextField(blank=True)
+    upload = models.ForeignKey(UploadHistory, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # touched while the job runs; see jobs.requeue_stale()
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+
+class UploadSession(models.Model):
+    """A resumable upload: chunks are written into a file under
+    INGEST_SPOOL_DIR until finalize hands it to the ingestion queue."""
+
+    OPEN = "open"
+    FINALIZED = "finalized"
+    STATUS_CHOICES = [
+        (OPEN, "Open"),
+        (FINALIZED, "Finalized"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    path = models.CharField(max_length=1024)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=OPEN)
+    job = models.ForeignKey(IngestJob, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def chunk_count(self):
+        return -(-self.size // self.chunk_size)
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name="chunks")
+    index = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["session", "index"], name="uploadchunk_unique_index"),
+        ]
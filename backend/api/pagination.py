@@ -0,0 +1,30 @@
+"""Opaque keyset cursors over (uploaded_at, id)."""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(row):
+    raw = f"{row.uploaded_at.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(uploaded_at, id) from a cursor; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        when, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(when), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def older_than(cursor):
+    when, pk = decode_cursor(cursor)
+    return Q(uploaded_at__lt=when) | Q(uploaded_at=when, id__lt=pk)
+
+
+def newer_than(cursor):
+    when, pk = decode_cursor(cursor)
+    return Q(uploaded_at__gt=when) | Q(uploaded_at=when, id__gt=pk)
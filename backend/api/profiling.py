@@ -0,0 +1,210 @@
+"""Opt-in per-request profiling for staff users.
+
+A request with `X-Profile: 1` (or `?profile=1`) from a staff user is run
+under cProfile and tracemalloc. The result is stored under its request id
+(the client's X-Request-ID, else a fresh one, echoed in X-Profile-Id) as
+a pstats dump plus a JSON summary, in a DiskLRUCache bounded by
+PROFILE_MAX_BYTES. /api/profiles/ lists them; /api/profiles/<id>/
+downloads the dump (`python -m pstats`, snakeviz, ...).
+
+Without the flag the middleware costs one dict lookup and a substring
+test. One request is profiled at a time per process; a flagged request
+arriving while another is profiled runs normally. Under ASGI the
+profiler sees the whole event loop, so a profile taken while other
+requests were in flight includes some of their work too.
+"""
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+
+from .diskcache import DiskLRUCache
+from .http import authenticate
+
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 10
+
+_id_re = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_lock = threading.Lock()
+
+
+def profile_store():
+    return DiskLRUCache(settings.PROFILE_DIR, settings.PROFILE_MAX_BYTES)
+
+
+def requested(request):
+    if request.META.get("HTTP_X_PROFILE") == "1":
+        return True
+    return "profile" in request.META.get("QUERY_STRING", "") and request.GET.get("profile") == "1"
+
+
+def _is_staff(request):
+    # runs before DRF authenticates the view, so try its authenticators
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        user = authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return user is not None and user.is_staff
+
+
+def request_id(request):
+    given = request.headers.get("X-Request-ID", "")
+    return given if _id_re.match(given) else uuid.uuid4().hex
+
+
+def top_functions(profile, limit=TOP_FUNCTIONS):
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "own_seconds": own,
+            "cumulative_seconds": cumulative,
+        })
+    rows.sort(key=lambda r: r["cumulative_seconds"], reverse=True)
+    return rows[:limit]
+
+
+def top_allocations(snapshot, limit=TOP_ALLOCATIONS):
+    return [
+        {"location": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+def save(profile_id, request, response, profile, seconds, peak, snapshot):
+    profile.create_stats()
+    # before top_functions(): pstats.Stats() empties profile.stats
+    dump = marshal.dumps(profile.stats)
+    summary = {
+        "id": profile_id,
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "seconds": seconds,
+        "peak_memory_bytes": peak,
+        "created": time.time(),
+        "top_functions": top_functions(profile),
+        "top_allocations": top_allocations(snapshot),
+    }
+    store = profile_store()
+    store.put(f"{profile_id}.prof", dump)
+    store.put(f"{profile_id}.json", json.dumps(summary).encode())
+    return summary
+
+
+def summaries():
+    """Stored profile summaries, newest first."""
+    store = profile_store()
+    found = []
+    for key in store.keys():
+        if key.endswith(".json"):
+            try:
+                with open(store.path(key)) as f:
+                    found.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # evicted or half-written
+    found.sort(key=lambda s: s["created"], reverse=True)
+    return found
+
+
+def dump_path(profile_id):
+    if not _id_re.match(profile_id):
+        return None
+    return profile_store().get(f"{profile_id}.prof")
+
+
+class _Run:
+    """One profiled request: starts and stops cProfile and tracemalloc."""
+
+    def __init__(self, request):
+        self.request = request
+        self.id = request_id(request)
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        # leave tracemalloc alone if something else already started it
+        self.owns_tracing = not tracemalloc.is_tracing()
+        if self.owns_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.started = time.perf_counter()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.seconds = time.perf_counter() - self.started
+        try:
+            self.peak = tracemalloc.get_traced_memory()[1]
+            self.snapshot = tracemalloc.take_snapshot()
+        finally:
+            if self.owns_tracing:
+                tracemalloc.stop()
+
+    def save(self, response):
+        save(self.id, self.request, response, self.profile, self.seconds, self.peak, self.snapshot)
+        response["X-Profile-Id"] = self.id
+        return response
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not requested(request) or not _is_staff(request):
+            return self.get_response(request)
+        if not _lock.acquire(blocking=False):
+            return self.busy(self.get_response(request))
+        try:
+            run = _Run(request)
+            run.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                run.stop()
+            return run.save(response)
+        finally:
+            _lock.release()
+
+    async def __acall__(self, request):
+        if not requested(request) or not await sync_to_async(_is_staff)(request):
+            return await self.get_response(request)
+        if not _lock.acquire(blocking=False):
+            return self.busy(await self.get_response(request))
+        try:
+            run = _Run(request)
+            run.start()
+            try:
+                response = await self.get_response(request)
+            finally:
+                run.stop()
+            return await sync_to_async(run.save)(response)
+        finally:
+            _lock.release()
+
+    @staticmethod
+    def busy(response):
+        response["X-Profile"] = "busy"
+        return response
@@ -0,0 +1,210 @@
+"""PDF reports for an upload.
+
+A report has the upload's totals, its Type distribution, a statistics
+table per numeric column (overall and per Type), a histogram of each
+column read from the upload's column store, and trend charts of the
+per-upload averages up to and including this upload. Long tables flow
+over as many pages as they need, repeating their header row.
+
+Rendered reports are cached on disk by upload id (REPORT_CACHE_DIR) and
+served from the file; the histogram data is cached separately by
+charts.py, so every report on the same rows reuses it.
+"""
+import hashlib
+import os
+from datetime import timezone
+from xml.sax.saxutils import escape
+
+import numpy as np
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import KeepTogether, LongTable, Paragraph, SimpleDocTemplate, Spacer, TableStyle
+
+from . import charts, instrument, schema, storage
+from .diskcache import DiskLRUCache
+from .downsample import lttb
+from .ingest import NUMERIC_COLUMNS
+from .models import UploadHistory
+
+# Bump when the layout below changes so cached PDFs are not reused.
+REPORT_TEMPLATE_VERSION = 2
+
+# uploads read for the trend charts, and the points each chart keeps
+TREND_UPLOADS = 5000
+TREND_POINTS = 200
+
+STYLES = getSampleStyleSheet()
+TABLE_STYLE = TableStyle([
+    ("FONT", (0, 0), (-1, 0), "Helvetica-Bold", 9),
+    ("FONT", (0, 1), (-1, -1), "Helvetica", 9),
+    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E8EDF3")),
+    ("LINEBELOW", (0, 0), (-1, 0), 0.5, colors.grey),
+    ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#F7F9FB")]),
+    ("ALIGN", (1, 0), (-1, -1), "RIGHT"),
+])
+STAT_COLUMNS = ["count", "mean", "std", "min", "p50", "p95", "max"]
+
+
+def report_cache():
+    return DiskLRUCache(settings.REPORT_CACHE_DIR, settings.REPORT_CACHE_MAX_BYTES)
+
+
+def report_key(upload):
+    return f"report-{upload.id if upload else 'empty'}-v{REPORT_TEMPLATE_VERSION}.pdf"
+
+
+def report_etag(path):
+    """Strong ETag of a rendered report: the SHA-256 of its bytes.
+
+    Not the cache key: the trend charts change once retention removes
+    earlier uploads, so a later re-render may differ under the same key.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return f'"{h.hexdigest()}"'
+
+
+def cached_path(upload):
+    """Path of the cached report for `upload`, or None on a miss."""
+    return report_cache().get(report_key(upload))
+
+
+def cached_report(upload):
+    """Path of the rendered report for `upload`, rendering it on a miss."""
+    path = cached_path(upload)
+    if path is None:
+        path = render_cached(upload, trend_series(upload) if upload else None)
+    return path
+
+
+def render_cached(upload, trend):
+    """Render the report straight into its cache file; returns the path.
+
+    Uses no ORM, so async views can run it on a worker thread."""
+    with instrument.span("render") as span:
+        path = report_cache().write(report_key(upload), lambda f: render_report(f, upload, trend))
+        span.count(bytes=os.path.getsize(path))
+    return path
+
+
+def _trend_query(upload):
+    # this upload and the ones before it, so later uploads leave the
+    # cached report valid
+    earlier = UploadHistory.objects.filter(uploaded_at__lt=upload.uploaded_at)
+    tie = UploadHistory.objects.filter(uploaded_at=upload.uploaded_at, id__lte=upload.id)
+    keys = [f"summary__{key}" for key in NUMERIC_COLUMNS.values()]
+    return (earlier | tie).order_by("-uploaded_at", "-id").values_list("uploaded_at", *keys)[:TREND_UPLOADS]
+
+
+def _trend(rows):
+    """{column: (epoch seconds, averages)} with at most TREND_POINTS each."""
+    rows = rows[::-1]
+    times = np.array([r[0].astimezone(timezone.utc).timestamp() for r in rows], dtype="float64")
+    out = {}
+    for i, col in enumerate(NUMERIC_COLUMNS, start=1):
+        y = np.array([np.nan if r[i] is None else r[i] for r in rows], dtype="float64")
+        keep = ~np.isnan(y)
+        x, y = times[keep], y[keep]
+        idx = lttb(x, y, TREND_POINTS)
+        out[col] = (x[idx], y[idx])
+    return out
+
+
+def trend_series(upload):
+    return _trend(list(_trend_query(upload)))
+
+
+async def atrend_series(upload):
+    return _trend([row async for row in _trend_query(upload)])
+
+
+def _fmt(value):
+    if value is None:
+        return "-"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return f"{value:,.2f}"
+
+
+def _table(rows, widths=None):
+    table = LongTable(rows, colWidths=widths, repeatRows=1, hAlign="LEFT")
+    table.setStyle(TABLE_STYLE)
+    return table
+
+
+def _page_number(canvas, doc):
+    canvas.saveState()
+    canvas.setFont("Helvetica", 8)
+    canvas.drawRightString(A4[0] - 18 * mm, 10 * mm, f"Page {doc.page}")
+    canvas.restoreState()
+
+
+def render_report(out, upload, trend=None):
+    """Write the PDF for `upload` (None: the empty-state report) to the
+    file object `out`. `trend` is trend_series(upload)."""
+    # invariant=True keeps the bytes identical across renders of the same
+    # content, so the ETag survives the cached file being evicted
+    doc = SimpleDocTemplate(out, pagesize=A4, invariant=True, title="CSV Report",
+                            leftMargin=18 * mm, rightMargin=18 * mm, topMargin=18 * mm, bottomMargin=18 * mm)
+    story = [Paragraph("CSV Report", STYLES["Title"])]
+    if not upload:
+        # still a valid PDF (not JSON), just with a message inside
+        story.append(Paragraph("No uploads yet.", STYLES["Normal"]))
+        doc.build(story)
+        return
+
+    s = upload.summary or {}
+    units = schema.EQUIPMENT.units()
+    story += [
+        Paragraph(f"File: {escape(upload.filename)}", STYLES["Normal"]),
+        Paragraph(f"Uploaded at: {upload.uploaded_at}", STYLES["Normal"]),
+        Spacer(0, 6 * mm),
+        Paragraph("Summary", STYLES["Heading2"]),
+    ]
+    kpis = [["Measure", "Value"], ["Total equipment", _fmt(s.get("total_equipment"))]]
+    for col, key in NUMERIC_COLUMNS.items():
+        kpis.append([f"Average {col.lower()} ({units.get(col, '-')})", _fmt(s.get(key))])
+    story.append(_table(kpis, widths=[70 * mm, 40 * mm]))
+
+    dist = s.get("type_distribution") or {}
+    story.append(Paragraph("Type distribution", STYLES["Heading2"]))
+    if dist:
+        total = sum(dist.values()) or 1
+        rows = [["Type", "Count", "Share"]]
+        rows += [[name, _fmt(n), f"{100 * n / total:.1f}%"] for name, n in dist.items()]
+        story.append(_table(rows, widths=[70 * mm, 30 * mm, 25 * mm]))
+    else:
+        story.append(Paragraph("No type distribution found.", STYLES["Normal"]))
+
+    stats = s.get("stats") or {}
+    store = storage.open_columns(upload)
+    for col in NUMERIC_COLUMNS:
+        unit = units.get(col)
+        story.append(Paragraph(f"{col} ({unit})" if unit else col, STYLES["Heading2"]))
+        overall = (stats.get("overall") or {}).get(col)
+        if overall is None:
+            story.append(Paragraph("No statistics for this upload.", STYLES["Normal"]))
+        else:
+            rows = [["Type", "Count", "Mean", "Std", "Min", "P50", "P95", "Max"]]
+            rows.append(["All"] + [_fmt(overall.get(k)) for k in STAT_COLUMNS])
+            for name, cols in (stats.get("by_type") or {}).items():
+                st = cols.get(col) or {}
+                rows.append([name] + [_fmt(st.get(k)) for k in STAT_COLUMNS])
+            story.append(_table(rows, widths=[44 * mm] + [18 * mm] * 7))
+        chart = charts.histogram(upload.columns_path, store, col, unit)
+        if chart:
+            story += [Spacer(0, 3 * mm), chart]
+
+    trends = [charts.trend(col, *trend[col], units.get(col)) for col in NUMERIC_COLUMNS] if trend else []
+    trends = [chart for chart in trends if chart]
+    if trends:
+        story.append(Paragraph("History", STYLES["Heading2"]))
+        for chart in trends:
+            story.append(KeepTogether([chart, Spacer(0, 3 * mm)]))
+
+    doc.build(story, onFirstPage=_page_number, onLaterPages=_page_number)
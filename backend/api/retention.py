@@ -0,0 +1,131 @@
+"""History retention, applied in the background.
+
+Expired UploadHistory rows are deleted oldest-first in bounded batches,
+each in its own transaction, so a large backlog never holds a long write
+lock or a huge IN (...) list. Column stores and cached reports of deleted
+rows are removed once each batch commits (see storage / caching), and
+stale resumable upload sessions are dropped.
+"""
+import logging
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import instrument, sessions, storage
+from .models import UploadHistory
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class PruneResult:
+    rows: int = 0
+    batches: int = 0
+    orphans: int = 0
+    sessions: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (f"removed {self.rows} row(s) in {self.batches} batch(es), "
+                f"{self.orphans} orphaned store(s), {self.sessions} stale upload session(s), "
+                f"{self.seconds:.2f}s")
+
+
+def expired():
+    """Q matching rows past HISTORY_RETENTION_COUNT / HISTORY_RETENTION_DAYS (0 = no limit)."""
+    q = Q(pk__in=[])
+    if settings.HISTORY_RETENTION_COUNT:
+        # the newest row past the limit; it and everything older goes
+        edge = (
+            UploadHistory.objects.order_by("-uploaded_at", "-id")
+            .values_list("uploaded_at", "id")[settings.HISTORY_RETENTION_COUNT:settings.HISTORY_RETENTION_COUNT + 1]
+            .first()
+        )
+        if edge:
+            q |= Q(uploaded_at__lt=edge[0]) | Q(uploaded_at=edge[0], id__lte=edge[1])
+    if settings.HISTORY_RETENTION_DAYS:
+        q |= Q(uploaded_at__lt=timezone.now() - timedelta(days=settings.HISTORY_RETENTION_DAYS))
+    return q
+
+
+def prune(batch_size=None, max_batches=None, sweep=True):
+    """Delete expired history rows; returns a PruneResult.
+
+    The cut-off is computed once up front, so uploads arriving while the
+    prune runs are not affected by it.
+    """
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    result = PruneResult()
+    started = time.monotonic()
+    cutoff = expired()
+    while max_batches is None or result.batches < max_batches:
+        with instrument.span("retention_delete") as span, transaction.atomic():
+            ids = list(
+                UploadHistory.objects.filter(cutoff)
+                .order_by("uploaded_at", "id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            UploadHistory.objects.filter(id__in=ids).delete()
+            span.count(rows=len(ids))
+        result.rows += len(ids)
+        result.batches += 1
+    if sweep:
+        result.orphans = sweep_orphans()
+        result.sessions = sweep_sessions()
+    result.seconds = time.monotonic() - started
+    if result.rows or result.orphans or result.sessions:
+        log.info("retention: %s", result)
+    return result
+
+
+def sweep_orphans():
+    """Remove column stores nothing references (e.g. left by a crash)."""
+    paths = storage.orphaned_columns()
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+    return len(paths)
+
+
+def sweep_sessions():
+    """Remove resumable uploads idle, or finalized, for UPLOAD_SESSION_TTL_HOURS."""
+    stale = list(sessions.expired())
+    for session in stale:
+        sessions.remove(session)
+    return len(stale)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _scheduler_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            with instrument.trace("retention"):
+                prune()
+        except Exception:
+            log.exception("retention prune failed")
+        finally:
+            close_old_connections()
+
+
+def start_scheduler(interval=None):
+    """Run prune() every `interval` seconds on a daemon thread (idempotent)."""
+    global _scheduler
+    interval = interval or settings.RETENTION_INTERVAL_SECONDS
+    with _scheduler_lock:
+        if _scheduler is None and interval:
+            _scheduler = threading.Thread(
+                target=_scheduler_loop, args=(interval,), name="retention", daemon=True
+            )
+            _scheduler.start()
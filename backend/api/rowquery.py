@@ -0,0 +1,132 @@
+"""Filtered, sorted, paginated reads from a column store.
+
+Predicates are first checked against each block's zone map, so blocks that
+cannot match are never read; surviving blocks are filtered with NumPy.
+"""
+import numpy as np
+
+from .columns import DICT, FLOAT
+
+
+def _candidate_blocks(store, equals, ranges):
+    keep = np.ones(store.blocks, dtype=bool)
+    for name, code in equals.items():
+        zones = store.zones(name)
+        if zones:
+            keep &= np.array([code in codes for codes in zones["codes"]], dtype=bool)
+    for name, (lo, hi) in ranges.items():
+        zones = store.zones(name)
+        if not zones:
+            continue
+        # None = block has no values, so it cannot match a range
+        mins = np.array([np.nan if v is None else v for v in zones["min"]])
+        maxs = np.array([np.nan if v is None else v for v in zones["max"]])
+        ok = ~np.isnan(mins)
+        if lo is not None:
+            ok &= maxs >= lo
+        if hi is not None:
+            ok &= mins <= hi
+        keep &= ok
+    return np.flatnonzero(keep)
+
+
+def _runs(blocks):
+    """Group consecutive block numbers into (first, last) runs."""
+    if not len(blocks):
+        return []
+    breaks = np.flatnonzero(np.diff(blocks) != 1)
+    firsts = np.r_[blocks[0], blocks[breaks + 1]]
+    lasts = np.r_[blocks[breaks], blocks[-1]]
+    return list(zip(firsts.tolist(), lasts.tolist()))
+
+
+def match_positions(store, equals=None, ranges=None):
+    """Row numbers matching every predicate, plus the number of blocks read.
+
+    `equals` maps dict columns to a value, `ranges` maps float columns to an
+    inclusive (lo, hi) where either bound may be None.
+    """
+    equals = equals or {}
+    ranges = ranges or {}
+
+    codes = {}
+    strings = {}
+    for name, value in equals.items():
+        if store.kind(name) != DICT:
+            strings[name] = value  # no dictionary: compare decoded values
+            continue
+        try:
+            codes[name] = store.dictionary(name).index(value)
+        except ValueError:
+            return np.empty(0, dtype=np.int64), 0
+
+    blocks = _candidate_blocks(store, codes, ranges)
+    block_rows = store.meta["zones"]["block_rows"]
+    cols = {name: store.column(name) for name in list(codes) + list(ranges)}
+
+    found = []
+    for first, last in _runs(blocks):
+        start, end = first * block_rows, min((last + 1) * block_rows, store.rows)
+        mask = np.ones(end - start, dtype=bool)
+        for name, code in codes.items():
+            mask &= cols[name][start:end] == code
+        for name, value in strings.items():
+            mask &= np.array(store.strings(name, np.arange(start, end)), dtype=object) == value
+        for name, (lo, hi) in ranges.items():
+            values = cols[name][start:end]
+            if lo is not None:
+                mask &= values >= lo
+            if hi is not None:
+                mask &= values <= hi
+        found.append(start + np.flatnonzero(mask))
+
+    positions = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+    return positions, len(blocks)
+
+
+def order_page(store, positions, sort, offset, limit):
+    """The `limit` positions starting at `offset` after sorting by `sort`.
+
+    `sort` is a column name, optionally prefixed with "-" for descending;
+    missing values sort last either way.
+    """
+    if not sort:
+        return positions[offset:offset + limit]
+
+    desc = sort.startswith("-")
+    name = sort.lstrip("-")
+    keys = store.column(name)[positions]
+    if store.kind(name) == FLOAT:
+        keys = np.where(np.isnan(keys), -np.inf if desc else np.inf, keys)
+    elif store.kind(name) != DICT:
+        # rank the decoded values of just these rows; None sorts last
+        values = store.strings(name, positions)
+        present = [v for v in values if v is not None]
+        order = {v: i for i, v in enumerate(sorted(set(present)))}
+        missing = len(order) if not desc else -1
+        keys = np.array([missing if v is None else order[v] for v in values], dtype="int64")
+    else:
+        # order dict codes by their decoded value; -1 (missing) sorts last
+        ranks = np.argsort(np.argsort(np.array(store.dictionary(name), dtype=object)))
+        ranks = np.r_[ranks, len(ranks) if not desc else -1]
+        keys = ranks[keys]
+    if desc:
+        keys = -keys
+
+    need = offset + limit
+    if need < len(keys):
+        top = np.argpartition(keys, need - 1)[:need]
+        top = top[np.argsort(keys[top], kind="stable")]
+    else:
+        top = np.argsort(keys, kind="stable")
+    return positions[top[offset:need]]
+
+
+def fetch_rows(store, positions, fields):
+    out = {}
+    for name in fields:
+        if store.kind(name) == FLOAT:
+            out[name] = [None if np.isnan(v) else float(v) for v in store.column(name)[positions]]
+        else:
+            out[name] = store.strings(name, positions)
+    return [dict(zip(fields, row)) for row in zip(*(out[f] for f in fields))]
@@ -0,0 +1,215 @@
+"""Declared layouts of the CSVs we accept.
+
+A Schema lists the columns a file must (or may) have, with their dtype and
+unit. The parser reads only declared columns with explicit dtypes, so
+nothing is inferred and unused columns are never parsed, and a file that
+does not fit is rejected up front with a SchemaError listing every
+problem.
+"""
+import csv
+import io
+import os
+from dataclasses import dataclass
+
+import pandas as pd
+
+from . import compressed
+
+try:
+    from pyarrow import csv as pa_csv
+    import pyarrow as pa
+except ImportError:  # optional; pandas' C parser is used instead
+    pa = pa_csv = None
+
+FLOAT = "float64"
+CATEGORY = "category"
+STRING = "str"
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    dtype: str
+    unit: str = ""
+    required: bool = True
+
+
+@dataclass(frozen=True)
+class Schema:
+    name: str
+    columns: tuple
+
+    def check(self, names):
+        """Columns of this schema present in header `names`, in schema order.
+
+        Raises SchemaError if a required column is missing or the header
+        repeats a declared column.
+        """
+        errors = []
+        for col in self.columns:
+            n = names.count(col.name)
+            if not n and col.required:
+                errors.append(_error("missing_column", col.name, f"Missing required column '{col.name}'."))
+            elif n > 1:
+                errors.append(_error("duplicate_column", col.name, f"Column '{col.name}' appears {n} times."))
+        if errors:
+            raise SchemaError(errors)
+        return [col for col in self.columns if col.name in names]
+
+    def units(self):
+        return {col.name: col.unit for col in self.columns if col.unit}
+
+
+class SchemaError(ValueError):
+    """A CSV does not match its schema; `errors` is a list of dicts with
+    "code", "column" (may be None) and "message"."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(" ".join(e["message"] for e in errors))
+
+    def __reduce__(self):
+        # keep `errors` when raised in a pool worker
+        return type(self), (self.errors,)
+
+
+def _error(code, column, message):
+    return {"code": code, "column": column, "message": message}
+
+
+_registry = {}
+
+
+def register(schema):
+    _registry[schema.name] = schema
+    return schema
+
+
+def get(name="equipment"):
+    return _registry[name]
+
+
+EQUIPMENT = register(Schema("equipment", (
+    Column("Equipment Name", STRING, required=False),
+    Column("Type", CATEGORY),
+    Column("Flowrate", FLOAT, unit="m3/h"),
+    Column("Pressure", FLOAT, unit="bar"),
+    Column("Temperature", FLOAT, unit="degC"),
+)))
+
+
+def read_header(f):
+    """Column names from the first line of a path or seekable file.
+
+    Compressed paths (see compressed.py) are read through the decompressor.
+
+    Parsed with the csv module rather than pandas, which would rename
+    repeated names ("Type", "Type.1") and hide the duplicate.
+    """
+    if isinstance(f, (str, os.PathLike)):
+        try:
+            with compressed.open_stream(f) as fh:
+                line = fh.readline()
+        except compressed.UnsupportedCompression as e:
+            raise SchemaError([_error("unsupported_compression", None, str(e))])
+        except compressed.ERRORS as e:
+            raise SchemaError([_error("unreadable", None, f"Could not decompress the file: {e}")])
+    else:
+        pos = f.tell()
+        line = f.readline()
+        f.seek(pos)
+    try:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise SchemaError([_error("unreadable", None, f"Could not read the header: {e}")])
+    if not line.strip():
+        raise SchemaError([_error("empty_file", None, "The file is empty.")])
+    return next(csv.reader([line]))
+
+
+def arrow_available():
+    return pa_csv is not None
+
+
+def read_chunks(f, schema, chunksize, names=None, engine="auto"):
+    """Iterate DataFrames of about `chunksize` rows holding `schema`'s columns.
+
+    Without `names` the first line of `f` is the header; with it `f` has no
+    header and `names` are its columns (a byte range of a larger file).
+    A compressed path is decompressed as it is read. `engine` is "c",
+    "pyarrow" or "auto" (pyarrow if installed and `f` is not a text
+    stream). Bad values raise SchemaError while iterating.
+    """
+    header = names if names is not None else read_header(f)
+    cols = schema.check(header)
+    kind = compressed.detect(f) if isinstance(f, (str, os.PathLike)) else None
+    if engine == "pyarrow" or (engine == "auto" and arrow_available() and not isinstance(f, io.TextIOBase)):
+        return _ArrowChunks(f, cols, names, chunksize, kind)
+    reader = pd.read_csv(
+        f,
+        compression=kind,
+        names=names,
+        header=None if names is not None else "infer",
+        usecols=[c.name for c in cols],
+        dtype={c.name: c.dtype for c in cols},
+        chunksize=chunksize,
+    )
+    return _Chunks(reader)
+
+
+class _Chunks:
+    """Wraps a chunk iterator so parse failures surface as SchemaError."""
+
+    def __init__(self, reader):
+        self._reader = reader
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._reader.close()
+
+    def __iter__(self):
+        it = iter(self._reader)
+        while True:
+            try:
+                chunk = next(it)
+            except StopIteration:
+                return
+            except (ValueError,) + compressed.ERRORS as e:
+                raise SchemaError([_error("bad_value", None, f"Could not parse the file: {e}")]) from e
+            yield chunk
+
+
+class _ArrowChunks(_Chunks):
+    # pyarrow splits by bytes; this is roughly `chunksize` rows of equipment data
+    BYTES_PER_ROW = 48
+
+    def __init__(self, f, cols, names, chunksize, kind=None):
+        types = {
+            FLOAT: pa.float64(),
+            CATEGORY: pa.dictionary(pa.int32(), pa.string()),
+            STRING: pa.string(),
+        }
+        self._own = isinstance(f, (str, os.PathLike))
+        self._f = compressed.open_stream(f, kind) if self._own else f
+        try:
+            reader = pa_csv.open_csv(
+                self._f,
+                read_options=pa_csv.ReadOptions(
+                    column_names=names, block_size=max(1 << 20, chunksize * self.BYTES_PER_ROW)
+                ),
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=[c.name for c in cols],
+                    column_types={c.name: types[c.dtype] for c in cols},
+                ),
+            )
+        except ValueError as e:  # includes pyarrow.ArrowInvalid
+            self.__exit__()
+            raise SchemaError([_error("bad_value", None, f"Could not parse the file: {e}")]) from e
+        super().__init__(batch.to_pandas() for batch in reader)
+
+    def __exit__(self, *exc):
+        if self._own:
+            self._f.close()
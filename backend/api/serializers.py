@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import UploadHistory
+from .pagination import decode_cursor
+from django.conf import settings
+from .models import IngestJob, UploadHistory, UploadSession
 
 class UploadCSVSerializer(serializers.Serializer):
     file = serializers.FileField()
@@ -8,4 +10,82 @@ class UploadHistorySerializer(serializers.ModelSerializer):
     uploaded_at = serializers.DateTimeField(format="%d %b %Y, %I:%M %p", read_only=True)
     class Meta:
         model = UploadHistory
-        fields = ["id", "filename", "uploaded_at", "summary"]
\ No newline at end of file
+        fields = ["id", "filename", "uploaded_at", "summary"]
+
+class IngestJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = IngestJob
+        fields = ["id", "filename", "status", "error", "upload", "created_at", "started_at", "finished_at"]
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    chunk_size = serializers.IntegerField(required=False, min_value=1)
+
+    def validate_size(self, value):
+        if value > settings.UPLOAD_SESSION_MAX_BYTES:
+            raise serializers.ValidationError(f"size must be at most {settings.UPLOAD_SESSION_MAX_BYTES}.")
+        return value
+
+    def validate_chunk_size(self, value):
+        if value > settings.UPLOAD_CHUNK_MAX_BYTES:
+            raise serializers.ValidationError(f"chunk_size must be at most {settings.UPLOAD_CHUNK_MAX_BYTES}.")
+        return value
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ["id", "filename", "size", "chunk_size", "status", "job", "created_at"]
+
+
+class AggregateQuerySerializer(serializers.Serializer):
+    ids = serializers.CharField(required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    last = serializers.IntegerField(required=False, min_value=1, max_value=100_000)
+
+    def validate_ids(self, value):
+        try:
+            return [int(v) for v in value.split(",") if v.strip()]
+        except ValueError:
+            raise serializers.ValidationError("ids must be a comma-separated list of integers.")
+
+
+class RowQuerySerializer(serializers.Serializer):
+    type = serializers.CharField(required=False)
+    flowrate_min = serializers.FloatField(required=False)
+    flowrate_max = serializers.FloatField(required=False)
+    pressure_min = serializers.FloatField(required=False)
+    pressure_max = serializers.FloatField(required=False)
+    temperature_min = serializers.FloatField(required=False)
+    temperature_max = serializers.FloatField(required=False)
+    sort = serializers.CharField(required=False)
+    fields = serializers.CharField(required=False)
+    offset = serializers.IntegerField(required=False, default=0, min_value=0)
+    limit = serializers.IntegerField(required=False, default=100, min_value=1, max_value=1000)
+
+
+class SeriesQuerySerializer(serializers.Serializer):
+    upload = serializers.IntegerField(required=False)
+    column = serializers.ChoiceField(choices=["Flowrate", "Pressure", "Temperature"])
+    budget = serializers.IntegerField(required=False, default=1000, min_value=3, max_value=20_000)
+    method = serializers.ChoiceField(choices=["lttb", "minmax"], required=False, default="lttb")
+
+
+class HistoryQuerySerializer(serializers.Serializer):
+    limit = serializers.IntegerField(required=False, default=5, min_value=1, max_value=100)
+    cursor = serializers.CharField(required=False)
+    since = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        if "cursor" in attrs and "since" in attrs:
+            raise serializers.ValidationError("Use either cursor or since, not both.")
+        for field in ("cursor", "since"):
+            if field in attrs:
+                try:
+                    decode_cursor(attrs[field])
+                except ValueError:
+                    raise serializers.ValidationError({field: "Invalid cursor."})
+        return attrs
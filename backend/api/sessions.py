@@ -0,0 +1,130 @@
+"""Resumable chunked uploads.
+
+A session pre-allocates a file in the spool directory; each chunk is
+written at its own offset, so chunks may arrive in any order and in
+parallel. A chunk is staged in a temporary file and only copied in, and
+recorded, once its SHA-256 matched, so a corrupt resend of a chunk that
+already arrived cannot overwrite the good bytes. When
+every chunk is in, finalize() hands the file to the ingestion queue like
+a regular upload.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadChunk, UploadSession
+
+
+class ChunkError(Exception):
+    """A chunk does not fit its session (bad offset, length or checksum)."""
+
+
+def sessions_dir():
+    return os.path.join(settings.INGEST_SPOOL_DIR, "sessions")
+
+
+def create(filename, size, chunk_size=None):
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_BYTES
+    os.makedirs(sessions_dir(), exist_ok=True)
+    session = UploadSession(filename=filename, size=size, chunk_size=chunk_size)
+    session.path = os.path.join(sessions_dir(), f"{session.id.hex}.part")
+    with open(session.path, "wb") as f:
+        f.truncate(size)  # sparse; chunks fill it in
+    session.save()
+    return session
+
+
+def received(session):
+    return set(session.chunks.values_list("index", flat=True))
+
+
+def progress(session):
+    """The contiguous byte offset received so far and the missing chunk numbers."""
+    have = received(session)
+    n = 0
+    while n in have:
+        n += 1
+    missing = [i for i in range(session.chunk_count) if i not in have]
+    return min(n * session.chunk_size, session.size), missing
+
+
+def write_chunk(session, offset, stream, sha256):
+    """Write the chunk starting at `offset`, read from `stream` (.read(n)).
+
+    The bytes are staged in a temporary file while hashing and only copied
+    into the session file if the digest matches `sha256` (hex). A chunk
+    that fails the check is no longer counted as received, so a bad resend
+    shows up as missing again.
+    """
+    if offset < 0 or offset >= session.size or offset % session.chunk_size:
+        raise ChunkError(f"offset must be a multiple of {session.chunk_size} below {session.size}")
+    index = offset // session.chunk_size
+    expected = min(session.chunk_size, session.size - offset)
+
+    h = hashlib.sha256()
+    written = 0
+    with tempfile.TemporaryFile(dir=sessions_dir()) as staged:
+        while written <= expected:
+            block = stream.read(min(1 << 20, expected + 1 - written))
+            if not block:
+                break
+            h.update(block)
+            staged.write(block[:max(0, expected - written)])
+            written += len(block)
+        try:
+            if written != expected:
+                raise ChunkError(f"chunk at {offset} must be {expected} bytes, got {written}")
+            if h.hexdigest() != sha256.lower():
+                raise ChunkError(f"checksum mismatch for chunk at {offset}")
+        except ChunkError:
+            UploadChunk.objects.filter(session=session, index=index).delete()
+            raise
+
+        staged.seek(0)
+        with open(session.path, "r+b") as f:
+            f.seek(offset)
+            shutil.copyfileobj(staged, f, 1 << 20)
+
+    UploadChunk.objects.update_or_create(session=session, index=index, defaults={"sha256": h.hexdigest()})
+    UploadSession.objects.filter(id=session.id).update(updated_at=timezone.now())
+    return index
+
+
+def claim_for_finalize(session):
+    """Mark a complete session finalized; returns False if another request won."""
+    if received(session) != set(range(session.chunk_count)):
+        raise ChunkError("upload is incomplete")
+    with transaction.atomic():
+        return bool(
+            UploadSession.objects.filter(id=session.id, status=UploadSession.OPEN)
+            .update(status=UploadSession.FINALIZED, updated_at=timezone.now())
+        )
+
+
+def spool(session):
+    """Move the assembled file into the spool directory; returns (path, sha256)."""
+    h = hashlib.sha256()
+    with open(session.path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    path = os.path.join(settings.INGEST_SPOOL_DIR, f"{session.id.hex}.csv")
+    os.replace(session.path, path)
+    return path, h.hexdigest()
+
+
+def expired():
+    """Sessions idle, or finalized, for longer than UPLOAD_SESSION_TTL_HOURS."""
+    cutoff = timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    return UploadSession.objects.filter(updated_at__lt=cutoff)
+
+
+def remove(session):
+    if os.path.exists(session.path):
+        os.remove(session.path)
+    session.delete()
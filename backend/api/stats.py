@@ -0,0 +1,148 @@
+"""Mergeable per-column statistics.
+
+ColumnStats keeps count/mean/M2 (Welford/Chan), min, max and a t-digest,
+all of which can be updated a chunk at a time and merged across chunks,
+processes or uploads.
+"""
+import math
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+
+class TDigest:
+    """Merging t-digest (k1 scale function) with vectorised compression."""
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+
+    def update(self, values):
+        if len(values):
+            # digest the batch on its own first so only ~compression
+            # centroids take part in the merge sort below
+            batch = TDigest(self.compression)
+            batch._compress(np.sort(values), np.ones(len(values)), presorted=True)
+            self.merge(batch)
+
+    def merge(self, other):
+        if len(other.means):
+            self._compress(np.concatenate([self.means, other.means]),
+                           np.concatenate([self.weights, other.weights]))
+        return self
+
+    def to_state(self):
+        return [[float(m), float(w)] for m, w in zip(self.means, self.weights)]
+
+    @classmethod
+    def from_state(cls, centroids, compression=200):
+        digest = cls(compression)
+        if centroids:
+            arr = np.asarray(centroids, dtype="float64")
+            digest.means, digest.weights = arr[:, 0].copy(), arr[:, 1].copy()
+        return digest
+
+    def quantile(self, q, lo, hi):
+        """Approximate q-quantile (0..1); `lo`/`hi` are the exact min/max."""
+        if not len(self.means):
+            return None
+        total = self.weights.sum()
+        mids = np.cumsum(self.weights) - self.weights / 2
+        x = np.concatenate([[0.0], mids, [total]])
+        y = np.concatenate([[lo], self.means, [hi]])
+        return float(np.interp(q * total, x, y))
+
+    def _compress(self, means, weights, presorted=False):
+        if not presorted:
+            order = np.argsort(means, kind="stable")
+            means, weights = means[order], weights[order]
+        cum = np.cumsum(weights)
+        q = (cum - weights / 2) / cum[-1]
+        # every centroid spans at most one unit of k; small near the tails
+        k = np.floor(self.compression / (2 * math.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1)))
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        w = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / w
+        self.weights = w
+
+
+class ColumnStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.digest = TDigest()
+
+    def update(self, values):
+        values = values[~np.isnan(values)]
+        n = len(values)
+        if not n:
+            return
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        self._combine(n, mean, m2, float(values.min()), float(values.max()))
+        self.digest.update(values)
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+            self.digest.merge(other.digest)
+        return self
+
+    def _combine(self, n, mean, m2, lo, hi):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+
+    def to_state(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.min,
+            "max": self.max,
+            "centroids": self.digest.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        st = cls()
+        if state.get("count"):
+            st.count = state["count"]
+            st.mean = state["mean"]
+            st.m2 = state["m2"]
+            st.min = state["min"]
+            st.max = state["max"]
+            st.digest = TDigest.from_state(state["centroids"])
+        return st
+
+    @property
+    def variance(self):
+        # sample variance, like pandas' var()
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+    def result(self):
+        if not self.count:
+            return {"count": 0}
+        var = self.variance
+        out = {
+            "count": self.count,
+            "mean": self.mean,
+            "variance": var,
+            "std": math.sqrt(var) if var is not None else None,
+            "min": self.min,
+            "max": self.max,
+        }
+        for p in PERCENTILES:
+            out[f"p{p}"] = self.digest.quantile(p / 100, self.min, self.max)
+        return out
@@ -0,0 +1,87 @@
+"""Where each upload's column store lives on disk."""
+import os
+import shutil
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .columns import ColumnStore
+from .models import UploadHistory
+
+
+def columns_dir(name):
+    return os.path.join(settings.COLUMN_STORE_DIR, name)
+
+
+def new_columns_dir(content_hash=""):
+    """A scratch directory to write a column store into; see publish_columns()."""
+    return columns_dir(f".tmp-{content_hash or 'upload'}-{uuid.uuid4().hex}")
+
+
+def publish_columns(tmp_dir, content_hash=""):
+    """Move a finished store into place and return its name.
+
+    Stores are named by content hash so duplicate uploads share one copy.
+    """
+    name = content_hash or uuid.uuid4().hex
+    try:
+        os.replace(tmp_dir, columns_dir(name))
+    except OSError:
+        if not os.path.exists(os.path.join(columns_dir(name), "meta.json")):
+            raise
+        # an identical upload was published first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return name
+
+
+def has_columns(name):
+    return bool(name) and os.path.exists(os.path.join(columns_dir(name), "meta.json"))
+
+
+def open_columns(upload):
+    """ColumnStore for an UploadHistory row, or None if it has none."""
+    if not has_columns(upload.columns_path):
+        return None
+    return ColumnStore(columns_dir(upload.columns_path))
+
+
+def remove_columns(name):
+    if name and not UploadHistory.objects.filter(columns_path=name).exists():
+        shutil.rmtree(columns_dir(name), ignore_errors=True)
+
+
+def orphaned_columns(min_age_seconds=86400):
+    """Store directories no UploadHistory row points at.
+
+    Only directories older than `min_age_seconds` count, so in-flight
+    ingestion is left alone: both unfinished ".tmp-" directories and
+    stores published a moment before their row is inserted.
+    """
+    cutoff = time.time() - min_age_seconds
+    try:
+        with os.scandir(settings.COLUMN_STORE_DIR) as it:
+            entries = [e for e in it if e.is_dir() and _older_than(e, cutoff)]
+    except FileNotFoundError:
+        return []
+    names = [e.name for e in entries if not e.name.startswith(".tmp-")]
+    used = set(UploadHistory.objects.filter(columns_path__in=names).values_list("columns_path", flat=True))
+    return [e.path for e in entries if e.name.startswith(".tmp-") or e.name not in used]
+
+
+def _older_than(entry, cutoff):
+    try:
+        return entry.stat().st_mtime < cutoff
+    except FileNotFoundError:
+        return False  # removed meanwhile
+
+
+@receiver(post_delete, sender=UploadHistory)
+def _drop_columns(sender, instance, **kwargs):
+    name = instance.columns_path
+    if name:
+        # only once the delete is committed; a rollback keeps the files
+        transaction.on_commit(lambda: remove_columns(name))
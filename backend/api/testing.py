@@ -0,0 +1,16 @@
+"""Test runner that keeps the suite off the shared file cache in VAR_DIR."""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._caches = override_settings(CACHES=LOCMEM_CACHE)
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,1194 @@
-from django.test import TestCase
+import bz2
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import pstats
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import admission, async_views, batch, caching, charts, columns, ingest, instrument, jobs, profiling, reports, retention, storage
+from .columns import ColumnStore
+from .downsample import lttb, minmax
+from .diskcache import DiskLRUCache
+from .ingest import SUMMARY_SCHEMA_VERSION, SummaryAccumulator, split_ranges, summarize_csv, summarize_csv_parallel
+from .admission import AdmissionController, Rejected
+from .apps import start_background_tasks
+from .models import IngestJob, UploadChunk, UploadHistory, UploadSession
+from .profiling import ProfilingMiddleware
+from .schema import EQUIPMENT, SchemaError, read_chunks
+from .stats import ColumnStats
+
+def make_csv(rows, types=("Pump", "Valve", "Compressor")):
+    out = io.StringIO()
+    out.write("Equipment Name,Type,Flowrate,Pressure,Temperature\n")
+    for i in range(rows):
+        out.write(f"EQ-{i},{types[i % len(types)]},{100 + i % 37},{5 + i % 11 * 0.5},{90 + i % 23}\n")
+    return out.getvalue().encode()
+
+
+def temp_dir(test):
+    """A temporary directory removed when `test` finishes."""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, True)
+    return path
+
+
+def temp_settings(test, *names):
+    """Point each of the settings `names` at its own temp_dir() for `test`."""
+    override = test.settings(**{name: temp_dir(test) for name in names})
+    override.enable()
+    test.addCleanup(override.disable)
+
+
+class StreamingSummaryTests(SimpleTestCase):
+    def test_matches_in_memory_summary(self):
+        data = make_csv(1000, types=("Pump", "Pump", "Valve", "Pump", "Valve", "Heater"))
+        df = pd.read_csv(io.BytesIO(data))
+
+        s = summarize_csv(io.BytesIO(data), chunksize=64)
+
+        self.assertEqual(s["total_equipment"], len(df))
+        self.assertAlmostEqual(s["avg_flowrate"], df["Flowrate"].mean())
+        self.assertAlmostEqual(s["avg_pressure"], df["Pressure"].mean())
+        self.assertAlmostEqual(s["avg_temperature"], df["Temperature"].mean())
+        self.assertEqual(s["type_distribution"], df["Type"].value_counts().to_dict())
+        self.assertEqual(list(s["type_distribution"]), ["Pump", "Valve", "Heater"])
+
+    def test_peak_memory_does_not_grow_with_file_size(self):
+        def peak(rows):
+            f = io.BytesIO(make_csv(rows))
+            tracemalloc.start()
+            try:
+                summarize_csv(f, chunksize=2000)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        small = peak(10_000)
+        large = peak(100_000)
+        self.assertLess(large, small * 1.5)
+
+    def test_schema_reads_only_declared_columns(self):
+        data = b"Notes,Type,Flowrate,Pressure,Temperature\nx,Pump,1,2,3\ny,,4,5,6\n"
+        with read_chunks(io.BytesIO(data), EQUIPMENT, chunksize=10, engine="c") as chunks:
+            df = next(iter(chunks))
+        self.assertEqual(list(df.columns), ["Type", "Flowrate", "Pressure", "Temperature"])
+        self.assertEqual(df["Type"].dtype, "category")
+        self.assertEqual(df["Flowrate"].dtype, "float64")
+
+        s = summarize_csv(io.BytesIO(data))
+        self.assertEqual((s["total_equipment"], s["type_distribution"]), (2, {"Pump": 1}))
+
+        with self.assertRaises(SchemaError) as cm:
+            summarize_csv(io.BytesIO(b"Type,Type,Flowrate\n"))
+        self.assertEqual(
+            [(e["code"], e["column"]) for e in cm.exception.errors],
+            [("duplicate_column", "Type"), ("missing_column", "Pressure"), ("missing_column", "Temperature")],
+        )
+
+
+class StatsEngineTests(SimpleTestCase):
+    def test_column_stats_merge_matches_numpy(self):
+        rng = np.random.default_rng(1)
+        values = rng.normal(100, 20, 50_000)
+        values[::97] = np.nan
+
+        merged = ColumnStats()
+        for part in np.array_split(values, 7):
+            partial = ColumnStats()
+            partial.update(part)
+            merged.merge(partial)
+        r = merged.result()
+
+        clean = values[~np.isnan(values)]
+        self.assertEqual(r["count"], len(clean))
+        self.assertAlmostEqual(r["mean"], clean.mean())
+        self.assertAlmostEqual(r["variance"], clean.var(ddof=1))
+        self.assertEqual((r["min"], r["max"]), (clean.min(), clean.max()))
+        for p in (50, 95, 99):
+            self.assertAlmostEqual(r[f"p{p}"], np.percentile(clean, p), delta=0.5)
+
+    def test_summary_has_per_type_stats(self):
+        data = make_csv(3000)
+        df = pd.read_csv(io.BytesIO(data))
+        s = summarize_csv(io.BytesIO(data), chunksize=250)
+
+        self.assertEqual(s["schema_version"], SUMMARY_SCHEMA_VERSION)
+        overall = s["stats"]["overall"]["Temperature"]
+        self.assertAlmostEqual(overall["std"], df["Temperature"].std())
+        self.assertAlmostEqual(overall["p50"], df["Temperature"].median(), delta=0.5)
+
+        pumps = df[df["Type"] == "Pump"]["Pressure"]
+        by_type = s["stats"]["by_type"]["Pump"]["Pressure"]
+        self.assertEqual(by_type["count"], len(pumps))
+        self.assertAlmostEqual(by_type["mean"], pumps.mean())
+        self.assertEqual(by_type["max"], pumps.max())
+        self.assertEqual(list(s["stats"]["by_type"]), list(s["type_distribution"]))
+
+
+class ParallelSummaryTests(SimpleTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "wb") as f:
+            f.write(make_csv(5000, types=("Pump", "Valve", "Valve", "Heater")))
+        self.addCleanup(os.remove, self.path)
+
+    def test_ranges_are_newline_aligned(self):
+        header, ranges = split_ranges(self.path, 7)
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.assertEqual(ranges[0][0], len(header))
+        self.assertEqual(ranges[-1][1], len(data))
+        for start, end in ranges:
+            self.assertEqual(data[start - 1:start], b"\n")
+            self.assertEqual(data[end - 1:end], b"\n")
+
+    def test_matches_serial_summary(self):
+        serial = summarize_csv(self.path, chunksize=500)
+        parallel = summarize_csv_parallel(self.path, workers=3, chunksize=500)
+
+        self.assertEqual(parallel["total_equipment"], serial["total_equipment"])
+        self.assertEqual(parallel["type_distribution"], serial["type_distribution"])
+        self.assertEqual(list(parallel["type_distribution"]), list(serial["type_distribution"]))
+        for key in ("avg_flowrate", "avg_pressure", "avg_temperature"):
+            self.assertAlmostEqual(parallel[key], serial[key])
+        self.assertEqual(parallel["stats"]["by_type"]["Valve"]["Flowrate"]["count"],
+                         serial["stats"]["by_type"]["Valve"]["Flowrate"]["count"])
+
+    def test_pool_is_shared_per_worker_count(self):
+        with ThreadPoolExecutor(8) as threads:
+            pools = set(threads.map(lambda _: ingest._get_pool(3), range(16)))
+        self.assertEqual(len(pools), 1)
+
+        # another size gets its own pool; the first keeps working
+        self.assertIsNot(ingest._get_pool(2), ingest._get_pool(3))
+        serial = summarize_csv(self.path, chunksize=500)
+        for workers in (2, 3):
+            s = summarize_csv_parallel(self.path, workers=workers, chunksize=500)
+            self.assertEqual(s["type_distribution"], serial["type_distribution"])
+
+    def test_broken_pool_is_replaced(self):
+        pool = ingest._get_pool(2)
+        with self.assertRaises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result()  # a worker dies, as on an OOM kill
+
+        serial = summarize_csv(self.path, chunksize=500)
+        parallel = summarize_csv_parallel(self.path, workers=2, chunksize=500)
+        self.assertEqual(parallel["total_equipment"], serial["total_equipment"])
+        self.assertIsNot(ingest._get_pool(2), pool)
+
+    def test_parallel_column_store_matches_file(self):
+        out = os.path.join(temp_dir(self), "cols")
+        # the parts come back dictionary-encoded; merged, the names pass the limit
+        with mock.patch.object(columns, "DICT_MAX_CODES", 1000):
+            summarize_csv_parallel(self.path, workers=3, chunksize=500, columns_dir=out)
+
+        store = ColumnStore(out)
+        df = pd.read_csv(self.path)
+        self.assertEqual(store.rows, len(df))
+        self.assertFalse([n for n in os.listdir(out) if n.startswith("part-")])
+        self.assertEqual((store.kind("Equipment Name"), store.kind("Type")), (columns.STR, columns.DICT))
+        np.testing.assert_array_equal(store.column("Flowrate"), df["Flowrate"].to_numpy(float))
+        everything = np.arange(store.rows)
+        self.assertEqual(store.strings("Equipment Name", everything), list(df["Equipment Name"]))
+        self.assertEqual(store.strings("Type", everything), list(df["Type"]))
+
+
+@override_settings(INGEST_WORKERS=0)
+class IngestJobTests(TestCase):
+    def setUp(self):
+        temp_settings(self, "INGEST_SPOOL_DIR", "COLUMN_STORE_DIR")
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("op"))
+
+    def upload(self, data, name="plant.csv"):
+        return self.client.post("/api/upload/", {"file": SimpleUploadedFile(name, data)}, format="multipart")
+
+    def test_upload_is_queued_then_processed(self):
+        r = self.upload(make_csv(50))
+        self.assertEqual(r.status_code, 202)
+        job_id = r.data["job_id"]
+        self.assertEqual(self.client.get(f"/api/jobs/{job_id}/").data["status"], IngestJob.QUEUED)
+        self.assertFalse(UploadHistory.objects.exists())
+
+        self.assertEqual(jobs.run_pending(), 1)
+
+        job = self.client.get(f"/api/jobs/{job_id}/").data
+        self.assertEqual(job["status"], IngestJob.DONE)
+        upload = UploadHistory.objects.get(id=job["upload"])
+        self.assertEqual(upload.summary["total_equipment"], 50)
+        self.assertEqual(os.listdir(settings.INGEST_SPOOL_DIR), [])
+
+    def test_job_without_heartbeat_is_requeued(self):
+        job_id = self.upload(make_csv(20)).data["job_id"]
+        long_ago = timezone.now() - timedelta(hours=2)
+        # running for hours, but still beating
+        IngestJob.objects.filter(id=job_id).update(
+            status=IngestJob.RUNNING, started_at=long_ago, heartbeat_at=timezone.now()
+        )
+        self.assertEqual(jobs.run_pending(), 0)
+
+        IngestJob.objects.filter(id=job_id).update(heartbeat_at=long_ago)
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(IngestJob.objects.get(id=job_id).status, IngestJob.DONE)
+
+    def test_requeued_job_is_left_to_its_new_claim(self):
+        self.upload(make_csv(20))
+        job = jobs.claim_next()
+        # requeued while running and claimed again by another worker
+        IngestJob.objects.filter(id=job.id).update(started_at=timezone.now() + timedelta(seconds=1))
+        jobs.run_job(job)
+        self.assertEqual(IngestJob.objects.get(id=job.id).status, IngestJob.RUNNING)
+        self.assertTrue(os.path.exists(job.path))
+        os.remove(job.path)
+
+    def test_setup_alone_starts_no_threads(self):
+        with mock.patch.object(retention, "start_scheduler") as scheduler, \
+                mock.patch.object(jobs, "start_workers") as workers:
+            apps.get_app_config("api").ready()
+            jobs.enqueue("a.csv", "/nonexistent")
+        scheduler.assert_not_called()
+        workers.assert_not_called()
+
+    def test_rows_are_kept_as_columns(self):
+        data = make_csv(120)
+        self.upload(data)
+        jobs.run_pending()
+
+        upload = UploadHistory.objects.get()
+        store = storage.open_columns(upload)
+        df = pd.read_csv(io.BytesIO(data))
+        self.assertEqual(store.rows, 120)
+        self.assertIsInstance(store.column("Pressure"), np.memmap)
+        np.testing.assert_array_equal(store.column("Pressure"), df["Pressure"].to_numpy(float))
+        self.assertEqual(list(store.decode("Type", store.column("Type"))), list(df["Type"]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            upload.delete()
+        self.assertFalse(os.path.exists(store.directory))
+
+    def test_missing_columns_are_rejected_up_front(self):
+        r = self.upload(b"Type,Flowrate\nPump,1\n")
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(
+            [(e["code"], e["column"]) for e in r.json()["file"]],
+            [("missing_column", "Pressure"), ("missing_column", "Temperature")],
+        )
+        self.assertFalse(IngestJob.objects.exists())
+        self.assertEqual(os.listdir(settings.INGEST_SPOOL_DIR), [])
+
+    def test_compressed_uploads(self):
+        data = make_csv(300)
+        for name, compress in [("gz", gzip.compress), ("bz2", bz2.compress), ("xz", lzma.compress)]:
+            with self.subTest(name):
+                r = self.upload(compress(data), name=f"plant.csv.{name}")
+                self.assertEqual(r.status_code, 202)
+                jobs.run_pending()
+                job = IngestJob.objects.get(id=r.data["job_id"])
+                self.assertEqual(job.status, IngestJob.DONE)
+                self.assertEqual(job.upload.summary["total_equipment"], 300)
+                self.assertEqual(storage.open_columns(job.upload).rows, 300)
+
+        r = self.upload(b"\x1f\x8b" + b"\0" * 20, name="broken.csv.gz")
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.json()["file"][0]["code"], "unreadable")
+
+    def test_bad_value_marks_job_failed(self):
+        data = b"Type,Flowrate,Pressure,Temperature\nPump,1,2,3\nValve,fast,2,3\n"
+        job_id = self.upload(data).data["job_id"]
+        with self.assertLogs("api.jobs", "ERROR"):
+            jobs.run_pending()
+
+        job = IngestJob.objects.get(id=job_id)
+        self.assertEqual(job.status, IngestJob.FAILED)
+        self.assertIn("SchemaError", job.error)
+
+    def test_duplicate_upload_reuses_cached_summary(self):
+        data = make_csv(40)
+        self.upload(data)
+        jobs.run_pending()
+
+        r = self.upload(data, name="again.csv")
+        self.assertEqual(r.status_code, 201)
+        self.assertTrue(r.data["duplicate"])
+        self.assertFalse(IngestJob.objects.filter(status=IngestJob.QUEUED).exists())
+
+        first, second = UploadHistory.objects.order_by("id")
+        self.assertEqual(second.filename, "again.csv")
+        self.assertEqual(second.summary, first.summary)
+        self.assertEqual(second.content_hash, first.content_hash)
+        self.assertEqual(second.columns_path, first.columns_path)
+        self.assertEqual(self.client.get("/api/dedup/").data, {"hits": 1, "misses": 1, "entries": 1})
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_stage_timings_and_metrics(self):
+        instrument.REGISTRY.clear()
+        r = self.upload(make_csv(30))
+        stages = [part.split(";")[0] for part in r["Server-Timing"].split(", ")]
+        self.assertEqual(stages, ["admission", "multipart", "spool", "dedup", "schema", "enqueue", "total"])
+        jobs.run_pending()
+
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 404)  # even from localhost
+        self.assertEqual(self.client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer nope").status_code, 404)
+        metrics = self.client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(metrics.status_code, 200)
+        text = metrics.content.decode()
+        self.assertIn('stage_duration_seconds_count{endpoint="api/upload/",stage="spool"} 1', text)
+        self.assertIn('stage_rows_total{endpoint="ingest_job",stage="read_csv"} 30', text)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="api/upload/",method="POST",status="2xx",le="+Inf"} 1', text)
+        with override_settings(METRICS_ALLOWED_IPS=["10.0.0.8"]):
+            self.assertEqual(self.client.get("/api/metrics/", REMOTE_ADDR="10.0.0.8").status_code, 200)
+
+
+class AdmissionTests(SimpleTestCase):
+    def test_slots_bytes_and_queue(self):
+        ctl = AdmissionController(max_active=2, max_bytes=100, queue_size=1, queue_seconds=5)
+        first = ctl.acquire(80)
+        admitted = []
+        waiter = threading.Thread(target=lambda: admitted.append(ctl.acquire(50)))
+        waiter.start()
+        while not ctl.waiting:
+            time.sleep(0.01)
+        # a slot is free, but 80 + 50 bytes is over budget; the queue is full
+        with self.assertRaises(Rejected) as cm:
+            ctl.acquire(10)
+        self.assertGreaterEqual(cm.exception.wait, 1)
+
+        ctl.release(first, held=0.1)
+        waiter.join()
+        self.assertEqual((admitted, ctl.active, ctl.reserved), ([50], 1, 50))
+        ctl.release(50, held=0.1)
+
+        # bigger than the whole budget, but alone
+        self.assertEqual(ctl.acquire(10_000), 100)
+
+    def test_wait_times_out(self):
+        ctl = AdmissionController(max_active=1, max_bytes=100, queue_size=4, queue_seconds=0.05)
+        with ctl.admit(1):
+            with self.assertRaises(Rejected):
+                ctl.acquire(1)
+        self.assertEqual((ctl.active, ctl.waiting), (0, 0))
+
+
+@override_settings(INGEST_WORKERS=0, ADMISSION_MAX_UPLOADS=1, ADMISSION_QUEUE_SIZE=0, METRICS_ALLOWED_IPS=["127.0.0.1"])
+class AdmissionUploadTests(TestCase):
+    def setUp(self):
+        temp_settings(self, "INGEST_SPOOL_DIR")
+
+    def test_busy_server_answers_429(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("op"))
+        with admission.controller().admit(0):
+            r = client.post("/api/upload/", {"file": SimpleUploadedFile("a.csv", make_csv(5))}, format="multipart")
+            self.assertEqual(r.status_code, 429)
+            self.assertGreaterEqual(int(r["Retry-After"]), 1)
+            self.assertIn("admission_active 1", client.get("/api/metrics/").content.decode())
+        self.assertEqual(client.post("/api/upload/", {"file": SimpleUploadedFile("a.csv", make_csv(5))},
+                                     format="multipart").status_code, 202)
+
+
+class AsyncUrls:
+    urlpatterns = [
+        path("api/upload/", async_views.upload_csv),
+        path("api/history/", async_views.history_api),
+        path("api/report/", async_views.report_pdf),
+        path("api/report/<int:upload_id>/", async_views.upload_report),
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncUrls, INGEST_WORKERS=0)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        temp_settings(self, "INGEST_SPOOL_DIR", "COLUMN_STORE_DIR", "REPORT_CACHE_DIR", "CHART_CACHE_DIR")
+        token = RefreshToken.for_user(User.objects.create_user("op")).access_token
+        self.client = AsyncClient()
+        self.auth = {"Authorization": f"Bearer {token}"}
+
+    def get(self, url, **headers):
+        return self.client.get(url, headers={**self.auth, **headers})
+
+    def upload(self, data=None, name="plant.csv"):
+        body = {"file": SimpleUploadedFile(name, data)} if data is not None else {}
+        return self.client.post("/api/upload/", body, headers=self.auth)
+
+    async def test_upload_is_queued_then_reused(self):
+        r = await self.upload(make_csv(40))
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(await sync_to_async(jobs.run_pending)(), 1)
+
+        again = await self.upload(make_csv(40), name="again.csv")
+        self.assertEqual(again.status_code, 201)
+        self.assertTrue(again.json()["duplicate"])
+        self.assertEqual(await UploadHistory.objects.filter(filename="again.csv").acount(), 1)
+
+        bad = await self.upload(b"Type,Flowrate\nPump,1\n")
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual([e["column"] for e in bad.json()["file"]], ["Pressure", "Temperature"])
+        self.assertEqual((await self.upload()).json(), {"file": ["No file was submitted."]})
+
+    async def test_history_pages_and_revalidates(self):
+        for name in ("a.csv", "b.csv", "c.csv"):
+            await UploadHistory.objects.acreate(filename=name, summary={})
+
+        r = await self.get("/api/history/?limit=2")
+        self.assertEqual([h["filename"] for h in r.json()], ["c.csv", "b.csv"])
+        older = await self.get(f"/api/history/?limit=2&cursor={r['X-Next-Cursor']}")
+        self.assertEqual([h["filename"] for h in older.json()], ["a.csv"])
+        self.assertEqual((await self.get("/api/history/?limit=2", **{"If-None-Match": r["ETag"]})).status_code, 304)
+        self.assertEqual((await self.get("/api/history/?limit=0")).status_code, 400)
+
+    async def test_report_and_authentication(self):
+        upload = await UploadHistory.objects.acreate(filename="a.csv",
+                                                     summary={"total_equipment": 1, "type_distribution": {}})
+        r = await self.get("/api/report/")
+        self.assertEqual((r.status_code, r["Content-Type"]), (200, "application/pdf"))
+        self.assertIn("render;dur=", r["Server-Timing"])
+        self.assertEqual((await self.get(f"/api/report/{upload.id}/"))["ETag"], r["ETag"])
+        self.assertEqual((await self.get("/api/report/999999/")).status_code, 404)
+
+        self.assertEqual((await self.client.get("/api/history/")).status_code, 401)
+        self.assertEqual((await self.client.delete("/api/history/", headers=self.auth)).status_code, 405)
+
+
+@override_settings(INGEST_WORKERS=0)
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        temp_settings(self, "INGEST_SPOOL_DIR", "COLUMN_STORE_DIR")
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("op"))
+        self.data = make_csv(200)
+        r = self.client.post("/api/upload/sessions/",
+                             {"filename": "big.csv", "size": len(self.data), "chunk_size": 1000}, format="json")
+        self.assertEqual(r.status_code, 201)
+        self.url = f"/api/upload/sessions/{r.data['id']}/"
+        self.chunks = [self.data[i:i + 1000] for i in range(0, len(self.data), 1000)]
+
+    def put(self, index, body=None, sha=None):
+        body = self.chunks[index] if body is None else body
+        return self.client.put(
+            f"{self.url}?offset={index * 1000}", body, content_type="application/octet-stream",
+            HTTP_X_CHUNK_SHA256=sha or hashlib.sha256(body).hexdigest(),
+        )
+
+    def test_out_of_order_chunks_then_finalize(self):
+        self.assertEqual(self.put(1).status_code, 200)
+        r = self.put(0)
+        self.assertEqual(r.data["offset"], 2000)
+        self.assertEqual(r.data["missing"], list(range(2, len(self.chunks))))
+
+        self.assertEqual(self.client.post(f"{self.url}finalize/").status_code, 400)
+
+        for i in reversed(range(2, len(self.chunks))):
+            self.put(i)
+        self.assertEqual(self.client.get(self.url).data["offset"], len(self.data))
+
+        r = self.client.post(f"{self.url}finalize/")
+        self.assertEqual(r.status_code, 202)
+        jobs.run_pending()
+        job = IngestJob.objects.get(id=r.data["job_id"])
+        self.assertEqual(job.upload.summary["total_equipment"], 200)
+        self.assertEqual(job.upload.content_hash, hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(self.client.post(f"{self.url}finalize/").status_code, 409)
+
+    def test_bad_chunks_are_not_recorded(self):
+        self.assertEqual(self.put(0, sha="0" * 64).status_code, 400)
+        self.assertEqual(self.put(0, body=self.chunks[0][:-1]).status_code, 400)
+        self.assertEqual(self.client.put(f"{self.url}?offset=7", b"x", content_type="application/octet-stream",
+                                         HTTP_X_CHUNK_SHA256="0" * 64).status_code, 400)
+        self.assertEqual(self.client.get(self.url).data["offset"], 0)
+
+    def test_bad_resend_of_a_received_chunk_unrecords_it(self):
+        self.assertEqual(self.put(0).status_code, 200)
+        corrupt = b"x" * len(self.chunks[0])
+        self.assertEqual(self.put(0, body=corrupt, sha="0" * 64).status_code, 400)
+        self.assertEqual(self.client.get(self.url).data["missing"], list(range(len(self.chunks))))
+        with open(UploadSession.objects.get().path, "rb") as f:
+            self.assertEqual(f.read(1000), self.chunks[0])  # the good bytes were kept
+
+    @override_settings(UPLOAD_SESSION_MAX_BYTES=10_000)
+    def test_size_is_bounded(self):
+        r = self.client.post("/api/upload/sessions/", {"filename": "huge.csv", "size": 10**13}, format="json")
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("size", r.data)
+
+    def test_chunk_racing_finalize_gets_409(self):
+        os.remove(UploadSession.objects.get().path)  # as finalize's spool() does
+        self.assertEqual(self.put(0).status_code, 409)
+
+    def test_stale_sessions_are_swept(self):
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=30))
+        path = UploadSession.objects.get().path
+        self.assertEqual(retention.sweep_sessions(), 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_finalized_sessions_are_swept(self):
+        for i in range(len(self.chunks)):
+            self.put(i)
+        self.assertEqual(self.client.post(f"{self.url}finalize/").status_code, 202)
+        self.assertEqual(retention.sweep_sessions(), 0)
+
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(retention.sweep_sessions(), 1)
+        self.assertFalse(UploadChunk.objects.exists())
+
+
+class BatchUploadTests(TestCase):
+    def setUp(self):
+        temp_settings(self, "INGEST_SPOOL_DIR", "COLUMN_STORE_DIR")
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("op"))
+
+    def test_files_and_zip_in_one_request(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as z:
+            z.writestr("shift/c.csv", make_csv(30))
+            z.writestr("shift/a-copy.csv", make_csv(10))
+            z.writestr("shift/bad.csv", b"Type\nPump\n")
+            z.writestr("__MACOSX/shift/._c.csv", b"junk")
+        files = [
+            SimpleUploadedFile("a.csv", make_csv(10)),
+            SimpleUploadedFile("b.csv.gz", gzip.compress(make_csv(20))),
+            SimpleUploadedFile("shift.zip", archive.getvalue()),
+        ]
+        token = caching.history_token()
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post("/api/upload/batch/", {"files": files}, format="multipart")
+        self.assertEqual(r.status_code, 201)
+
+        results = {res["filename"]: res for res in r.data["results"]}
+        self.assertEqual(list(results), ["a.csv", "b.csv.gz", "c.csv", "a-copy.csv", "bad.csv"])
+        self.assertEqual(results["bad.csv"]["errors"][0]["code"], "missing_column")
+        self.assertTrue(results["a-copy.csv"]["duplicate"])
+        self.assertFalse(results["a.csv"]["duplicate"])
+        for name, rows in [("a.csv", 10), ("b.csv.gz", 20), ("c.csv", 30), ("a-copy.csv", 10)]:
+            upload = UploadHistory.objects.get(id=results[name]["upload_id"])
+            self.assertEqual(upload.summary["total_equipment"], rows)
+        self.assertNotEqual(caching.history_token(), token)
+        self.assertEqual(os.listdir(settings.INGEST_SPOOL_DIR), [])
+
+    def test_import_command_resumes(self):
+        root = temp_dir(self)
+        os.makedirs(os.path.join(root, "2023"))
+        with open(os.path.join(root, "a.csv"), "wb") as f:
+            f.write(make_csv(10))
+        with open(os.path.join(root, "2023", "b.csv.gz"), "wb") as f:
+            f.write(gzip.compress(make_csv(20)))
+        with open(os.path.join(root, "2023", "bad.csv"), "wb") as f:
+            f.write(b"Type\nPump\n")
+        os.utime(os.path.join(root, "a.csv"), (1600000000, 1600000000))
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_csvs", root, "--batch-size", "2", stdout=out, stderr=err)
+        self.assertIn("files/s", out.getvalue())
+        self.assertIn("bad.csv", err.getvalue())
+        self.assertEqual(
+            dict(UploadHistory.objects.values_list("filename", "summary__total_equipment")),
+            {"a.csv": 10, os.path.join("2023", "b.csv.gz"): 20},
+        )
+        self.assertTrue(os.path.exists(os.path.join(root, "a.csv")))
+        # dated by the file, so the archive sorts before anything uploaded today
+        self.assertEqual(UploadHistory.objects.get(filename="a.csv").uploaded_at.timestamp(), 1600000000)
+
+        # a second run only retries the failed file
+        out = io.StringIO()
+        call_command("import_csvs", root, stdout=out, stderr=io.StringIO())
+        self.assertIn("1 file(s) to import, 2 already done", out.getvalue())
+        self.assertEqual(UploadHistory.objects.count(), 2)
+
+        with override_settings(HISTORY_RETENTION_COUNT=1):
+            call_command("import_csvs", root, stdout=io.StringIO(), stderr=io.StringIO())
+            self.assertEqual(UploadHistory.objects.count(), 2)  # pruning is opt-in
+            call_command("import_csvs", root, "--prune", stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(list(UploadHistory.objects.values_list("filename", flat=True)),
+                         [os.path.join("2023", "b.csv.gz")])
+
+    def test_import_command_date_option(self):
+        root = temp_dir(self)
+        with open(os.path.join(root, "a.csv"), "wb") as f:
+            f.write(make_csv(10))
+        call_command("import_csvs", root, "--uploaded-at", "2021-03-04T05:06:07Z", stdout=io.StringIO())
+        self.assertEqual(UploadHistory.objects.get().uploaded_at.isoformat(), "2021-03-04T05:06:07+00:00")
+        with self.assertRaises(CommandError):
+            call_command("import_csvs", root, "--uploaded-at", "soon", stdout=io.StringIO())
+
+    @override_settings(UPLOAD_BATCH_MAX_FILES=1)
+    def test_too_many_files(self):
+        files = [SimpleUploadedFile(f"{i}.csv", make_csv(5)) for i in range(2)]
+        r = self.client.post("/api/upload/batch/", {"files": files}, format="multipart")
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(UploadHistory.objects.exists())
+        self.assertEqual(os.listdir(settings.INGEST_SPOOL_DIR), [])
+
+    def zip_upload(self, **members):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as z:
+            for name, data in members.items():
+                z.writestr(name, data)
+        return self.client.post("/api/upload/batch/", {"files": [SimpleUploadedFile("a.zip", archive.getvalue())]},
+                                format="multipart")
+
+    def test_unzipped_size_is_bounded(self):
+        data = make_csv(100)
+        with override_settings(UPLOAD_BATCH_MAX_MEMBER_BYTES=len(data) - 1):
+            r = self.zip_upload(**{"a.csv": data})
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("uncompressed", str(r.data["files"]))
+        with override_settings(UPLOAD_BATCH_MAX_UNZIPPED_BYTES=len(data) * 2 - 1):
+            self.assertEqual(self.zip_upload(**{"a.csv": data, "b.csv": data}).status_code, 400)
+        self.assertFalse(UploadHistory.objects.exists())
+        self.assertEqual(os.listdir(settings.INGEST_SPOOL_DIR), [])
+
+    def test_member_reads_are_counted(self):
+        # a forged header size must not let more bytes through
+        limited = batch._Limited(io.BytesIO(b"x" * 100), 10, "a.csv")
+        with self.assertRaises(batch.BatchError):
+            while limited.read(8):
+                pass
+
+
+class HistoryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("op"))
+        with self.captureOnCommitCallbacks(execute=True):
+            UploadHistory.objects.create(filename="a.csv", summary={"total_equipment": 1})
+
+    def test_conditional_get_returns_304_until_history_changes(self):
+        r = self.client.get("/api/history/")
+        self.assertEqual(r.status_code, 200)
+        etag = r["ETag"]
+        self.assertEqual(len(r.json()), 1)
+
+        with self.assertNumQueries(0):
+            r = self.client.get("/api/history/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UploadHistory.objects.create(filename="b.csv", summary={"total_equipment": 2})
+        r = self.client.get("/api/history/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r["ETag"], etag)
+        self.assertEqual([h["filename"] for h in r.json()], ["b.csv", "a.csv"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UploadHistory.objects.filter(filename="b.csv").delete()
+        self.assertEqual(self.client.get("/api/history/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_token_changes_once_after_commit(self):
+        token = caching.history_token()
+        with self.captureOnCommitCallbacks() as callbacks:
+            for i in range(3):
+                UploadHistory.objects.create(filename=f"{i}.csv", summary={})
+            UploadHistory.objects.exclude(filename="a.csv").delete()
+            # a poll before the commit still sees the old rows under the old token
+            self.assertEqual(caching.history_token(), token)
+        self.assertEqual(len(callbacks), 2)  # one token bump, one report sweep
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(caching.history_token(), token)
+
+
+class HistoryPaginationTests(TestCase):
+    def setUp(self):
+        temp_settings(self, "COLUMN_STORE_DIR")
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("op"))
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(12):
+                UploadHistory.objects.create(filename=f"{i}.csv", summary={})
+
+    def names(self, r):
+        return [h["filename"] for h in r.json()]
+
+    def test_keyset_pages_and_since(self):
+        r = self.client.get("/api/history/")
+        self.assertEqual(self.names(r), ["11.csv", "10.csv", "9.csv", "8.csv", "7.csv"])
+        since = r["X-Since-Cursor"]
+
+        seen = self.names(r)
+        while "X-Next-Cursor" in r:
+            r = self.client.get("/api/history/", {"limit": 5, "cursor": r["X-Next-Cursor"]})
+            seen += self.names(r)
+        self.assertEqual(seen, [f"{i}.csv" for i in range(11, -1, -1)])
+
+        r = self.client.get("/api/history/", {"since": since})
+        self.assertEqual(self.names(r), [])
+        self.assertEqual(r["X-Since-Cursor"], since)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(12, 15):
+                UploadHistory.objects.create(filename=f"{i}.csv", summary={})
+        r = self.client.get("/api/history/", {"since": since, "limit": 2})
+        self.assertEqual(self.names(r), ["13.csv", "12.csv"])
+        r = self.client.get("/api/history/", {"since": r["X-Since-Cursor"], "limit": 2})
+        self.assertEqual(self.names(r), ["14.csv"])
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.client.get("/api/history/", {"cursor": "nope"}).status_code, 400)
+
+    @override_settings(HISTORY_RETENTION_COUNT=4, HISTORY_RETENTION_DAYS=0)
+    def test_retention_by_count(self):
+        result = retention.prune(batch_size=3)
+        self.assertEqual((result.rows, result.batches), (8, 3))
+        self.assertEqual(sorted(UploadHistory.objects.values_list("filename", flat=True)),
+                         ["10.csv", "11.csv", "8.csv", "9.csv"])
+
+    @override_settings(HISTORY_RETENTION_COUNT=0, HISTORY_RETENTION_DAYS=7)
+    def test_retention_by_age(self):
+        UploadHistory.objects.filter(filename__in=["0.csv", "1.csv"]).update(
+            uploaded_at=timezone.now() - timedelta(days=8)
+        )
+        retention.prune()
+        self.assertEqual(UploadHistory.objects.count(), 10)
+        self.assertFalse(UploadHistory.objects.filter(filename="0.csv").exists())
+
+    @override_settings(HISTORY_RETENTION_COUNT=4, HISTORY_RETENTION_DAYS=0)
+    def test_retention_max_batches_deletes_oldest_first(self):
+        result = retention.prune(batch_size=2, max_batches=1)
+        self.assertEqual(result.rows, 2)
+        self.assertFalse(UploadHistory.objects.filter(filename__in=["0.csv", "1.csv"]).exists())
+        self.assertEqual(UploadHistory.objects.count(), 10)
+
+    def test_entrypoints_start_background_tasks(self):
+        for workers_setting, enabled, expect_workers, expect_scheduler in [
+            (2, True, True, True),
+            (0, True, False, True),  # retention still runs without ingest workers
+            (2, False, False, False),
+        ]:
+            with override_settings(INGEST_WORKERS=workers_setting, BACKGROUND_TASKS=enabled), \
+                    mock.patch.object(retention, "start_scheduler") as scheduler, \
+                    mock.patch.object(jobs, "start_workers") as workers:
+                start_background_tasks()
+            self.assertEqual((workers.called, scheduler.called), (expect_workers, expect_scheduler))
+
+    def test_sweep_removes_unreferenced_stores(self):
+        UploadHistory.objects.filter(filename="0.csv").update(columns_path="kept")
+        for name in ("kept", "orphan", "just-published"):
+            os.makedirs(storage.columns_dir(name))
+        for name in ("kept", "orphan"):
+            os.utime(storage.columns_dir(name), (0, 0))
+        self.assertEqual(retention.sweep_orphans(), 1)
+        self.assertEqual(sorted(os.listdir(settings.COLUMN_STORE_DIR)), ["just-published", "kept"])
+
+
+@override_settings(INGEST_WORKERS=0)
+class DatabaseProfileTests(TransactionTestCase):
+    """Runs against whichever DB_PROFILE is configured."""
+
+    def setUp(self):
+        temp_settings(self, "INGEST_SPOOL_DIR", "COLUMN_STORE_DIR")
+
+    @skipUnless(connection.vendor == "sqlite", "sqlite profile")
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS["busy_timeout"])
+
+    @skipUnless(connection.vendor == "postgresql", "postgres profile")
+    def test_postgres_keeps_connections(self):
+        db = settings.DATABASES["default"]
+        self.assertTrue(db["CONN_MAX_AGE"] or db.get("OPTIONS", {}).get("pool"))
+
+    @override_settings(INGEST_HEARTBEAT_SECONDS=0.05)
+    def test_running_job_keeps_a_heartbeat(self):
+        IngestJob.objects.create(filename="a.csv", path="/nonexistent")
+        job = jobs.claim_next()
+        IngestJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        with jobs._heartbeat(job):
+            time.sleep(0.3)
+        self.assertGreater(IngestJob.objects.get(id=job.id).heartbeat_at, timezone.now() - timedelta(seconds=5))
+
+    def test_parallel_uploads_and_history(self):
+        user = User.objects.create_user("op")
+        errors = []
+
+        def client():
+            c = APIClient()
+            c.force_authenticate(user)
+            return c
+
+        def uploader(n):
+            try:
+                c = client()
+                for i in range(5):
+                    data = make_csv(20 + n * 10 + i)
+                    r = c.post("/api/upload/", {"file": SimpleUploadedFile("p.csv", data)}, format="multipart")
+                    self.assertEqual(r.status_code, 202)
+                    jobs.run_pending()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        def poller():
+            try:
+                c = client()
+                for _ in range(20):
+                    self.assertEqual(c.get("/api/history/").status_code, 200)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=uploader, args=(n,)) for n in range(4)]
+        threads += [threading.Thread(target=poller) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(UploadHistory.objects.count(), 20)
+        self.assertFalse(IngestJob.objects.exclude(status=IngestJob.DONE).exists())
+
+
+class ReportCacheTests(TestCase):
+    def setUp(self):
+        temp_settings(self, "REPORT_CACHE_DIR")
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("op"))
+        self.upload = UploadHistory.objects.create(
+            filename="a.csv", summary={"total_equipment": 3, "type_distribution": {"Pump": 3}}
+        )
+
+    def get(self, **headers):
+        return self.client.get("/api/report/", **headers)
+
+    def test_report_is_cached_and_revalidated(self):
+        r = self.get()
+        self.assertEqual(r.status_code, 200)
+        pdf = b"".join(r.streaming_content)
+        self.assertTrue(pdf.startswith(b"%PDF"))
+        self.assertIn("Last-Modified", r)
+
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=r["ETag"]).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=r["Last-Modified"]).status_code, 304)
+
+        part = self.get(HTTP_RANGE="bytes=4-99")
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(part["Content-Range"], f"bytes 4-99/{len(pdf)}")
+        self.assertEqual(part.content, pdf[4:100])
+        self.assertEqual(self.get(HTTP_RANGE=f"bytes={len(pdf)}-").status_code, 416)
+
+        UploadHistory.objects.create(filename="b.csv", summary={})
+        r2 = self.get(HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(r2.status_code, 200)
+        self.assertNotEqual(r2["ETag"], r["ETag"])
+
+    def test_etag_follows_the_rendered_bytes(self):
+        latest = UploadHistory.objects.create(filename="b.csv", summary={"avg_pressure": 2.0})
+        UploadHistory.objects.filter(id=self.upload.id).update(summary={"avg_pressure": 1.0})
+        url = f"/api/report/{latest.id}/"
+        r = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=r["ETag"]).status_code, 304)
+
+        # retention drops the earlier upload and the cached file is evicted:
+        # the re-rendered trend differs, and so does the tag
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload.delete()
+        reports.report_cache().discard("report-")
+        r2 = self.client.get(url, HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(r2.status_code, 200)
+        self.assertNotEqual(r2["ETag"], r["ETag"])
+        self.assertEqual(self.client.get(url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=r["ETag"]).status_code, 200)
+
+    def test_lru_eviction(self):
+        cache = DiskLRUCache(temp_dir(self), max_bytes=250)
+        cache.put("a", b"x" * 100)
+        cache.put("b", b"x" * 100)
+        os.utime(cache.path("a"), (0, 0))
+        os.utime(cache.path("b"), (1, 1))
+        self.assertIsNotNone(cache.get("a"))  # a is now most recent
+
+        cache.put("c", b"x" * 100)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_eviction_skips_files_removed_meanwhile(self):
+        cache = DiskLRUCache(temp_dir(self), max_bytes=50)
+        for key in ("gone", "old"):
+            with open(cache.path(key), "wb") as f:
+                f.write(b"x" * 100)
+        scanned = cache._entries()
+        os.remove(cache.path("gone"))  # e.g. evicted by another process
+        with mock.patch.object(cache, "_entries", return_value=scanned):
+            cache.put("new", b"x" * 100)  # over budget: evicts "old"
+        self.assertEqual(cache.keys(), ["new"])
+
+
+@override_settings(INGEST_WORKERS=0)
+class UploadReportTests(TestCase):
+    def setUp(self):
+        temp_settings(self, "INGEST_SPOOL_DIR", "COLUMN_STORE_DIR", "REPORT_CACHE_DIR", "CHART_CACHE_DIR")
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("op"))
+        self.data = make_csv(600, types=tuple(f"Type-{i:03}" for i in range(120)))
+
+    def upload(self, name):
+        self.client.post("/api/upload/", {"file": SimpleUploadedFile(name, self.data)}, format="multipart")
+        jobs.run_pending()
+        return UploadHistory.objects.get(filename=name)
+
+    def charts(self):
+        cache = charts.chart_cache()
+        return {key: os.stat(cache.path(key)).st_ino for key in cache.keys()}
+
+    def test_report_per_upload_with_cached_charts(self):
+        first = self.upload("a.csv")
+        r = self.client.get(f"/api/report/{first.id}/")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r["Content-Disposition"], f'inline; filename="report-{first.id}.pdf"')
+        pdf = b"".join(r.streaming_content)
+        self.assertTrue(pdf.startswith(b"%PDF"))
+        self.assertGreater(len(re.findall(rb"/Type /Page\b(?!s)", pdf)), 3)
+        drawn = self.charts()
+        self.assertEqual(sorted(k.split("-")[0] for k in drawn), ["hist"] * 3)
+        self.assertEqual(self.client.get(f"/api/report/{first.id}/", HTTP_IF_NONE_MATCH=r["ETag"]).status_code, 304)
+
+        # same rows again: the histogram bins are reused
+        second = self.upload("b.csv")
+        r = self.client.get(f"/api/report/{second.id}/")
+        self.assertEqual(r.status_code, 200)
+        self.assertNotIn("chart;", r["Server-Timing"])
+        now = self.charts()
+        self.assertEqual(now, drawn)
+
+        self.assertEqual(self.client.get("/api/report/999999/").status_code, 404)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        # a fresh store per test, so none sees another's profiles
+        temp_settings(self, "REPORT_CACHE_DIR", "PROFILE_DIR")
+        self.client = APIClient()
+        self.admin = User.objects.create_user("admin", is_staff=True)
+        UploadHistory.objects.create(filename="a.csv", summary={"total_equipment": 1, "type_distribution": {}})
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+
+    def test_flagged_staff_request_is_profiled(self):
+        self.login(self.admin)
+        r = self.client.get("/api/report/", HTTP_X_PROFILE="1", HTTP_X_REQUEST_ID="report-1")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r["X-Profile-Id"], "report-1")
+
+        listed = self.client.get("/api/profiles/").data
+        self.assertEqual([p["id"] for p in listed], ["report-1"])
+        self.assertEqual((listed[0]["path"], listed[0]["status"]), ("/api/report/", 200))
+        self.assertGreater(listed[0]["peak_memory_bytes"], 0)
+        self.assertTrue(any("(report_pdf)" in f["function"] for f in listed[0]["top_functions"]))
+
+        dump = self.client.get("/api/profiles/report-1/")
+        path = os.path.join(temp_dir(self), "report.prof")
+        with open(path, "wb") as f:
+            f.write(b"".join(dump.streaming_content))
+        self.assertGreater(pstats.Stats(path).total_calls, 0)
+        self.assertEqual(self.client.get("/api/profiles/missing/").status_code, 404)
+
+    def test_flag_is_ignored_for_other_users(self):
+        self.login(User.objects.create_user("op"))
+        r = self.client.get("/api/report/?profile=1")
+        self.assertEqual(r.status_code, 200)
+        self.assertNotIn("X-Profile-Id", r)
+        self.assertEqual(self.client.get("/api/profiles/").status_code, 403)
+        self.assertEqual(os.listdir(settings.PROFILE_DIR), [])
+
+    def test_unflagged_requests_skip_the_profiler(self):
+        response = HttpResponse()
+        middleware = ProfilingMiddleware(lambda request: response)
+        with mock.patch.object(profiling, "_Run") as run, mock.patch.object(profiling, "_is_staff") as is_staff:
+            self.assertIs(middleware(RequestFactory().get("/api/history/?limit=5")), response)
+            self.assertIs(middleware(RequestFactory().get("/api/history/?profile=0")), response)
+        run.assert_not_called()
+        is_staff.assert_not_called()  # not even the user lookup
+
+
+class AggregateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("op"))
+
+    def add(self, data, name):
+        summary, state = ingest.split_state(summarize_csv(io.BytesIO(data), chunksize=100))
+        return UploadHistory.objects.create(filename=name, summary=summary, state=state)
+
+    def test_merges_stored_states_without_raw_data(self):
+        a = make_csv(300)
+        b = make_csv(500, types=("Pump", "Heater"))
+        ua, ub = self.add(a, "a.csv"), self.add(b, "b.csv")
+        legacy = UploadHistory.objects.create(filename="old.csv", summary={"total_equipment": 1})
+
+        r = self.client.get("/api/aggregate/", {"ids": f"{ua.id},{ub.id},{legacy.id}"})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(sorted(r.data["uploads"]), [ua.id, ub.id])
+        self.assertEqual(r.data["skipped"], [legacy.id])
+
+        df = pd.concat([pd.read_csv(io.BytesIO(a)), pd.read_csv(io.BytesIO(b))])
+        self.assertEqual(r.data["total_equipment"], len(df))
+        pumps = df[df["Type"] == "Pump"]["Pressure"]
+        stats = r.data["stats"]["by_type"]["Pump"]["Pressure"]
+        self.assertEqual(stats["count"], len(pumps))
+        self.assertAlmostEqual(stats["mean"], pumps.mean())
+        self.assertAlmostEqual(stats["variance"], pumps.var())
+
+        r = self.client.get("/api/aggregate/", {"last": 1})
+        self.assertEqual(r.data["uploads"], [])
+        self.assertIsNone(r.data["avg_pressure"])
+
+    def test_state_round_trips(self):
+        acc = SummaryAccumulator()
+        acc.update(pd.read_csv(io.BytesIO(make_csv(200))))
+        again = SummaryAccumulator.from_state(acc.state())
+        self.assertEqual(again.summary(), acc.summary())
+
+    def test_history_does_not_load_state(self):
+        upload = self.add(make_csv(10), "a.csv")
+        self.assertNotIn("state", upload.summary)
+        with CaptureQueriesContext(connection) as queries:
+            summary = self.client.get("/api/history/").json()[0]["summary"]
+        self.assertIn("stats", summary)
+        self.assertNotIn("state", summary)
+        self.assertFalse([q for q in queries if '"state"' in q["sql"]])
+        self.assertEqual(UploadHistory.objects.values_list("state", flat=True).get()["rows"], 10)
+
+
+class StoredRowsMixin:
+    def setUp(self):
+        temp_settings(self, "COLUMN_STORE_DIR")
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("op"))
+        n = 4000
+        self.df = pd.DataFrame({
+            "Equipment Name": [f"EQ-{i}" for i in range(n)],
+            "Type": ["Pump" if i < 1000 else ("Valve", "Heater")[i % 2] for i in range(n)],
+            "Flowrate": np.arange(n) * 0.5,
+            "Pressure": np.where(np.arange(n) % 10 == 0, np.nan, np.arange(n) % 7),
+            "Temperature": 100 + np.arange(n) % 13,
+        })
+        tmp = storage.new_columns_dir()
+        with mock.patch.object(columns, "ZONE_ROWS", 500):
+            summarize_csv(io.StringIO(self.df.to_csv(index=False)), chunksize=700, columns_dir=tmp)
+        self.upload = UploadHistory.objects.create(
+            filename="rows.csv", summary={}, columns_path=storage.publish_columns(tmp)
+        )
+        self.url = f"/api/uploads/{self.upload.id}/rows/"
+
+
+class RowQueryTests(StoredRowsMixin, TestCase):
+    def test_filters_use_zone_maps(self):
+        r = self.client.get(self.url, {"flowrate_min": 100, "flowrate_max": 300, "fields": "Equipment Name,Flowrate"})
+        self.assertEqual(r.status_code, 200)
+        expected = self.df[self.df["Flowrate"].between(100, 300)]
+        self.assertEqual(r.data["count"], len(expected))
+        self.assertEqual(r.data["blocks_total"], 8)
+        self.assertEqual(r.data["blocks_scanned"], 2)
+        self.assertEqual(r.data["rows"][0], {"Equipment Name": "EQ-200", "Flowrate": 100.0})
+
+        r = self.client.get(self.url, {"type": "Pump", "flowrate_min": 600})
+        self.assertEqual(r.data["count"], 0)
+        self.assertEqual(r.data["blocks_scanned"], 0)
+
+        r = self.client.get(self.url, {"type": "Heater", "pressure_max": 2})
+        expected = self.df[(self.df["Type"] == "Heater") & (self.df["Pressure"] <= 2)]
+        self.assertEqual(r.data["count"], len(expected))
+        self.assertEqual(r.data["blocks_scanned"], 6)
+
+    def test_sort_and_paginate(self):
+        r = self.client.get(self.url, {"type": "Valve", "sort": "-Temperature", "offset": 5, "limit": 10,
+                                       "fields": "Equipment Name,Temperature"})
+        valves = self.df[self.df["Type"] == "Valve"].sort_values("Temperature", ascending=False, kind="stable")
+        self.assertEqual([row["Temperature"] for row in r.data["rows"]], list(valves["Temperature"][5:15]))
+
+        r = self.client.get(self.url, {"sort": "Pressure", "offset": 3990, "fields": "Pressure"})
+        self.assertEqual(r.data["rows"][-1], {"Pressure": None})
+
+    def test_high_cardinality_text_is_not_dictionary_encoded(self):
+        tmp = storage.new_columns_dir()
+        with mock.patch.object(columns, "DICT_MAX_CODES", 1000):
+            summarize_csv(io.StringIO(self.df.to_csv(index=False)), chunksize=700, columns_dir=tmp)
+        store = ColumnStore(tmp)
+        self.assertEqual((store.kind("Equipment Name"), store.kind("Type")), (columns.STR, columns.DICT))
+        self.assertFalse([n for n in os.listdir(tmp) if "json" in n and n != "meta.json"])
+        self.assertEqual(store.strings("Equipment Name", [3999, 0, 1500]), ["EQ-3999", "EQ-0", "EQ-1500"])
+
+        self.upload.columns_path = storage.publish_columns(tmp)
+        self.upload.save()
+        r = self.client.get(self.url, {"type": "Heater", "sort": "-Equipment Name", "limit": 3,
+                                       "fields": "Equipment Name,Type"})
+        heaters = sorted(self.df[self.df["Type"] == "Heater"]["Equipment Name"], reverse=True)
+        self.assertEqual([row["Equipment Name"] for row in r.data["rows"]], heaters[:3])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url, {"fields": "Nope"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"limit": 0}).status_code, 400)
+        bare = UploadHistory.objects.create(filename="x.csv", summary={})
+        self.assertEqual(self.client.get(f"/api/uploads/{bare.id}/rows/").status_code, 404)
+
+
+class SeriesTests(StoredRowsMixin, TestCase):
+    def test_downsamplers_keep_extremes_and_endpoints(self):
+        x = np.arange(10_000, dtype=float)
+        y = np.sin(x / 300)
+        y[4321] = 50
+
+        idx = lttb(x, y, 200)
+        self.assertEqual(len(idx), 200)
+        self.assertEqual((idx[0], idx[-1]), (0, 9999))
+        self.assertIn(4321, idx)
+        self.assertTrue((np.diff(idx) > 0).all())
+
+        idx = minmax(y, 200)
+        self.assertLessEqual(len(idx), 200)
+        self.assertIn(4321, idx)
+        self.assertIn(int(y.argmin()), idx)
+
+    def test_upload_series_is_downsampled_and_cached(self):
+        params = {"upload": self.upload.id, "column": "Flowrate", "budget": 100}
+        r = self.client.get("/api/series/", params)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data["points"], 4000)
+        self.assertEqual(len(r.data["x"]), 100)
+        self.assertEqual(r.data["y"][-1], 1999.5)
+
+        with self.assertNumQueries(1):  # the upload lookup only
+            self.assertEqual(self.client.get("/api/series/", params).data, r.data)
+
+    def test_history_series(self):
+        UploadHistory.objects.create(filename="a.csv", summary={"avg_pressure": 3.0})
+        r = self.client.get("/api/series/", {"column": "Pressure", "method": "minmax"})
+        self.assertEqual(r.data["points"], 1)  # the other upload has no average
+        self.assertEqual(r.data["y"], [3.0])
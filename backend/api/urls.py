@@ -1,14 +1,32 @@
+from django.conf import settings
 from django.urls import path
-from .views import upload_csv
-from .views import history_api
+from .views import upload_batch, upload_csv, upload_session, upload_session_create, upload_session_finalize
+from .views import aggregate_api, dedup_stats, history_api, job_status, metrics, series_api, upload_rows
+from .views import profile_download, profiles_api
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import report_pdf
+from .views import report_pdf, upload_report
+
+if settings.ASYNC_VIEWS:
+    from .async_views import history_api, report_pdf, upload_csv, upload_report  # noqa: F811
 
 urlpatterns = [
     path("upload/", upload_csv),
+    path("upload/batch/", upload_batch),
+    path("upload/sessions/", upload_session_create),
+    path("upload/sessions/<uuid:session_id>/", upload_session),
+    path("upload/sessions/<uuid:session_id>/finalize/", upload_session_finalize),
     path("history/", history_api),
     path("login/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("report/", report_pdf),
+    path("report/<int:upload_id>/", upload_report),
+    path("jobs/<int:job_id>/", job_status),
+    path("dedup/", dedup_stats),
+    path("aggregate/", aggregate_api),
+    path("uploads/<int:upload_id>/rows/", upload_rows),
+    path("series/", series_api),
+    path("metrics/", metrics),
+    path("profiles/", profiles_api),
+    path("profiles/<str:profile_id>/", profile_download),
 ]
 
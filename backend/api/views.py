@@ -1,137 +1,441 @@
-from django.shortcuts import render
-import pandas as pd
+import hashlib
+import hmac
+import os
+
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import get_object_or_404, render
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from .serializers import UploadCSVSerializer
 from .models import UploadHistory
-from .serializers import UploadHistorySerializer
-from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from django.http import HttpResponse
+from .serializers import (
+    AggregateQuerySerializer,
+    HistoryQuerySerializer,
+    IngestJobSerializer,
+    RowQuerySerializer,
+    SeriesQuerySerializer,
+    UploadHistorySerializer,
+    UploadSessionCreateSerializer,
+    UploadSessionSerializer,
+)
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
-from .models import UploadHistory
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from .models import IngestJob, UploadHistory, UploadSession
+from . import admission, batch, caching, dedup, instrument, jobs, profiling, reports, rowquery, schema, sessions, storage
+from .downsample import downsample
+from .http import etag_matches, serve_file
+from .ingest import NUMERIC_COLUMNS, TYPE_COLUMN, merge_states
+from .pagination import encode_cursor, newer_than, older_than
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def report_pdf(request):
-    last = UploadHistory.objects.order_by("-uploaded_at").first()
-
-    if not last:
-        # still return a valid PDF (not JSON), just with a message inside
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        w, h = A4
-
-        c.setFont("Helvetica-Bold", 16)
-        c.drawString(50, h - 60, "CSV Report")
-        c.setFont("Helvetica", 12)
-        c.drawString(50, h - 90, "No uploads yet.")
-        c.showPage()
-        c.save()
-
-        pdf = buffer.getvalue()
-        buffer.close()
-
-        resp = HttpResponse(pdf, content_type="application/pdf")
-        resp["Content-Disposition"] = 'inline; filename="report.pdf"'
-        return resp
-
-    s = last.summary or {}
-
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    w, h = A4
-
-    y = h - 60
-
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, y, "CSV Report")
-    y -= 25
-
-    c.setFont("Helvetica", 12)
-    c.drawString(50, y, f"Latest file: {last.filename}")
-    y -= 18
-    c.drawString(50, y, f"Uploaded at: {last.uploaded_at}")
-    y -= 28
-
-    c.setFont("Helvetica-Bold", 13)
-    c.drawString(50, y, "Latest Summary")
-    y -= 18
-
-    c.setFont("Helvetica", 12)
-    c.drawString(50, y, f"Total equipment: {s.get('total_equipment', '-')}")
-    y -= 16
-    c.drawString(50, y, f"Avg flowrate: {s.get('avg_flowrate', '-')}")
-    y -= 16
-    c.drawString(50, y, f"Avg pressure: {s.get('avg_pressure', '-')}")
-    y -= 16
-    c.drawString(50, y, f"Avg temperature: {s.get('avg_temperature', '-')}")
-    y -= 26
-
-    dist = s.get("type_distribution", {}) or {}
-    c.setFont("Helvetica-Bold", 13)
-    c.drawString(50, y, "Type Distribution")
-    y -= 18
-
-    c.setFont("Helvetica", 12)
-    if not dist:
-        c.drawString(50, y, "No type_distribution found.")
-        y -= 16
-    else:
-        for k, v in dist.items():
-            if y < 80:  # new page safety
-                c.showPage()
-                y = h - 60
-            c.drawString(60, y, f"{k}: {v}")
-            y -= 16
+    with instrument.span("query"):
+        last = UploadHistory.objects.order_by("-uploaded_at", "-id").first()
+    return serve_report(request, last, reports.cached_report(last))
+
 
-    c.showPage()
-    c.save()
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def upload_report(request, upload_id):
+    with instrument.span("query"):
+        upload = get_object_or_404(UploadHistory, id=upload_id)
+    return serve_report(request, upload, reports.cached_report(upload))
 
-    pdf = buffer.getvalue()
-    buffer.close()
 
-    resp = HttpResponse(pdf, content_type="application/pdf")
-    resp["Content-Disposition"] = 'inline; filename="report.pdf"'
-    return resp
+def serve_report(request, upload, path):
+    # a FileResponse, so the cached PDF is streamed rather than read into memory
+    return serve_file(
+        request,
+        path,
+        content_type="application/pdf",
+        etag=reports.report_etag(path),
+        last_modified=upload.uploaded_at if upload else None,
+        disposition=f'inline; filename="report-{upload.id}.pdf"' if upload else 'inline; filename="report.pdf"',
+    )
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser])
 def upload_csv(request):
-    s = UploadCSVSerializer(data=request.data)
-    s.is_valid(raise_exception=True)
+    with admission.admit(request):
+        # DRF parses the multipart body lazily, on first access to request.data
+        with instrument.span("multipart", bytes=int(request.headers.get("Content-Length") or 0)):
+            s = UploadCSVSerializer(data=request.data)
+            s.is_valid(raise_exception=True)
+
+        f = s.validated_data["file"]
+        path, content_hash = jobs.spool_upload(f)
+
+        return _accept_spooled(path, f.name, content_hash)
 
-    f = s.validated_data["file"]
-    df = pd.read_csv(f)
-
-    summary = {
-        "total_equipment": len(df),
-        "avg_flowrate": df["Flowrate"].mean(),
-        "avg_pressure": df["Pressure"].mean(),
-        "avg_temperature": df["Temperature"].mean(),
-        "type_distribution": df["Type"].value_counts().to_dict(),
-    }
-    
-    UploadHistory.objects.create(
-        filename=f.name,
-        summary=summary
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser])
+def upload_batch(request):
+    """Several CSVs (or zip archives of them) as repeated "files" fields,
+    ingested together; responds with one result per file."""
+    with admission.admit(request):
+        files = request.FILES.getlist("files")
+        if not files:
+            raise ValidationError({"files": "No files were uploaded."})
+        try:
+            items = batch.spool_files(files)
+        except batch.BatchError as e:
+            raise ValidationError({"files": str(e)})
+
+        results = batch.ingest_batch(items)
+    created = any("upload_id" in r for r in results)
+    return Response({"results": results}, status=201 if created else 400)
+
+
+def _accept_spooled(path, filename, content_hash):
+    """Reuse a known summary or queue the spooled file for ingestion."""
+    with instrument.span("dedup"):
+        upload = dedup.reuse(content_hash, filename)
+    if upload is not None:
+        os.remove(path)
+        return Response(
+            {"message": "uploaded", "upload_id": upload.id, "duplicate": True},
+            status=201,
+        )
+
+    # reject files that cannot match the schema now rather than in the job
+    try:
+        with instrument.span("schema"):
+            schema.EQUIPMENT.check(schema.read_header(path))
+    except schema.SchemaError as e:
+        os.remove(path)
+        raise ValidationError({"file": e.errors})
+
+    with instrument.span("enqueue"):
+        job = jobs.enqueue(filename, path, content_hash)
+
+    return Response(
+        {"message": "queued", "job_id": job.id, "status": job.status},
+        status=202,
     )
-    
-    keep_ids = UploadHistory.objects.order_by("-uploaded_at").values_list("id", flat=True)[:5]
-    UploadHistory.objects.exclude(id__in=keep_ids).delete()
 
-    
-    return Response({"message": "uploaded"}, status=201)
+
+def _session_state(session):
+    data = UploadSessionSerializer(session).data
+    data["offset"], data["missing"] = sessions.progress(session)
+    return data
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def upload_session_create(request):
+    s = UploadSessionCreateSerializer(data=request.data)
+    s.is_valid(raise_exception=True)
+    session = sessions.create(**s.validated_data)
+    return Response(_session_state(session), status=201)
+
+
+@api_view(["GET", "PUT"])
+@permission_classes([IsAuthenticated])
+@parser_classes([])
+def upload_session(request, session_id):
+    """GET: received offset and missing chunks. PUT ?offset=N: one chunk as
+    the raw body, with its hex SHA-256 in X-Chunk-SHA256."""
+    session = get_object_or_404(UploadSession, id=session_id)
+    if request.method == "GET":
+        return Response(_session_state(session))
+
+    if session.status != UploadSession.OPEN:
+        return Response({"detail": "Upload session is already finalized."}, status=409)
+    sha256 = request.headers.get("X-Chunk-SHA256")
+    if not sha256:
+        raise ValidationError({"X-Chunk-SHA256": "This header is required."})
+    try:
+        offset = int(request.query_params.get("offset", ""))
+        if int(request.headers.get("Content-Length") or 0) > settings.UPLOAD_CHUNK_MAX_BYTES:
+            raise sessions.ChunkError("chunk is too large")
+        sessions.write_chunk(session, offset, request, sha256)
+    except FileNotFoundError:
+        # finalized (or expired) while this chunk was on its way
+        return Response({"detail": "Upload session is already finalized."}, status=409)
+    except ValueError:
+        raise ValidationError({"offset": "A byte offset is required."})
+    except sessions.ChunkError as e:
+        raise ValidationError({"chunk": str(e)})
+    return Response(_session_state(session))
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def upload_session_finalize(request, session_id):
+    session = get_object_or_404(UploadSession, id=session_id)
+    try:
+        claimed = sessions.claim_for_finalize(session)
+    except sessions.ChunkError as e:
+        raise ValidationError({"chunk": str(e)})
+    if not claimed:
+        return Response({"detail": "Upload session is already finalized."}, status=409)
+
+    path, content_hash = sessions.spool(session)
+    response = _accept_spooled(path, session.filename, content_hash)
+    if "job_id" in response.data:
+        UploadSession.objects.filter(id=session.id).update(job_id=response.data["job_id"])
+    return response
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def job_status(request, job_id):
+    job = get_object_or_404(IngestJob, id=job_id)
+    return Response(IngestJobSerializer(job).data)
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def history_api(request):
-    latest = UploadHistory.objects.order_by("-uploaded_at")[:5]
-    s = UploadHistorySerializer(latest, many=True)
-    return Response(s.data)
+    """Upload history, newest first, keyset-paginated on (uploaded_at, id).
+
+    `cursor` continues to older entries (from X-Next-Cursor); `since`
+    returns only entries newer than a previous X-Since-Cursor.
+    """
+    q = HistoryQuerySerializer(data=request.query_params)
+    q.is_valid(raise_exception=True)
+    params = q.validated_data
+
+    key = history_cache_key(caching.history_token(), params)
+    entry = cache.get(key)
+    if entry is None:
+        with instrument.span("query"):
+            rows = list(history_query(params))
+        entry = history_entry(params, rows)
+        cache.set(key, entry, settings.HISTORY_CACHE_SECONDS)
+    return history_response(request, entry)
+
+
+# shared with async_views.history_api
+
+def history_cache_key(token, params):
+    return "history:{}:{}:{}:{}".format(token, params["limit"], params.get("cursor", ""), params.get("since", ""))
+
+
+def history_query(params):
+    """Rows for one history page: oldest-first for `since` (so repeated
+    polls never skip entries), otherwise newest-first plus one extra row
+    to tell whether there is a next page."""
+    limit = params["limit"]
+    if "since" in params:
+        return UploadHistory.objects.filter(newer_than(params["since"])).order_by("uploaded_at", "id")[:limit]
+    qs = UploadHistory.objects.order_by("-uploaded_at", "-id")
+    if "cursor" in params:
+        qs = qs.filter(older_than(params["cursor"]))
+    return qs[:limit + 1]
+
+
+def history_entry(params, rows):
+    """The cached (etag, body, headers) for `rows` from history_query()."""
+    limit = params["limit"]
+    headers = {}
+    if "since" in params:
+        page = rows[::-1]
+        headers["X-Since-Cursor"] = encode_cursor(page[0]) if page else params["since"]
+    else:
+        page = rows[:limit]
+        if len(rows) > limit:
+            headers["X-Next-Cursor"] = encode_cursor(page[-1])
+        if page and "cursor" not in params:
+            headers["X-Since-Cursor"] = encode_cursor(page[0])
+
+    with instrument.span("serialize") as span:
+        body = JSONRenderer().render(UploadHistorySerializer(page, many=True).data)
+        span.count(bytes=len(body), rows=len(page))
+    return (f'"{hashlib.sha256(body).hexdigest()}"', body, headers)
+
+
+def history_response(request, entry):
+    etag, body, headers = entry
+    if etag_matches(request, etag):
+        resp = HttpResponseNotModified()
+    else:
+        resp = HttpResponse(body, content_type="application/json")
+    for name, value in headers.items():
+        resp[name] = value
+    resp["ETag"] = etag
+    resp["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def metrics(request):
+    """Prometheus text exposition of this process's REGISTRY.
+
+    Needs no login so a scraper can read it; answered only when the request
+    carries `Authorization: Bearer <METRICS_TOKEN>` or comes from one of
+    METRICS_ALLOWED_IPS (none by default: behind a reverse proxy every
+    client looks local).
+    """
+    token = settings.METRICS_TOKEN
+    sent = request.headers.get("Authorization", "")
+    if not (
+        (token and hmac.compare_digest(sent.encode(), f"Bearer {token}".encode()))
+        or request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+    ):
+        raise Http404
+    return HttpResponse(instrument.REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def profiles_api(request):
+    """Stored request profiles (see profiling.py), newest first."""
+    return Response(profiling.summaries())
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def profile_download(request, profile_id):
+    path = profiling.dump_path(profile_id)
+    if path is None:
+        raise NotFound("No stored profile with this id.")
+    return serve_file(
+        request,
+        path,
+        content_type="application/octet-stream",
+        etag=f'"{profile_id}"',
+        disposition=f'attachment; filename="{profile_id}.prof"',
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def dedup_stats(request):
+    return Response(dedup.stats())
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def aggregate_api(request):
+    q = AggregateQuerySerializer(data=request.query_params)
+    q.is_valid(raise_exception=True)
+    params = q.validated_data
+
+    qs = UploadHistory.objects.order_by("-uploaded_at", "-id")
+    if "ids" in params:
+        qs = qs.filter(id__in=params["ids"])
+    if "since" in params:
+        qs = qs.filter(uploaded_at__gte=params["since"])
+    if "until" in params:
+        qs = qs.filter(uploaded_at__lt=params["until"])
+    if "last" in params:
+        qs = qs[:params["last"]]
+
+    ids, skipped = [], []
+
+    def states():
+        for upload_id, state in qs.values_list("id", "state").iterator():
+            if state is None:
+                skipped.append(upload_id)
+            else:
+                ids.append(upload_id)
+                yield state
+
+    result = merge_states(states()).summary(include_state=False)
+    result["uploads"] = ids
+    result["skipped"] = skipped
+    return Response(result)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def upload_rows(request, upload_id):
+    upload = get_object_or_404(UploadHistory, id=upload_id)
+    store = storage.open_columns(upload)
+    if store is None:
+        raise NotFound("No stored rows for this upload.")
+
+    q = RowQuerySerializer(data=request.query_params)
+    q.is_valid(raise_exception=True)
+    params = q.validated_data
+
+    equals = {TYPE_COLUMN: params["type"]} if "type" in params else {}
+    ranges = {}
+    for col in NUMERIC_COLUMNS:
+        lo = params.get(f"{col.lower()}_min")
+        hi = params.get(f"{col.lower()}_max")
+        if lo is not None or hi is not None:
+            ranges[col] = (lo, hi)
+
+    fields = params["fields"].split(",") if params.get("fields") else store.columns
+    unknown = [f for f in fields if f not in store.columns]
+    if params.get("sort") and params["sort"].lstrip("-") not in store.columns:
+        unknown.append(params["sort"].lstrip("-"))
+    if unknown:
+        raise ValidationError({"detail": f"Unknown column(s): {', '.join(unknown)}"})
+
+    positions, scanned = rowquery.match_positions(store, equals, ranges)
+    page = rowquery.order_page(store, positions, params.get("sort"), params["offset"], params["limit"])
+    return Response({
+        "count": len(positions),
+        "offset": params["offset"],
+        "limit": params["limit"],
+        "blocks_scanned": scanned,
+        "blocks_total": store.blocks,
+        "rows": rowquery.fetch_rows(store, page, fields),
+    })
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def series_api(request):
+    """Downsampled Flowrate/Pressure/Temperature series.
+
+    With `upload` the series is that upload's rows (x = row number);
+    without it, the per-upload averages over the whole history
+    (x = upload time, epoch seconds).
+    """
+    q = SeriesQuerySerializer(data=request.query_params)
+    q.is_valid(raise_exception=True)
+    params = q.validated_data
+    column, budget, method = params["column"], params["budget"], params["method"]
+
+    if "upload" in params:
+        upload = get_object_or_404(UploadHistory, id=params["upload"])
+        # column stores are content-addressed, so this never goes stale
+        key = f"series:{upload.columns_path}:{column}:{budget}:{method}"
+    else:
+        key = f"series:history:{caching.history_token()}:{column}:{budget}:{method}"
+
+    data = cache.get(key)
+    if data is None:
+        if "upload" in params:
+            store = storage.open_columns(upload)
+            if store is None:
+                raise NotFound("No stored rows for this upload.")
+            y = store.column(column)
+            x = np.arange(len(y))
+        else:
+            # only the average, not each row's whole summary JSON
+            rows = UploadHistory.objects.order_by("uploaded_at").values_list(
+                "uploaded_at", f"summary__{NUMERIC_COLUMNS[column]}"
+            )
+            x, y = [], []
+            for uploaded_at, value in rows.iterator():
+                x.append(uploaded_at.timestamp())
+                y.append(np.nan if value is None else value)
+
+        points = int(np.count_nonzero(~np.isnan(np.asarray(y, dtype="float64"))))
+        xs, ys = downsample(x, y, budget, method)
+        data = {
+            "column": column,
+            "method": method,
+            "budget": budget,
+            "points": points,
+            "x": xs.tolist(),
+            "y": ys.tolist(),
+        }
+        cache.set(key, data, settings.SERIES_CACHE_SECONDS)
+    return Response(data)
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# a serving process: start the ingest workers and retention scheduler
+from api.apps import start_background_tasks  # noqa: E402
+
+start_background_tasks()
@@ -13,12 +13,15 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 import os
 
 load_dotenv()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
+# Spool, column store, caches, reports and profiles live under here.
+VAR_DIR = Path(os.getenv("VAR_DIR", BASE_DIR / "var"))
 
 
 # Quick-start development settings - unsuitable for production
@@ -61,6 +64,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its timings include the rest of the stack
+    'api.instrument.InstrumentationMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,11 +100,57 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_PROFILE picks "sqlite" (default) or "postgres". Connections are kept
+# for DB_CONN_MAX_AGE seconds instead of being opened per request.
+DB_PROFILE = os.getenv("DB_PROFILE", "sqlite")
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "60"))
+
+if DB_PROFILE == "postgres":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv("DB_NAME", "equipment"),
+            'USER': os.getenv("DB_USER", "postgres"),
+            'PASSWORD': os.getenv("DB_PASSWORD", ""),
+            'HOST': os.getenv("DB_HOST", "localhost"),
+            'PORT': os.getenv("DB_PORT", "5432"),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    # psycopg 3's pool (needs psycopg[pool]) replaces persistent connections
+    if os.getenv("DB_POOL") == "1":
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.getenv("DB_POOL_MIN", "2")),
+                'max_size': int(os.getenv("DB_POOL_MAX", "20")),
+            },
+        }
+elif DB_PROFILE == "sqlite":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv("DB_NAME") or BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # take the write lock when a transaction starts, so two
+                # writers wait on busy_timeout instead of deadlocking
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # a file rather than :memory: so tests run with WAL too
+            'TEST': {'NAME': BASE_DIR / 'test-db.sqlite3'},
+        }
     }
+else:
+    raise ImproperlyConfigured(f"Unknown DB_PROFILE {DB_PROFILE!r}")
+
+# Applied to every new SQLite connection (api/db.py).
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
 }
 
 
@@ -138,5 +190,111 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+
+# Cache
+# File-based so every server process and `manage.py ingest_worker` see the
+# same invalidations.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv("CACHE_DIR", str(VAR_DIR / "cache")),
+    }
+}
+
+# `manage.py test` swaps in a local-memory cache (api/testing.py).
+TEST_RUNNER = "api.testing.TestRunner"
+
+HISTORY_CACHE_SECONDS = int(os.getenv("HISTORY_CACHE_SECONDS", "300"))
+SERIES_CACHE_SECONDS = int(os.getenv("SERIES_CACHE_SECONDS", "3600"))
+
 CORS_ALLOW_ALL_ORIGINS = True
-CORS_ALLOW_CREDENTIALS = True
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ["ETag", "Retry-After", "Server-Timing", "X-Next-Cursor", "X-Profile-Id", "X-Since-Cursor"]
+
+# Serve upload, history and report from the async views (api/async_views.py);
+# meant for ASGI servers such as `uvicorn backend.asgi:application`. Their
+# blocking work runs on ASYNC_CPU_WORKERS threads.
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "0") == "1"
+ASYNC_CPU_WORKERS = int(os.getenv("ASYNC_CPU_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+# CSV ingestion
+# Uploads are read in chunks of this many rows so memory stays flat.
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "100000"))
+# CSV parser: "c" (pandas), "pyarrow", or "auto" = pyarrow when installed.
+CSV_ENGINE = os.getenv("CSV_ENGINE", "auto")
+
+# Uploads at least this big are split across a process pool of
+# CSV_PARALLEL_WORKERS (defaults to one per core).
+CSV_PARALLEL_THRESHOLD_BYTES = int(os.getenv("CSV_PARALLEL_THRESHOLD_BYTES", str(256 * 1024 * 1024)))
+CSV_PARALLEL_WORKERS = int(os.getenv("CSV_PARALLEL_WORKERS", "0")) or os.cpu_count()
+
+# Ingestion queue
+# Uploads are spooled here and processed by INGEST_WORKERS background
+# threads per server process, started by the WSGI/ASGI entrypoints unless
+# BACKGROUND_TASKS=0 (which also stops the retention scheduler). Set
+# INGEST_WORKERS to 0 to leave jobs for `manage.py ingest_worker`. A
+# running job touches its heartbeat every INGEST_HEARTBEAT_SECONDS; one
+# with no heartbeat for INGEST_JOB_TIMEOUT_SECONDS is assumed lost with
+# its process and queued again (0 = never).
+BACKGROUND_TASKS = os.getenv("BACKGROUND_TASKS", "1") == "1"
+INGEST_SPOOL_DIR = VAR_DIR / "spool"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "2"))
+INGEST_HEARTBEAT_SECONDS = float(os.getenv("INGEST_HEARTBEAT_SECONDS", "30"))
+INGEST_JOB_TIMEOUT_SECONDS = int(os.getenv("INGEST_JOB_TIMEOUT_SECONDS", "300"))
+
+# Resumable uploads: default and largest accepted chunk, the largest
+# file, and how long an idle or finalized session is kept before
+# retention removes it.
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_CHUNK_MAX_BYTES = int(os.getenv("UPLOAD_CHUNK_MAX_BYTES", str(64 * 1024 * 1024)))
+UPLOAD_SESSION_MAX_BYTES = int(os.getenv("UPLOAD_SESSION_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "48"))
+
+# Admission control (api/admission.py), per server process: uploads handled
+# at once, their total Content-Length, and how many may wait (and for how
+# long) before getting 429 with Retry-After.
+ADMISSION_MAX_UPLOADS = int(os.getenv("ADMISSION_MAX_UPLOADS", "4"))
+ADMISSION_MAX_BYTES = int(os.getenv("ADMISSION_MAX_BYTES", str(512 * 1024 * 1024)))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))
+ADMISSION_QUEUE_SECONDS = float(os.getenv("ADMISSION_QUEUE_SECONDS", "30"))
+
+# Most files (zip members included) accepted by /api/upload/batch/, and
+# the most bytes one zip member, and all of them together, may unpack to.
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "100"))
+UPLOAD_BATCH_MAX_MEMBER_BYTES = int(os.getenv("UPLOAD_BATCH_MAX_MEMBER_BYTES", str(1024 * 1024 * 1024)))
+UPLOAD_BATCH_MAX_UNZIPPED_BYTES = int(os.getenv("UPLOAD_BATCH_MAX_UNZIPPED_BYTES", str(4 * 1024 * 1024 * 1024)))
+
+# Upload history retention; 0 disables a limit.
+HISTORY_RETENTION_COUNT = int(os.getenv("HISTORY_RETENTION_COUNT", "1000"))
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "0"))
+# Retention is applied by `manage.py prune_history`, after `import_csvs`,
+# by `ingest_worker` and, when the interval is non-zero, by a background
+# thread in every server process.
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "300"))
+
+# Keep each upload's rows as memory-mappable column files.
+COLUMN_STORE_ENABLED = os.getenv("COLUMN_STORE_ENABLED", "1") == "1"
+COLUMN_STORE_DIR = VAR_DIR / "columns"
+
+# /api/metrics/ needs no login; it is answered for requests with
+# `Authorization: Bearer <METRICS_TOKEN>` and for clients in
+# METRICS_ALLOWED_IPS. Both are empty by default, which turns it off.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv("METRICS_ALLOWED_IPS", "").split(",") if ip.strip()]
+
+# Profiles of staff requests sent with `X-Profile: 1` or `?profile=1`,
+# evicted least-recently-used past the size budget.
+PROFILE_DIR = VAR_DIR / "profiles"
+PROFILE_MAX_BYTES = int(os.getenv("PROFILE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Rendered PDF reports, evicted least-recently-used past the size budget.
+REPORT_CACHE_DIR = VAR_DIR / "reports"
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Histogram bins (JSON) behind the report charts, keyed by column store and
+# shared by every report on the same rows.
+CHART_CACHE_DIR = VAR_DIR / "charts"
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# a serving process: start the ingest workers and retention scheduler
+from api.apps import start_background_tasks  # noqa: E402
+
+start_background_tasks()
@@ -0,0 +1,224 @@
+"""Concurrent-request capacity under WSGI (gunicorn) and ASGI (uvicorn).
+
+    pip install gunicorn uvicorn
+    python -m benchmarks.concurrency --workers 2 --pollers 8 32 128 --output load.json
+
+For each server and poller count, --slow-uploads clients send CSVs at
+--upload-rate bytes/s (a slow site link) while --pollers clients poll
+/api/history/ back to back for --duration seconds. Each case reports
+history requests/s, p50/p95/p99 latency, errors and finished uploads.
+
+gunicorn runs sync workers with the DRF views (the WSGI deployment);
+uvicorn runs the async views (ASYNC_VIEWS=1). Both get --workers
+processes. The servers use a scratch database and VAR_DIR, so the
+development data is never touched.
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    "wsgi": (["gunicorn", "backend.wsgi:application", "--worker-class", "sync"], {}),
+    "asgi": (["uvicorn", "backend.asgi:application", "--log-level", "warning"],
+             # async views share connections through one thread per process
+             {"ASYNC_VIEWS": "1", "DB_CONN_MAX_AGE": "0"}),
+}
+
+
+def server_command(kind, workers, port):
+    argv, env = SERVERS[kind]
+    if kind == "wsgi":
+        argv = argv + ["--workers", str(workers), "--bind", f"127.0.0.1:{port}"]
+    else:
+        argv = argv + ["--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)]
+    return [sys.executable, "-m", *argv], env
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/history/")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def multipart(data, filename):
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: text/csv\r\n\r\n").encode()
+    return head + data + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Load:
+    def __init__(self, port, token, csv_bytes, upload_rate):
+        self.port = port
+        self.auth = {"Authorization": f"Bearer {token}"}
+        self.csv_bytes = csv_bytes
+        self.upload_rate = upload_rate
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.uploads = 0
+
+    def poll(self, deadline):
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+                conn.request("GET", "/api/history/?limit=20", headers=self.auth)
+                resp = conn.getresponse()
+                resp.read()
+                conn.close()
+                ok = resp.status == 200
+            except OSError:
+                ok = False
+            with self.lock:
+                if ok:
+                    self.latencies.append(time.perf_counter() - t0)
+                else:
+                    self.errors += 1
+
+    def slow_upload(self, deadline):
+        piece = 16 * 1024
+        while time.monotonic() < deadline:
+            # unique bytes, so every upload is parsed rather than deduplicated
+            body, content_type = multipart(self.csv_bytes + f"# {uuid.uuid4().hex}\n".encode(), "site.csv")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+                conn.putrequest("POST", "/api/upload/")
+                for name, value in {**self.auth, "Content-Type": content_type,
+                                    "Content-Length": str(len(body))}.items():
+                    conn.putheader(name, value)
+                conn.endheaders()
+                for start in range(0, len(body), piece):
+                    conn.send(body[start:start + piece])
+                    time.sleep(piece / self.upload_rate)
+                resp = conn.getresponse()
+                resp.read()
+                conn.close()
+                if resp.status in (201, 202):
+                    with self.lock:
+                        self.uploads += 1
+            except OSError:
+                pass
+
+    def run(self, pollers, uploaders, duration):
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=self.slow_upload, args=(deadline,)) for _ in range(uploaders)]
+        threads += [threading.Thread(target=self.poll, args=(deadline,)) for _ in range(pollers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        ms = [x * 1000 for x in self.latencies]
+        return {
+            "history_rps": len(ms) / duration,
+            "p50_ms": percentile(ms, 50),
+            "p95_ms": percentile(ms, 95),
+            "p99_ms": percentile(ms, 99),
+            "mean_ms": statistics.fmean(ms) if ms else None,
+            "errors": self.errors,
+            "uploads": self.uploads,
+        }
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--servers", nargs="+", choices=sorted(SERVERS), default=["wsgi", "asgi"])
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--pollers", type=int, nargs="+", default=[8, 32, 128])
+    p.add_argument("--slow-uploads", type=int, default=4)
+    p.add_argument("--upload-rate", type=int, default=256 * 1024, help="Bytes/s per slow upload.")
+    p.add_argument("--rows", type=int, default=20_000, help="Rows in each uploaded CSV.")
+    p.add_argument("--history", type=int, default=200, help="Upload history rows to seed.")
+    p.add_argument("--duration", type=float, default=10)
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--output", help="Write the JSON results here (default: stdout).")
+    args = p.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="load-")
+    env = {
+        "DB_PROFILE": "sqlite",
+        "DB_NAME": os.path.join(scratch, "db.sqlite3"),
+        "VAR_DIR": scratch,
+        "INGEST_WORKERS": "0",
+        "RETENTION_INTERVAL_SECONDS": "0",
+        "HISTORY_RETENTION_COUNT": "0",
+    }
+    os.environ.update(env)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+    import django
+    django.setup()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from api.models import UploadHistory
+
+    from .endpoints import environment
+    from .synth import write_equipment_csv
+
+    try:
+        call_command("migrate", verbosity=0)
+        token = str(RefreshToken.for_user(User.objects.create_user("load")).access_token)
+        UploadHistory.objects.bulk_create(
+            UploadHistory(filename=f"seed-{i}.csv", summary={"total_equipment": i}) for i in range(args.history)
+        )
+        csv_path = write_equipment_csv(os.path.join(scratch, "site.csv"), args.rows)
+        with open(csv_path, "rb") as f:
+            csv_bytes = f.read()
+
+        out = {"environment": environment(), "args": vars(args), "results": {}}
+        for kind in args.servers:
+            argv, server_env = server_command(kind, args.workers, args.port)
+            server = subprocess.Popen(argv, cwd=BACKEND_DIR, env={**os.environ, **server_env},
+                                      stdout=subprocess.DEVNULL)
+            try:
+                wait_ready(args.port)
+                out["results"][kind] = cases = {}
+                for pollers in args.pollers:
+                    load = Load(args.port, token, csv_bytes, args.upload_rate)
+                    cases[str(pollers)] = r = load.run(pollers, args.slow_uploads, args.duration)
+                    print(f"{kind} {pollers:>4} pollers: {r['history_rps']:8.1f} req/s, "
+                          f"p95 {r['p95_ms'] or 0:8.1f} ms, {r['errors']} errors, {r['uploads']} uploads",
+                          file=sys.stderr)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    text = json.dumps(out, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
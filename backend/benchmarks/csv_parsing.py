@@ -0,0 +1,68 @@
+"""Schema-driven parsing vs. pandas dtype inference on synthetic CSVs.
+
+    python -m benchmarks.csv_parsing --rows 1000000
+
+"inference" is plain chunked pd.read_csv, as ingestion used to parse;
+"schema/<engine>" is schema.read_chunks with usecols, explicit dtypes and
+a categorical Type. Peak memory is what tracemalloc sees while iterating.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from api.schema import EQUIPMENT, arrow_available, read_chunks
+
+from .synth import write_equipment_csv
+
+
+def inference(path, chunksize):
+    return pd.read_csv(path, chunksize=chunksize)
+
+
+def schema_reader(engine):
+    return lambda path, chunksize: read_chunks(path, EQUIPMENT, chunksize, engine=engine)
+
+
+def measure(open_reader, path, chunksize):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    rows = 0
+    with open_reader(path, chunksize) as chunks:
+        for chunk in chunks:
+            rows += len(chunk)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return rows, elapsed, peak
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    p.add_argument("--chunksize", type=int, default=100_000)
+    p.add_argument("--dir", default=tempfile.gettempdir())
+    args = p.parse_args()
+
+    readers = {"inference": inference, "schema/c": schema_reader("c")}
+    if arrow_available():
+        readers["schema/pyarrow"] = schema_reader("pyarrow")
+
+    print(f"{'rows':>12} {'parser':>15} {'seconds':>8} {'peak MB':>8} {'speedup':>8}")
+    for rows in args.rows:
+        path = os.path.join(args.dir, f"equipment-{rows}.csv")
+        if not os.path.exists(path):
+            write_equipment_csv(path, rows)
+        base = None
+        for name, open_reader in readers.items():
+            n, seconds, peak = measure(open_reader, path, args.chunksize)
+            assert n == rows, (name, n)
+            base = base or seconds
+            print(f"{rows:>12} {name:>15} {seconds:>8.2f} {peak / 1e6:>8.1f} {base / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""End-to-end timings of upload, history and report through Django's test client.
+
+    python -m benchmarks.endpoints --rows 1000 100000 10000000 --output bench.json
+    python -m benchmarks.endpoints --rows 1000 100000 --compare bench.json
+
+Runs against a throwaway test database and temporary spool, column, report,
+chart, profile and cache directories, so the development data is never
+touched. Every
+case is timed --repeat times; the JSON output holds each sample plus
+min/median/mean and the environment, and --compare flags cases whose
+median got slower than --threshold relative to an earlier run (exit
+status 1).
+
+The test client builds multipart bodies in memory, so a 10M-row run
+needs roughly the CSV's size (~500 MB) in free RAM.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from api import jobs, reports  # noqa: E402
+from api.models import ContentDigest  # noqa: E402
+
+from .synth import write_equipment_csv  # noqa: E402
+
+DEFAULT_ROWS = [1_000, 10_000, 100_000, 1_000_000]
+
+
+def environment():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        rev = None
+    return {
+        "git": rev,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "db": connection.vendor,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def summarize(samples):
+    return {
+        "samples": samples,
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+    }
+
+
+class Bench:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get_or_create(username="bench")[0])
+
+    def time(self, fn, setup=None):
+        samples = []
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            t0 = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t0)
+        return summarize(samples)
+
+    def upload(self, path):
+        with open(path, "rb") as f:
+            r = self.client.post("/api/upload/", {"file": f}, format="multipart")
+        assert r.status_code in (201, 202), r.content
+        if r.status_code == 202:
+            jobs.run_pending()
+        return r
+
+    def get(self, url):
+        r = self.client.get(url)
+        assert r.status_code == 200, r.status_code
+        if r.streaming:
+            # drain file responses so reading is part of the timing
+            for _ in r.streaming_content:
+                pass
+        return r
+
+    def run(self, path):
+        results = {}
+        # cold: no cached summary, so the file is parsed every time
+        results["upload"] = self.time(lambda: self.upload(path), setup=lambda: ContentDigest.objects.all().delete())
+        # warm: same bytes again, answered from the content digest
+        results["upload_duplicate"] = self.time(lambda: self.upload(path))
+        results["history_cold"] = self.time(lambda: self.get("/api/history/"), setup=cache.clear)
+        results["history_warm"] = self.time(lambda: self.get("/api/history/"))
+        results["report_cold"] = self.time(
+            lambda: self.get("/api/report/"),
+            setup=lambda: reports.report_cache().discard("report-"),
+        )
+        results["report_warm"] = self.time(lambda: self.get("/api/report/"))
+        return results
+
+
+def compare(current, baseline, threshold):
+    """Lines describing cases whose median is `threshold` x slower than before."""
+    slower = []
+    for rows, cases in current["results"].items():
+        for name, stats in cases.items():
+            old = baseline.get("results", {}).get(rows, {}).get(name)
+            if old and stats["median"] > old["median"] * threshold:
+                slower.append(f"{name} @ {rows} rows: {old['median']:.4f}s -> {stats['median']:.4f}s "
+                              f"({stats['median'] / old['median']:.2f}x)")
+    return slower
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    p.add_argument("--types", type=int, default=5)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--dir", default=tempfile.gettempdir(), help="Where generated CSVs are kept.")
+    p.add_argument("--output", help="Write the JSON results here (default: stdout).")
+    p.add_argument("--compare", help="Earlier JSON results to check against.")
+    p.add_argument("--threshold", type=float, default=1.2)
+    args = p.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench-")
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with override_settings(
+            INGEST_WORKERS=0,
+            RETENTION_INTERVAL_SECONDS=0,
+            INGEST_SPOOL_DIR=os.path.join(scratch, "spool"),
+            COLUMN_STORE_DIR=os.path.join(scratch, "columns"),
+            REPORT_CACHE_DIR=os.path.join(scratch, "reports"),
+            CHART_CACHE_DIR=os.path.join(scratch, "charts"),
+            PROFILE_DIR=os.path.join(scratch, "profiles"),
+            CACHES={"default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": os.path.join(scratch, "cache"),
+            }},
+        ):
+            bench = Bench(args.repeat)
+            out = {"environment": environment(), "repeat": args.repeat, "results": {}}
+            for rows in args.rows:
+                path = os.path.join(args.dir, f"equipment-{rows}-{args.types}.csv")
+                if not os.path.exists(path):
+                    write_equipment_csv(path, rows, n_types=args.types)
+                out["results"][str(rows)] = cases = bench.run(path)
+                for name, stats in cases.items():
+                    print(f"{rows:>10} {name:>18} {stats['median']:>9.4f}s", file=sys.stderr)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    text = json.dumps(out, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(out, json.load(f), args.threshold)
+        for line in slower:
+            print(f"SLOWER {line}", file=sys.stderr)
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Serial vs. process-pool summary aggregation on synthetic CSVs.
+
+    python -m benchmarks.parallel_aggregation --rows 1000000 10000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from api.ingest import summarize_csv, summarize_csv_parallel
+
+from .synth import write_equipment_csv
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - t0
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    p.add_argument("--workers", type=int, default=os.cpu_count())
+    p.add_argument("--chunksize", type=int, default=100_000)
+    p.add_argument("--dir", default=tempfile.gettempdir())
+    args = p.parse_args()
+
+    print(f"{'rows':>12} {'MB':>8} {'serial s':>9} {'parallel s':>10} {'speedup':>8}")
+    for rows in args.rows:
+        path = os.path.join(args.dir, f"equipment-{rows}.csv")
+        if not os.path.exists(path):
+            write_equipment_csv(path, rows)
+        mb = os.path.getsize(path) / 1e6
+
+        # warm the pool so worker start-up is not billed to the first run
+        summarize_csv_parallel(path, workers=args.workers, chunksize=args.chunksize)
+
+        serial = timed(summarize_csv, path, chunksize=args.chunksize)
+        parallel = timed(summarize_csv_parallel, path, workers=args.workers, chunksize=args.chunksize)
+        print(f"{rows:>12} {mb:>8.1f} {serial:>9.2f} {parallel:>10.2f} {serial / parallel:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
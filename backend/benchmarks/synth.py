@@ -0,0 +1,76 @@
+"""Deterministic synthetic equipment CSVs.
+
+    python -m benchmarks.synth out.csv --rows 1000000 --types 8 --type-skew 1.2
+
+The same arguments (and seed) always produce the same bytes.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+TYPE_NAMES = ["Pump", "Valve", "Compressor", "Heat Exchanger", "Reactor", "Condenser"]
+
+# column -> (mean, standard deviation) of a normal distribution
+DISTRIBUTIONS = {
+    "Flowrate": (120, 25),
+    "Pressure": (6, 1.2),
+    "Temperature": (110, 15),
+}
+
+
+def type_names(n):
+    return [TYPE_NAMES[i] if i < len(TYPE_NAMES) else f"Type-{i}" for i in range(n)]
+
+
+def type_weights(n, skew=0.0):
+    """Zipf-like Type frequencies; skew 0 is uniform."""
+    w = 1.0 / np.arange(1, n + 1) ** skew
+    return w / w.sum()
+
+
+def write_equipment_csv(path, rows, n_types=5, seed=0, block=500_000, distributions=None,
+                        type_skew=0.0, missing=0.0):
+    """Write a deterministic synthetic equipment CSV with `rows` rows.
+
+    `distributions` overrides DISTRIBUTIONS per column, `type_skew` makes
+    some Types more common than others and `missing` is the fraction of
+    numeric cells left empty.
+    """
+    dists = dict(DISTRIBUTIONS, **(distributions or {}))
+    rng = np.random.default_rng(seed)
+    names = np.array(type_names(n_types))
+    weights = type_weights(n_types, type_skew) if type_skew else None
+    with open(path, "w", newline="") as f:
+        for start in range(0, rows, block):
+            n = min(block, rows - start)
+            idx = np.arange(start, start + n)
+            df = pd.DataFrame({
+                "Equipment Name": np.char.add("EQ-", idx.astype(str)),
+                # integers() for the uniform case keeps older files byte-identical
+                "Type": names[rng.choice(n_types, n, p=weights) if type_skew else rng.integers(0, n_types, n)],
+            })
+            for col, (mean, sd) in dists.items():
+                values = rng.normal(mean, sd, n).round(2)
+                if missing:
+                    values[rng.random(n) < missing] = np.nan
+                df[col] = values
+            df.to_csv(f, header=start == 0, index=False)
+    return path
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("path")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--types", type=int, default=5)
+    p.add_argument("--type-skew", type=float, default=0.0)
+    p.add_argument("--missing", type=float, default=0.0)
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+    write_equipment_csv(args.path, args.rows, n_types=args.types, seed=args.seed,
+                        type_skew=args.type_skew, missing=args.missing)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,30 @@
+import gzip
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
 
 BASE = "http://127.0.0.1:8000/api"
 
+# files at least this big go through ResumableUploader
+RESUMABLE_THRESHOLD = 64 * 1024 * 1024
+
+# how often an upload refused with 429 (server busy) is retried
+BUSY_RETRIES = 8
+
 ACCESS_TOKEN = None
 REFRESH_TOKEN = None
 
+# last /history/ response, revalidated with If-None-Match
+_history_etag = None
+_history_data = None
+
 def login(username, password):
     global ACCESS_TOKEN, REFRESH_TOKEN
 
@@ -38,16 +58,193 @@ def download_report(save_path):
                 f.write(chunk)
 
 def get_history():
-    r = requests.get(f"{BASE}/history/", headers=auth_headers(), timeout=20)
+    global _history_etag, _history_data
+
+    headers = auth_headers()
+    if _history_etag:
+        headers["If-None-Match"] = _history_etag
+
+    r = requests.get(f"{BASE}/history/", headers=headers, timeout=20)
+    if r.status_code == 304:
+        return _history_data
     if r.status_code != 200:
         raise Exception(f"History error: {r.status_code} {r.text}")
+
+    _history_data = r.json()
+    _history_etag = r.headers.get("ETag")
+    return _history_data
+
+def get_job(job_id):
+    r = requests.get(f"{BASE}/jobs/{job_id}/", headers=auth_headers(), timeout=20)
+    if r.status_code != 200:
+        raise Exception(f"Job error: {r.status_code} {r.text}")
     return r.json()
 
-def upload_csv(path):
-    with open(path, "rb") as f:
-        files = {"file": f}
-        r = requests.post(f"{BASE}/upload/", files=files, headers=auth_headers(), timeout=60)
+def wait_for_job(job_id, poll=1.0, timeout=1800):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = get_job(job_id)
+        if job["status"] == "done":
+            return job
+        if job["status"] == "failed":
+            raise Exception(f"Upload failed: {job['error']}")
+        if time.monotonic() > deadline:
+            raise Exception(f"Upload still {job['status']} after {timeout}s")
+        time.sleep(poll)
+
+def retry_delay(r, attempt, cap=120):
+    """Seconds to wait after a 429: the server's Retry-After (else
+    exponential backoff) stretched by up to half again at random, so sites
+    turned away together do not all come back at the same moment."""
+    try:
+        base = float(r.headers["Retry-After"])
+    except (KeyError, ValueError):
+        base = 2 ** attempt
+    return min(cap, base) * random.uniform(1, 1.5)
+
+def post_when_admitted(url, rewind, **kwargs):
+    """POST, retrying while the server answers 429; `rewind()` resets the
+    request body's files before each retry."""
+    for attempt in range(BUSY_RETRIES + 1):
+        r = requests.post(url, headers=auth_headers(), **kwargs)
+        if r.status_code != 429 or attempt == BUSY_RETRIES:
+            return r
+        time.sleep(retry_delay(r, attempt))
+        rewind()
+
+def gzip_to_temp(path):
+    """Gzip `path` into an anonymous temp file, rewound for reading."""
+    tmp = tempfile.TemporaryFile()
+    with open(path, "rb") as src, gzip.GzipFile(fileobj=tmp, mode="wb", compresslevel=6) as gz:
+        shutil.copyfileobj(src, gz, 1 << 20)
+    tmp.seek(0)
+    return tmp
+
+class ResumableUploader:
+    """Upload a large file in chunks that survive dropped connections.
+
+    The session id is kept in a small state file next to the upload, so a
+    new ResumableUploader for the same unchanged file (even after a
+    restart) continues where the last one stopped. `workers` chunks are in
+    flight at once; a failed chunk is retried with backoff.
+    """
 
-    if r.status_code not in (200, 201):
+    def __init__(self, path, chunk_size=8 * 1024 * 1024, workers=4, retries=5):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.retries = retries
+        st = os.stat(path)
+        self.size = st.st_size
+        self._fingerprint = [self.size, st.st_mtime_ns, chunk_size]
+        self.state_path = path + ".upload"
+
+    def _load_session(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("fingerprint") != self._fingerprint:
+            return None
+        r = requests.get(f"{BASE}/upload/sessions/{state['id']}/", headers=auth_headers(), timeout=20)
+        if r.status_code != 200 or r.json()["status"] != "open":
+            return None
+        return r.json()
+
+    def _new_session(self):
+        r = requests.post(
+            f"{BASE}/upload/sessions/",
+            json={"filename": os.path.basename(self.path), "size": self.size, "chunk_size": self.chunk_size},
+            headers=auth_headers(),
+            timeout=20,
+        )
+        if r.status_code != 201:
+            raise Exception(f"Upload error: {r.status_code} {r.text}")
+        session = r.json()
+        with open(self.state_path, "w") as f:
+            json.dump({"id": session["id"], "fingerprint": self._fingerprint}, f)
+        return session
+
+    def _put_chunk(self, session_id, index):
+        offset = index * self.chunk_size
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            body = f.read(self.chunk_size)
+        headers = dict(auth_headers(), **{"X-Chunk-SHA256": hashlib.sha256(body).hexdigest()})
+        for attempt in range(self.retries + 1):
+            try:
+                r = requests.put(
+                    f"{BASE}/upload/sessions/{session_id}/",
+                    params={"offset": offset},
+                    data=body,
+                    headers=headers,
+                    timeout=(10, 120),
+                )
+                if r.status_code == 200:
+                    return
+                if r.status_code < 500:
+                    raise Exception(f"Chunk {index} rejected: {r.status_code} {r.text}")
+            except requests.RequestException:
+                if attempt == self.retries:
+                    raise
+            if attempt < self.retries:
+                time.sleep(min(30, 2 ** attempt))
+        raise Exception(f"Chunk {index} failed after {self.retries} retries")
+
+    def upload(self, wait=True, progress=None):
+        """Send every missing chunk, then finalize; `progress(done, total)`
+        is called after each chunk."""
+        session = self._load_session() or self._new_session()
+        missing = session["missing"]
+        total = -(-self.size // self.chunk_size)
+        done = total - len(missing)
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = [pool.submit(self._put_chunk, session["id"], i) for i in missing]
+            for fut in as_completed(futures):
+                fut.result()
+                done += 1
+                if progress:
+                    progress(done, total)
+
+        r = requests.post(f"{BASE}/upload/sessions/{session['id']}/finalize/", headers=auth_headers(), timeout=300)
+        if r.status_code not in (201, 202):
+            raise Exception(f"Upload error: {r.status_code} {r.text}")
+        os.remove(self.state_path)
+        data = r.json()
+        if wait and r.status_code == 202:
+            return wait_for_job(data["job_id"])
+        return data
+
+def upload_csv(path, wait=True, compress=False):
+    if not compress and os.path.getsize(path) >= RESUMABLE_THRESHOLD:
+        return ResumableUploader(path).upload(wait=wait)
+
+    # the server detects gzip by its magic bytes, so the name stays as is
+    f = gzip_to_temp(path) if compress else open(path, "rb")
+    with f:
+        files = {"file": (os.path.basename(path), f)}
+        r = post_when_admitted(f"{BASE}/upload/", lambda: f.seek(0), files=files, timeout=60)
+
+    if r.status_code not in (200, 201, 202):
         raise Exception(f"Upload error: {r.status_code} {r.text}")
-    return r.json()
+    data = r.json()
+    if wait and r.status_code == 202:
+        return wait_for_job(data["job_id"])
+    return data
+
+def upload_batch(paths):
+    """Send several CSVs (or zips of them) in one request; returns the
+    per-file results."""
+    handles = [open(p, "rb") for p in paths]
+    try:
+        files = [("files", (os.path.basename(p), f)) for p, f in zip(paths, handles)]
+        r = post_when_admitted(
+            f"{BASE}/upload/batch/", lambda: [f.seek(0) for f in handles], files=files, timeout=600
+        )
+    finally:
+        for f in handles:
+            f.close()
+    if r.status_code not in (201, 400) or "results" not in r.json():
+        raise Exception(f"Upload error: {r.status_code} {r.text}")
+    return r.json()["results"]
@@ -2,7 +2,8 @@ import sys
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QGridLayout, QHBoxLayout,
     QPushButton, QLabel, QFileDialog, QTableWidget, QTableWidgetItem,
-    QFrame, QMessageBox, QTabWidget, QSizePolicy, QGraphicsOpacityEffect
+    QFrame, QMessageBox, QTabWidget, QSizePolicy, QGraphicsOpacityEffect,
+    QCheckBox
 )
 from PyQt5.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, pyqtProperty
 from PyQt5.QtWidgets import QDialog, QLineEdit
@@ -10,7 +11,7 @@ from PyQt5.QtGui import QFont
 from api_client import login, download_report
 import os
 import webbrowser
-from api_client import upload_csv, get_history
+from api_client import upload_batch, upload_csv, get_history
 from charts import MplCanvas
 
 
@@ -390,12 +391,15 @@ class Dashboard(QWidget):
         self.choose_btn.setObjectName("Secondary")
 
         self.upload_btn = QPushButton("Upload CSV")
+        self.compress_box = QCheckBox("Compress")
+        self.compress_box.setToolTip("Gzip the file before sending (faster on slow links)")
         
         self.report_btn = QPushButton("Download Report")
         header.addWidget(self.report_btn)
         self.report_btn.clicked.connect(self.download_report_file)
 
         header.addWidget(self.choose_btn)
+        header.addWidget(self.compress_box)
         header.addWidget(self.upload_btn)
 
         root.addLayout(header)
@@ -600,10 +604,15 @@ class Dashboard(QWidget):
         self.status.style().polish(self.status)
 
     def pick_file(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Select CSV", "", "CSV Files (*.csv)")
-        if path:
-            self.file_path = path
-            self.set_status(f"Selected: {os.path.basename(path)}", ok=True)
+        paths, _ = QFileDialog.getOpenFileNames(
+            self, "Select CSV", "", "CSV Files (*.csv *.csv.gz *.csv.bz2 *.csv.xz *.csv.zst *.zip)"
+        )
+        if len(paths) == 1 and not paths[0].lower().endswith(".zip"):
+            self.file_path = paths[0]
+            self.set_status(f"Selected: {os.path.basename(paths[0])}", ok=True)
+        elif paths:
+            self.file_path = paths
+            self.set_status(f"Selected: {len(paths)} files", ok=True)
 
     def do_upload(self):
         if not self.file_path:
@@ -616,10 +625,19 @@ class Dashboard(QWidget):
             self.upload_btn.setText("Uploading...")
             self.set_status("Uploading...", ok=True)
 
-            upload_csv(self.file_path)
+            if isinstance(self.file_path, list):
+                results = upload_batch(self.file_path)
+                failed = [r["filename"] for r in results if "errors" in r]
+                if failed:
+                    msg = f"Uploaded {len(results) - len(failed)} of {len(results)}; failed: {', '.join(failed)}"
+                    self.set_status(msg, ok=False)
+                else:
+                    self.set_status(f"Uploaded {len(results)} files ✓", ok=True)
+            else:
+                upload_csv(self.file_path, compress=self.compress_box.isChecked())
+                self.set_status("Uploaded successfully ✓", ok=True)
             self.file_path = None
 
-            self.set_status("Uploaded successfully ✓", ok=True)
             self.load_data()
 
         except Exception as e:
@@ -208,7 +208,7 @@ export default function App() {
             id="fileInput"
             className="inputFile"
             type="file"
-            accept=".csv"
+            accept=".csv,.gz,.bz2,.xz,.zst"
             onChange={(e) => setFile(e.target.files[0])}
           />
 
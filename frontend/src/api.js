@@ -40,9 +40,24 @@ export async function uploadCSV(file) {
   const res = await api.post("/upload/", fd, {
     headers: { "Content-Type": "multipart/form-data" },
   });
+  if (res.status === 202) return waitForJob(res.data.job_id);
   return res.data;
 }
 
+export async function getJob(jobId) {
+  const res = await api.get(`/jobs/${jobId}/`);
+  return res.data;
+}
+
+export async function waitForJob(jobId, pollMs = 1000) {
+  for (;;) {
+    const job = await getJob(jobId);
+    if (job.status === "done") return job;
+    if (job.status === "failed") throw new Error(job.error || "Upload failed");
+    await new Promise((r) => setTimeout(r, pollMs));
+  }
+}
+
 function authHeaders() {
   const token = localStorage.getItem("access_token"); 
   return token ? { Authorization: `Bearer ${token}` } : {};